@@ -0,0 +1,327 @@
+"""
+Times building, drawing, scrolling and zooming synthetic graphs without a window, so changes can be
+compared for speed between commits
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tracemalloc
+import typing as tp
+import numpy as np
+import pygame
+
+from export import init_headless
+from formation import FormationManager
+from spec import ArrowDraw
+from translator import ModelToViewTranslator
+import config as cfg
+
+_COLOURS = ["green", "red", "blue", "orange", "purple", "teal"]
+
+class SyntheticGraph:
+    """
+    The columns of a graph to add to a FormationManager; generating them isn't part of what gets timed.
+    Links in dual get added one by one as DUAL_LINKs, the rest in bulk.
+    """
+    def __init__(self, name: str, positions: np.array, from_ids: np.array, to_ids: np.array, \
+                 multiboxes: tp.Optional[np.array]=None, dual: tp.Optional[np.array]=None):
+        self.name = name
+        self.positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        self.from_ids = np.asarray(from_ids, dtype=np.int64)
+        self.to_ids = np.asarray(to_ids, dtype=np.int64)
+        self.multiboxes = np.zeros(len(self.positions), dtype=bool) if multiboxes is None else multiboxes
+        self.dual = np.zeros(len(self.from_ids), dtype=bool) if dual is None else dual
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.positions)
+
+    @property
+    def num_links(self) -> int:
+        return len(self.from_ids)
+
+    def build(self) -> FormationManager:
+        mgr = FormationManager()
+        num_nodes = self.num_nodes
+        mgr.add_nodes(["n{}".format(index) for index in range(num_nodes)], self.positions,
+                      [_COLOURS[index % len(_COLOURS)] for index in range(num_nodes)], self.multiboxes.tolist())
+
+        single = ~self.dual
+        num_single = int(np.count_nonzero(single))
+        mgr.add_links(self.from_ids[single], self.to_ids[single], ["black"] * num_single,
+                      [ArrowDraw.FWD_ARROW] * num_single)
+        for from_id, to_id in zip(self.from_ids[self.dual].tolist(), self.to_ids[self.dual].tolist()):
+            mgr.add_dual_link(from_id, to_id, "blue", "red")
+        return mgr
+
+def _on_grid(num_nodes: int, columns: int, spacing: int) -> np.array:
+    indices = np.arange(num_nodes)
+    return np.stack([indices % columns, indices // columns], axis=1) * spacing + spacing // 2
+
+def chain(num_nodes: int, spacing: int=cfg.import_spacing) -> SyntheticGraph:
+    """
+    A path snaking across the plane, so it stays roughly square however long it gets.
+    """
+    columns = max(1, int(np.ceil(np.sqrt(num_nodes))))
+    positions = _on_grid(num_nodes, columns, spacing)
+    rows = np.arange(num_nodes) // columns
+    # Every other row runs backwards, so each link joins neighbours
+    odd = rows % 2 == 1
+    positions[odd, 0] = (columns - 1) * spacing - positions[odd, 0] + spacing
+    return SyntheticGraph("chain", positions, np.arange(num_nodes - 1), np.arange(1, num_nodes))
+
+def grid(num_nodes: int, spacing: int=cfg.import_spacing) -> SyntheticGraph:
+    """
+    Each node linked to the ones to its right and below.
+    """
+    columns = max(1, int(np.ceil(np.sqrt(num_nodes))))
+    indices = np.arange(num_nodes)
+    right = indices[(indices % columns != columns - 1) & (indices + 1 < num_nodes)]
+    down = indices[indices + columns < num_nodes]
+    return SyntheticGraph("grid", _on_grid(num_nodes, columns, spacing),
+                          np.concatenate((right, down)), np.concatenate((right + 1, down + columns)))
+
+def tree(num_nodes: int, branching: int=3, spacing: int=cfg.import_spacing) -> SyntheticGraph:
+    """
+    A complete tree, each depth one row with its nodes spread evenly across the widest row.
+    The root is near the top left corner, where the canvas starts out showing.
+    """
+    indices = np.arange(num_nodes)
+    depths = np.zeros(num_nodes, dtype=np.int64)
+    firsts = [0]
+    while firsts[-1] < num_nodes:
+        firsts.append(firsts[-1] * branching + 1)
+        depths[firsts[-1]:] += 1
+    firsts = np.array(firsts[:-1])
+
+    row_widths = np.minimum(branching ** np.arange(len(firsts)), num_nodes - firsts)
+    widest = row_widths.max()
+    in_row = indices - firsts[depths]
+    positions = np.stack([(in_row + 0.5) * widest / row_widths[depths], depths], axis=1) * spacing
+    positions += spacing // 2 - positions[0]
+    children = indices[1:]
+    return SyntheticGraph("tree", positions, (children - 1) // branching, children)
+
+def scale_free(num_nodes: int, links_per_node: int=2, seed: int=0, spacing: int=cfg.import_spacing) -> SyntheticGraph:
+    """
+    Barabasi-Albert preferential attachment: each new node links to links_per_node earlier ones,
+    picked in proportion to how many links they already have. Nodes are scattered at random.
+    """
+    rng = np.random.default_rng(seed)
+    from_ids = []
+    to_ids = []
+    # Every link end so far, so a uniform pick from it is a pick by degree
+    ends = list(range(min(links_per_node, num_nodes)))
+    for node in range(links_per_node, num_nodes):
+        targets = set()
+        while len(targets) < links_per_node:
+            targets.add(ends[rng.integers(len(ends))])
+        for target in targets:
+            from_ids.append(node)
+            to_ids.append(target)
+            ends.append(target)
+        ends.extend([node] * links_per_node)
+
+    side = np.sqrt(num_nodes) * spacing
+    positions = rng.uniform(0, side, (num_nodes, 2)) + spacing // 2
+    return SyntheticGraph("scale_free", positions, from_ids, to_ids)
+
+def cliques(num_nodes: int, clique_size: int=12, spacing: int=cfg.import_spacing) -> SyntheticGraph:
+    """
+    Groups of clique_size nodes with every pair linked, on a circle each. One link in four is a
+    DUAL_LINK and the first node of every clique is a multibox.
+    """
+    num_cliques = max(1, int(np.ceil(num_nodes / clique_size)))
+    columns = max(1, int(np.ceil(np.sqrt(num_cliques))))
+    radius = spacing * clique_size / (2 * np.pi)
+    indices = np.arange(num_nodes)
+    groups = indices // clique_size
+    angles = 2 * np.pi * (indices % clique_size) / clique_size
+    centres = _on_grid(num_cliques, columns, int(3 * radius))[groups] - int(3 * radius) // 2 + radius + spacing // 2
+    positions = centres + radius * np.stack([np.cos(angles), np.sin(angles)], axis=1)
+
+    lows, highs = np.triu_indices(clique_size, 1)
+    from_ids = (groups[::clique_size][:, np.newaxis] * clique_size + lows).reshape(-1)
+    to_ids = (groups[::clique_size][:, np.newaxis] * clique_size + highs).reshape(-1)
+    inside = to_ids < num_nodes
+    from_ids = from_ids[inside]
+    to_ids = to_ids[inside]
+    return SyntheticGraph("cliques", positions, from_ids, to_ids,
+                          multiboxes=indices % clique_size == 0, dual=np.arange(len(from_ids)) % 4 == 0)
+
+GENERATORS = {
+    "chain": chain,
+    "grid": grid,
+    "tree": tree,
+    "scale_free": scale_free,
+    "cliques": cliques,
+}
+
+def _seconds(func: tp.Callable) -> tp.Tuple[float, tp.Any]:
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+def _summary(times: tp.List[float]) -> tp.Dict[str, float]:
+    """
+    Milliseconds, as the median and worst of times.
+    """
+    if not times:
+        return {"median_ms": None, "max_ms": None, "count": 0}
+    return {"median_ms": 1000 * float(np.median(times)), "max_ms": 1000 * max(times), "count": len(times)}
+
+def _peak_bytes(func: tp.Callable) -> int:
+    """
+    The most memory func had allocated at once through Python, NumPy arrays included.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_case(graph: SyntheticGraph, steps: int=8, memory: bool=True) -> tp.Dict[str, tp.Any]:
+    """
+    Builds graph and shows it on a Canvas, then scrolls right steps times and zooms all the way out and
+    back in, refreshing the display after every one as the main loop would. Tiles aren't prefetched in
+    between, so every step pays for whatever it brings on screen.
+    """
+    from canvas import Canvas
+
+    result = {"graph": graph.name, "nodes": graph.num_nodes, "links": graph.num_links}
+    result["build_s"], mgr = _seconds(graph.build)
+    result["translator_init_s"], _ = _seconds(lambda: ModelToViewTranslator(mgr.nodes, mgr.links, mgr.labels,
+                                                                            cfg.screen_size))
+    result["canvas_init_s"], canvas = _seconds(lambda: Canvas(mgr.nodes, mgr.links, mgr.labels))
+
+    def refresh():
+        canvas.refresh_display()
+        canvas.present()
+
+    def step(move: tp.Callable[[], bool]) -> bool:
+        moved = move()
+        if moved:
+            refresh()
+        return moved
+
+    canvas.tiles.clear()
+    result["refresh_cold_s"], _ = _seconds(refresh)
+    result["refresh_warm_s"], _ = _seconds(refresh)
+
+    scrolls = []
+    for _ in range(steps):
+        seconds, moved = _seconds(lambda: step(canvas.translator.scroll_right))
+        if moved:
+            scrolls.append(seconds)
+    result["scroll"] = _summary(scrolls)
+
+    zooms = []
+    for zoom in [canvas.translator.zoom_out] * canvas.translator.max_zoom_level \
+              + [canvas.translator.zoom_in] * canvas.translator.max_zoom_level:
+        seconds, moved = _seconds(lambda: step(zoom))
+        if moved:
+            zooms.append(seconds)
+    result["zoom"] = _summary(zooms)
+    result["max_zoom_level"] = canvas.translator.max_zoom_level
+
+    if memory:
+        # Separately, since tracing allocations slows everything it watches down
+        del canvas, mgr
+        def build_and_show():
+            built = graph.build()
+            ModelToViewTranslator(built.nodes, built.links, built.labels, cfg.screen_size) \
+                ._draw_labels_links_then_nodes(pygame.Surface(cfg.screen_size).convert())
+        result["peak_bytes"] = _peak_bytes(build_and_show)
+    return result
+
+def _commit() -> tp.Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(generators: tp.List[str], sizes: tp.List[int], steps: int=8, memory: bool=True) \
+        -> tp.Iterator[tp.Dict[str, tp.Any]]:
+    """
+    One result per generator and size, each tagged with the commit and versions it was measured on.
+    """
+    init_headless()
+    environment = {"commit": _commit(), "python": platform.python_version(), "numpy": np.__version__,
+                   "pygame": pygame.version.ver}
+    for name in generators:
+        for size in sizes:
+            result = run_case(GENERATORS[name](size), steps, memory)
+            result.update(environment)
+            yield result
+
+def _key(result: tp.Dict[str, tp.Any]) -> tp.Tuple[str, int]:
+    return result["graph"], result["nodes"]
+
+def _timings(result: tp.Dict[str, tp.Any]) -> tp.Dict[str, float]:
+    """
+    Every metric of result as one number, lower being better.
+    """
+    timings = {name: value for name, value in result.items() if name.endswith(("_s", "_bytes"))}
+    for name in ("scroll", "zoom"):
+        if result[name]["median_ms"] is not None:
+            timings[name + "_median_ms"] = result[name]["median_ms"]
+    return timings
+
+def compare(baseline: tp.List[tp.Dict[str, tp.Any]], results: tp.List[tp.Dict[str, tp.Any]], \
+            threshold: float=1.1) -> tp.List[str]:
+    """
+    The metrics in results that are over threshold times their baseline, as lines for a report.
+    """
+    baseline = {_key(result): _timings(result) for result in baseline}
+    regressions = []
+    for result in results:
+        before = baseline.get(_key(result))
+        if before is None:
+            continue
+        for name, value in _timings(result).items():
+            if before.get(name) and value > threshold * before[name]:
+                regressions.append("{} {} {}: {:.4g} -> {:.4g} ({:.2f}x)".format(
+                    result["graph"], result["nodes"], name, before[name], value, value / before[name]))
+    return regressions
+
+def _read_results(path: str) -> tp.List[tp.Dict[str, tp.Any]]:
+    with open(path) as results_file:
+        return [json.loads(line) for line in results_file if line.strip()]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the canvas on synthetic graphs, "
+                                                 "writing one JSON object per graph and size")
+    parser.add_argument("--graphs", default=",".join(GENERATORS), help="comma separated, from: " + ", ".join(GENERATORS))
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma separated node counts")
+    parser.add_argument("--steps", type=int, default=8, help="scroll steps to time")
+    parser.add_argument("--no-memory", action="store_true", help="skip measuring peak memory")
+    parser.add_argument("--out", default=None, help="JSON lines file to write, instead of stdout")
+    parser.add_argument("--baseline", default=None, help="earlier --out file to report regressions against")
+    parser.add_argument("--threshold", type=float, default=1.1, help="slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    out_file = sys.stdout if args.out is None else open(args.out, 'w')
+    results = []
+    for result in run(args.graphs.split(','), [int(size) for size in args.sizes.split(',')], args.steps,
+                      not args.no_memory):
+        results.append(result)
+        out_file.write(json.dumps(result) + "\n")
+        out_file.flush()
+    if args.out is not None:
+        out_file.close()
+
+    if args.baseline is not None:
+        regressions = compare(_read_results(args.baseline), results, args.threshold)
+        for line in regressions:
+            print(line, file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+    sys.exit(0)
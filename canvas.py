@@ -1,14 +1,33 @@
 import pygame
 from pygame.locals import *
 import typing as tp
+import time
+import cProfile
+from functools import partial
 from datetime import datetime
 
+import numpy as np
+
 from translator import ModelToViewTranslator
+from render import text_sizes_of
+from tiles import TileCache
+from export import BackgroundWriter, WholeGraphExport
+from profiler import FrameStats
 import model
 import config as cfg
 
+# Posted from a loading thread when more of the graph has arrived
+GRAPH_ARRIVED = pygame.USEREVENT + 1
+
 class Canvas:
-    def __init__(self, nodes: tp.List[model.Node], links: tp.List[model.Link], labels: tp.List[model.Label]):
+    def __init__(self, nodes: model.NodeStore, links: model.LinkStore, labels: model.LabelStore, \
+                 source: tp.Optional['gremlin.BackgroundLoad']=None, text_sizes: tp.Optional['np.array']=None, \
+                 label_text_sizes: tp.Optional['np.array']=None):
+        """
+        If source is given, the stores keep growing while the canvas is shown:
+        see gremlin.BackgroundLoad. text_sizes and label_text_sizes are the node and label texts
+        measured already, see snapshot.load().
+        """
         self.fps = 30
         self.screen_size = cfg.screen_size
 
@@ -23,61 +42,305 @@ class Canvas:
         self.default_background = pygame.Surface(self.display_surf.get_size()).convert()
         self.default_background.fill((255, 255, 255))
 
-        self.translator = ModelToViewTranslator(nodes, links, labels, self.screen_size)
+        # The rendered graph without any overlays, so damaged regions can be repainted from it
+        self.scene_surf = pygame.Surface(self.display_surf.get_size()).convert()
+        self._overlay_rects = []
+        self._dirty_rects = []
+
+        # Scroll/zoom keys repeat while held; the loop only runs at fps while one of them is down
+        self.continuous_keys = {K_DOWN, K_s, K_UP, K_w, K_LEFT, K_a, K_RIGHT, K_d, \
+                                K_PAGEUP, K_q, K_PAGEDOWN, K_e}
+        self._held_keys = set()
+        pygame.key.set_repeat(cfg.key_repeat_delay, cfg.key_repeat_interval)
+
+        # Frame timings, shown over the scene with F3; F5 profiles the next cfg.profile_frames frames
+        self.stats = FrameStats(cfg.stats_window)
+        self._show_stats = False
+        self._stats_rects = []
+        self._profile = None
+        self._profile_frames = 0
+        self._profile_frames_left = 0
+
+        # Screenshots (Ctrl+S) are written on a thread of their own; exporting the whole graph (Ctrl+E)
+        # draws a band of it every frame until it is done
+        self.writer = BackgroundWriter(on_error=lambda e: print("Couldn't save an image: {}".format(e)))
+        self._export = None
+
+        self._nodes = nodes
+        self._links = links
+        self._labels = labels
+        self.translator = ModelToViewTranslator(nodes, links, labels, self.screen_size, stats=self.stats,
+                                                text_sizes=text_sizes, label_text_sizes=label_text_sizes)
+        self.tiles = self._tile_cache_for(self.translator)
+        self.stats.watch("text_hits", lambda: self.translator.text_cache.hits)
+        self.stats.watch("text_misses", lambda: self.translator.text_cache.misses)
+
+        self._source = source
+        self._rebuild_after = 0.0 # time.perf_counter() before which arrivals wait, see _take_arrivals()
+        self._num_links_shown = len(links)
+        if source is not None:
+            source.notify = lambda: pygame.event.post(pygame.event.Event(GRAPH_ARRIVED))
+            # Anything that arrived before notify was set
+            source.notify()
+
         self.refresh_display()
 
+    def _take_arrivals(self) -> bool:
+        """
+        Rebuilds the translator if more of the graph has arrived, keeping the scroll/zoom. Only the new
+        node texts get measured. Rebuilding takes longer the bigger the graph, so arrivals that come
+        sooner than cfg.gremlin_rebuild_backoff times the last rebuild after it wait for a timer.
+        If the load has failed, says so and keeps showing whatever did arrive.
+        """
+        now = time.perf_counter()
+        if now < self._rebuild_after:
+            pygame.time.set_timer(GRAPH_ARRIVED, max(1, int(1000 * (self._rebuild_after - now))), loops=1)
+            return False
+
+        num_links_shown = self._num_links_shown
+        try:
+            self._source.poll()
+        except Exception as e:
+            print("Stopped loading the graph: {}".format(e))
+            self._source = None
+        num_shown = len(self.translator.node_text_sizes)
+        if len(self._nodes) == num_shown and len(self._links) == num_links_shown:
+            return False
+
+        start = time.perf_counter()
+        new_texts = [self._nodes.texts[index] for index in range(num_shown, len(self._nodes))]
+        text_sizes = np.concatenate((self.translator.node_text_sizes,
+                                     text_sizes_of(new_texts, self.translator.text_cache)))
+        # Loads only ever add nodes and links
+        label_text_sizes = self.translator.label_text_sizes \
+                           if len(self.translator.label_text_sizes) == len(self._labels) else None
+        self.translator = ModelToViewTranslator(self._nodes, self._links, self._labels, self.screen_size,
+                                                transform=self.translator.transform,
+                                                text_cache=self.translator.text_cache,
+                                                stats=self.stats, text_sizes=text_sizes,
+                                                label_text_sizes=label_text_sizes)
+        self.tiles = self._tile_cache_for(self.translator)
+        self._num_links_shown = len(self._links)
+        self._rebuild_after = time.perf_counter() + cfg.gremlin_rebuild_backoff * (time.perf_counter() - start)
+        return True
+
+    def _tile_cache_for(self, translator: ModelToViewTranslator) -> TileCache:
+        return TileCache(translator.draw_tiles, cfg.tile_size, cfg.tile_cache_budget,
+                         background=self.default_background.get_at((0, 0))[:3])
+
     def refresh_display(self):
-        self.display_surf.blit(self.default_background, (0, 0))
-        self.translator._draw_labels_links_then_nodes(self.display_surf)
+        """
+        Scrolling only blits tiles that are already drawn, apart from the first time a part of the graph is shown,
+        and only over the strips of the scene that the scroll uncovers.
+        """
+        with self.stats.phase("tiles"):
+            self.tiles.blit_view(self.scene_surf, self.translator.transform)
+        with self.stats.phase("display"):
+            self.display_surf.blit(self.scene_surf, (0, 0))
+        self._overlay_rects = []
+        self._stats_rects = []
+        self._dirty_rects = [self.display_surf.get_rect()]
+
+    def clear_overlays(self):
+        """
+        Repaints the regions under coordinates, timestamps etc. from the scene.
+        """
+        for rect in self._overlay_rects:
+            self.display_surf.blit(self.scene_surf, rect, rect)
+        self._dirty_rects.extend(self._overlay_rects)
+        self._overlay_rects = []
+
+    def add_overlay(self, rects: tp.List[pygame.Rect]):
+        """
+        Records regions drawn over the scene so they get presented now and repainted later.
+        """
+        self._overlay_rects.extend(rects)
+        self._dirty_rects.extend(rects)
+
+    def present(self):
+        if self._dirty_rects:
+            with self.stats.phase("display"):
+                pygame.display.update(self._dirty_rects)
+            self._dirty_rects = []
+
+    def _draw_stats(self):
+        """
+        Repaints the stats overlay, or just what it covered if it has been turned off.
+        """
+        for rect in self._stats_rects:
+            self.display_surf.blit(self.scene_surf, rect, rect)
+        self._dirty_rects.extend(self._stats_rects)
+        self._stats_rects = []
+
+        if self._show_stats:
+            self._stats_rects = self.translator.add_text_lines(self.display_surf, self.stats.summary_lines())
+            self._dirty_rects.extend(self._stats_rects)
+
+    def start_profile(self, num_frames: int):
+        """
+        Runs cProfile over the next num_frames frames, leaving out the time spent waiting for events,
+        then saves it for pstats or snakeviz.
+        """
+        self._profile = cProfile.Profile()
+        self._profile_frames = num_frames
+        self._profile_frames_left = num_frames
+
+    def _end_frame(self):
+        self.stats.end_frame()
+        if self._profile is None:
+            return
+
+        self._profile_frames_left -= 1
+        if self._profile_frames_left <= 0:
+            now_str = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+            path = "profile-{}.prof".format(now_str)
+            self._profile.dump_stats(path)
+            print("Saved a profile of {} frames to {}".format(self._profile_frames, path))
+            self._profile = None
+
+    def _next_events(self) -> tp.List[pygame.event.Event]:
+        """
+        Blocks until something happens while the screen is static, otherwise paces the loop at fps.
+        Tiles next to the screen get drawn before blocking, so they are ready for the next scroll.
+        """
+        if self.tiles.prefetch(self.translator.transform, self.screen_size) and not self._held_keys:
+            return pygame.event.get()
+
+        if self._held_keys or self._export is not None:
+            self.fps_clock.tick(self.fps)
+            return pygame.event.get()
+
+        events = [pygame.event.wait()]
+        events.extend(pygame.event.get())
+        # Don't let the time spent blocked count against the next frame
+        self.fps_clock.tick()
+        return events
 
     def main_loop(self):
         running = True
+        self.present()
         while running:
-            pygame.display.update()
-            self.fps_clock.tick(self.fps)
+            events = self._next_events()
+            # A frame is the time spent on events, not waiting for them
+            self.stats.start_frame()
+            if self._profile is not None:
+                self._profile.enable()
+            with self.stats.phase("frame"):
+                running = self._handle(events)
+                self.present()
+                self._export_band()
+            if self._profile is not None:
+                self._profile.disable()
+            self._end_frame()
+
+        if self._export is not None:
+            print("Abandoned exporting the whole graph to {}".format(self._export.path))
+            self._export.abandon()
+        self.writer.finish()
+        pygame.quit()
+
+    def export_whole_graph(self, path: str):
+        """
+        Starts drawing the whole graph at the current zoom level into path, see export.WholeGraphExport.
+        """
+        self._export = WholeGraphExport(self.translator, path, self.translator.zoom_out_level, self.writer)
+        print("Exporting the whole graph at {}x{} to {}".format(*self._export.size, path))
+
+    def _export_band(self):
+        # Rather than wait for the writer to catch up
+        if self._export is None or self.writer.busy:
+            return
+
+        with self.stats.phase("export"):
+            self._export.render_band()
+        if self._export.done:
+            # Once everything submitted before it has been written
+            self.writer.submit(partial(print, "Exported the whole graph to {}".format(self._export.path)))
+            self._export = None
+
+    def _handle(self, events: tp.List[pygame.event.Event]) -> bool:
+        """
+        Returns False once it is time to quit.
+        """
+        running = True
+        needs_refresh = False
+        for event in events:
+            #Alt-F4 or Close button on window
+            if (event.type == KEYDOWN and event.key == K_F4 and bool(event.mod & KMOD_ALT)) \
+             or event.type == QUIT:
+                running = False
+
+            if event.type == KEYUP:
+                self._held_keys.discard(event.key)
+
+            if event.type == WINDOWFOCUSLOST:
+                self._held_keys.clear()
+
+            if event.type == GRAPH_ARRIVED and self._source is not None:
+                needs_refresh |= self._take_arrivals()
+
+            # Anything drawn over or saved from the scene must see earlier scrolls/zooms first
+            if needs_refresh and (event.type == MOUSEBUTTONDOWN or \
+                                  (event.type == KEYDOWN and bool(event.mod & KMOD_CTRL))):
+                self.refresh_display()
+                needs_refresh = False
+
+            if event.type == MOUSEBUTTONDOWN and event.button == 1:
+                self.clear_overlays()
+                self.add_overlay(self.translator.draw_coordinates(event.pos, self.display_surf))
 
-            for event in pygame.event.get():
-                #Alt-F4 or Close button on window
-                if (event.type == KEYDOWN and event.key == K_F4 and bool(event.mod & KMOD_ALT)) \
-                 or event.type == QUIT:
-                    running = False
+            # Dragging with the left button held moves the scene along with the mouse
+            if event.type == MOUSEMOTION and event.buttons[0] and event.rel != (0, 0):
+                needs_refresh |= self.translator.scroll_by(event.rel)
 
-                if event.type == MOUSEBUTTONDOWN and event.button == 1:
-                    self.refresh_display()
-                    self.translator.draw_coordinates(event.pos, self.display_surf)
+            if event.type == KEYDOWN:
+                if event.key == K_s and bool(event.mod & KMOD_CTRL):
+                    now_str = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+                    self.writer.save(self.display_surf, "screenshot-{}.png".format(now_str))
+                    continue
 
-                if event.type == KEYDOWN:
-                    if event.key == K_s and bool(event.mod & KMOD_CTRL):
+                if event.key == K_e and bool(event.mod & KMOD_CTRL):
+                    if self._export is None:
                         now_str = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
-                        pygame.image.save(self.display_surf, "screenshot-{}.png".format(now_str))
-                        continue
-
-                    if event.key == K_d and bool(event.mod & KMOD_CTRL):
-                        now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        self.translator.add_timestamp(self.display_surf, now_str)
-                        continue
-
-                    if event.key == K_DOWN or event.key == K_s:
-                        if self.translator.scroll_down():
-                            self.refresh_display()
-
-                    if event.key == K_UP or event.key == K_w:
-                        if self.translator.scroll_up():
-                            self.refresh_display()
-
-                    if event.key == K_LEFT or event.key == K_a:
-                        if self.translator.scroll_left():
-                            self.refresh_display()
-
-                    if event.key == K_RIGHT or event.key == K_d:
-                        if self.translator.scroll_right():
-                            self.refresh_display()
-
-                    if event.key == K_PAGEUP or event.key == K_q:
-                        if self.translator.zoom_out():
-                            self.refresh_display()
-
-                    if event.key == K_PAGEDOWN or event.key == K_e:
-                        if self.translator.zoom_in():
-                            self.refresh_display()
-        pygame.quit()
\ No newline at end of file
+                        self.export_whole_graph("graph-{}.png".format(now_str))
+                    continue
+
+                if event.key == K_d and bool(event.mod & KMOD_CTRL):
+                    now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    self.add_overlay(self.translator.add_timestamp(self.display_surf, now_str))
+                    continue
+
+                if event.key == K_F3:
+                    self._show_stats = not self._show_stats
+                    continue
+
+                if event.key == K_F5 and self._profile is None:
+                    self.start_profile(cfg.profile_frames)
+                    continue
+
+                if event.key in self.continuous_keys:
+                    self._held_keys.add(event.key)
+
+                if event.key == K_DOWN or event.key == K_s:
+                    needs_refresh |= self.translator.scroll_down()
+
+                if event.key == K_UP or event.key == K_w:
+                    needs_refresh |= self.translator.scroll_up()
+
+                if event.key == K_LEFT or event.key == K_a:
+                    needs_refresh |= self.translator.scroll_left()
+
+                if event.key == K_RIGHT or event.key == K_d:
+                    needs_refresh |= self.translator.scroll_right()
+
+                if event.key == K_PAGEUP or event.key == K_q:
+                    needs_refresh |= self.translator.zoom_out()
+
+                if event.key == K_PAGEDOWN or event.key == K_e:
+                    needs_refresh |= self.translator.zoom_in()
+
+        # Several scroll steps that arrive within one frame only cost one redraw
+        if needs_refresh:
+            self.refresh_display()
+        self._draw_stats()
+        return running
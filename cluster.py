@@ -0,0 +1,157 @@
+"""
+Groups nodes into clusters by grid cell for drawing far out, so what gets drawn depends on screen area, not graph size
+"""
+
+import typing as tp
+import numpy as np
+
+from spatial import UniformGrid, BoxGrid
+
+def _dominant(groups: np.array, codes: np.array, num_groups: int) -> np.array:
+    """
+    The most common code in each group, the lowest one on a tie; -1 for groups with no members.
+    """
+    dominant = np.full(num_groups, -1, dtype=np.int64)
+    if len(codes) == 0:
+        return dominant
+
+    num_codes = int(codes.max()) + 1
+    pairs, counts = np.unique(groups.astype(np.int64) * num_codes + codes, return_counts=True)
+    pair_groups = pairs // num_codes
+    pair_codes = pairs % num_codes
+    order = np.lexsort((pair_codes, -counts, pair_groups))
+    firsts = order[np.concatenate(([True], pair_groups[order][1:] != pair_groups[order][:-1]))]
+    dominant[pair_groups[firsts]] = pair_codes[firsts]
+    return dominant
+
+def _cell_keys(cells: np.array) -> np.array:
+    """
+    One int64 per cell, from a row of (x, y) cell coordinates each.
+    """
+    return (cells[:,0] << 32) | (cells[:,1] & 0xffffffff)
+
+class ClusterLevel:
+    """
+    The clusters at one zoom level. Clusters are rows; link rows join two different rows of link_ends
+    and stand for every link between the nodes around them, whichever way they point.
+
+    Centres and the boxes links span are indexed by grids of cell_size model units, so drawing
+    only looks at what is in view.
+    """
+    def __init__(self, centres: np.array, counts: np.array, colour_codes: np.array, link_ends: np.array, \
+                 link_froms: np.array, link_tos: np.array, link_weights: np.array, link_colour_codes: np.array, \
+                 cell_size: int):
+        self.centres = centres # mean model position of all members
+        self.counts = counts # members that get drawn, i.e. have text
+        self.colour_codes = colour_codes # the most common among those
+        self.link_ends = link_ends # mean model positions of the cells links join, see GridClusters
+        self.link_froms = link_froms
+        self.link_tos = link_tos
+        self.link_weights = link_weights # how many links each stands for
+        self.link_colour_codes = link_colour_codes
+
+        starts = link_ends[link_froms]
+        ends = link_ends[link_tos]
+        self.centre_grid = UniformGrid(centres, cell_size)
+        self.link_grid = BoxGrid(np.concatenate((np.minimum(starts, ends), np.maximum(starts, ends)), axis=1), cell_size)
+
+    def __len__(self) -> int:
+        return len(self.centres)
+
+class GridClusters:
+    """
+    Clusters nodes by square cells of the model, cell_size pixels wide at the zoom level they are drawn at.
+    Cells are aligned to the model rather than the screen so clusters don't change while scrolling,
+    and each level's cells are 2x2 of the level below's, so zooming in splits clusters without
+    moving anything between them.
+
+    Links join the cells of their ends' clusters while those are at most link_reach cells apart.
+    Further apart, they join the cells twice the size holding those, and so on until they are near
+    enough, so however long and many the links, each cell has lines to a bounded number of others.
+
+    Levels are worked out the first time they are asked for and kept.
+    """
+    def __init__(self, positions: np.array, drawn: np.array, colour_codes: np.array, \
+                 from_ids: np.array, to_ids: np.array, link_colour_codes: np.array, \
+                 cell_size: int, first_zoom_out_level: int, link_reach: int):
+        """
+        drawn is a mask of the nodes that count towards cluster sizes; the rest still pull
+        cluster centres towards them and have their links drawn.
+
+        The arrays are kept as given, e.g. memory mapped, and nothing is worked out from them
+        until the first level is asked for.
+        """
+        self._positions = np.asarray(positions).reshape(-1, 2)
+        self._drawn = np.asarray(drawn, dtype=bool)
+        self._colour_codes = np.asarray(colour_codes)
+        self._from_ids = np.asarray(from_ids)
+        self._to_ids = np.asarray(to_ids)
+        self._link_colour_codes = np.asarray(link_colour_codes)
+        self._cell_size = cell_size
+        self._first_zoom_out_level = first_zoom_out_level
+        self._link_reach = link_reach
+        self._first_level_cells = None
+        self._levels = {}
+
+    def level(self, zoom_out_level: int) -> ClusterLevel:
+        if zoom_out_level < self._first_zoom_out_level:
+            raise ValueError("Nodes aren't clustered at zoom level {}".format(zoom_out_level))
+        if zoom_out_level not in self._levels:
+            self._levels[zoom_out_level] = self._cluster(zoom_out_level)
+        return self._levels[zoom_out_level]
+
+    def _cluster(self, zoom_out_level: int) -> ClusterLevel:
+        if self._first_level_cells is None:
+            self._first_level_cells = np.floor(np.divide(self._positions, self._cell_size * 2 ** self._first_zoom_out_level,
+                                                         dtype=float)).astype(np.int64)
+        cells = self._first_level_cells >> (zoom_out_level - self._first_zoom_out_level)
+        _, firsts, members = np.unique(_cell_keys(cells), return_index=True, return_inverse=True)
+        members = members.reshape(-1)
+        num_clusters = len(firsts)
+
+        sizes = np.bincount(members, minlength=num_clusters)
+        centres = np.stack([np.bincount(members, weights=self._positions[:,axis], minlength=num_clusters)
+                            for axis in (0, 1)], axis=1) / np.maximum(sizes, 1)[:, np.newaxis]
+        counts = np.bincount(members[self._drawn], minlength=num_clusters)
+        colour_codes = _dominant(members[self._drawn], self._colour_codes[self._drawn], num_clusters)
+
+        from_clusters = members[self._from_ids]
+        to_clusters = members[self._to_ids]
+        between = from_clusters != to_clusters
+        link_ends, from_ends, to_ends = self._link_ends(cells[firsts], sizes, centres,
+                                                        from_clusters[between], to_clusters[between])
+        num_ends = len(link_ends)
+        lows = np.minimum(from_ends, to_ends)
+        highs = np.maximum(from_ends, to_ends)
+        pairs, pair_of_link, weights = np.unique(lows * num_ends + highs, return_inverse=True, return_counts=True)
+        link_colour_codes = _dominant(pair_of_link.reshape(-1), self._link_colour_codes[between], len(pairs))
+
+        return ClusterLevel(centres, counts, colour_codes, link_ends, pairs // num_ends, pairs % num_ends,
+                            weights, link_colour_codes, self._cell_size * 2 ** zoom_out_level)
+
+    def _link_ends(self, cluster_cells: np.array, sizes: np.array, centres: np.array, \
+                   from_clusters: np.array, to_clusters: np.array) -> tp.Tuple[np.array, np.array, np.array]:
+        """
+        The centres of the cells links join, and the rows of those each link goes from and to.
+        A link goes up shift levels of cells, for the smallest shift leaving its ends at most
+        link_reach cells apart; a cell's centre is the mean position of every node in it.
+        """
+        gaps = np.abs(cluster_cells[from_clusters] - cluster_cells[to_clusters]).max(axis=1, initial=0)
+        shifts = np.ceil(np.log2(np.maximum(gaps / self._link_reach, 1.0))).astype(np.int64)
+
+        ends = []
+        num_ends = 0
+        from_ends = np.empty(len(shifts), dtype=np.int64)
+        to_ends = np.empty(len(shifts), dtype=np.int64)
+        for shift in np.unique(shifts).tolist():
+            _, groups = np.unique(_cell_keys(cluster_cells >> shift), return_inverse=True)
+            groups = groups.reshape(-1)
+            num_groups = int(groups.max()) + 1
+            group_sizes = np.bincount(groups, weights=sizes, minlength=num_groups)
+            ends.append(np.stack([np.bincount(groups, weights=centres[:,axis] * sizes, minlength=num_groups)
+                                  for axis in (0, 1)], axis=1) / group_sizes[:, np.newaxis])
+            shifted = shifts == shift
+            from_ends[shifted] = num_ends + groups[from_clusters[shifted]]
+            to_ends[shifted] = num_ends + groups[to_clusters[shifted]]
+            num_ends += num_groups
+        return (np.concatenate(ends) if ends else np.empty((0, 2))), from_ends, to_ends
@@ -1,10 +1,95 @@
 screen_size = (800,600)
 offset_step = (screen_size[0]//4, screen_size[1]//4)
 
+# Milliseconds before a held scroll/zoom key starts repeating, then between repeats
+key_repeat_delay = 300
+key_repeat_interval = 100
+
+# Width and height of each spatial index cell, in model coordinates
+spatial_cell_size = 256
+
+# GraphSON/JSON-lines import: elements added per batch, and the grid imported vertices are laid out on
+import_batch_size = 10000
+import_spacing = 200
+import_grid_columns = 32
+
+# Loading from a Gremlin Server: results per range() page, per streamed response and connections in the pool
+gremlin_page_size = 10000
+gremlin_batch_size = 512
+gremlin_pool_size = 4
+# Seconds between checks while waiting for the first nodes to arrive
+gremlin_poll_interval = 0.05
+# Once the canvas has rebuilt its scene for more of the graph, it waits this many times as long as that took
+# before rebuilding again, so the bigger the graph gets the more arrivals each rebuild takes in
+gremlin_rebuild_backoff = 4
+
+# Force-directed layout: ideal link length, iteration budget, the largest move (as a fraction of the
+# link length) below which it counts as converged and how fast moves are damped. Barnes-Hut treats pairs of
+# cells narrower than theta times their distance as far apart, summing one's push on the other as the first
+# layout_series_terms terms of a power series; the quadtree is at most layout_max_depth levels deep.
+layout_link_length = 200
+layout_max_iterations = 300
+layout_tolerance = 0.01
+layout_cooling = 0.95
+layout_theta = 0.6
+layout_max_depth = 16
+layout_series_terms = 3
+
+# Incremental layout: how many links out from the changed nodes get relaxed, and how far
+# the nodes that were already there move compared to the changed ones
+relayout_hops = 2
+relayout_damping = 0.1
+
+# Layered layout: distance between layers, between nodes within a layer, and barycentre sweeps
+layered_layer_gap = 200
+layered_node_gap = 150
+layered_sweeps = 8
+# Links spanning more layers than this are left out when ordering the layers
+layered_max_span = 16
+
 big_font_size = 24
 small_font_size = 12
 tiny_font_size = 6
 
+# Zoom levels past the three with a font of their own draw nodes as boxes without text, up to this one.
+# Further out nodes are lod_point_size pixel squares and links one pixel lines.
+lod_box_zoom_level = 5
+lod_point_size = 2
+# From cluster_zoom_level out, nodes are drawn grouped by squares cluster_cell_size pixels wide and
+# the links between two groups as one line, up to cluster_max_link_width pixels wide
+cluster_zoom_level = 7
+# Nearer in, down to the first zoom level without text, so are graphs dense enough that some cluster_density_window
+# pixel square would have more than cluster_max_density nodes and links per pixel to draw one by one
+cluster_density_window = 256
+cluster_max_density = 1 / 16
+cluster_cell_size = 48
+# Links between clusters more than this many cells apart join the cells twice the size holding them instead, and so on
+cluster_link_reach = 4
+cluster_max_link_width = 6
+
+# Frames the stats overlay (F3) takes percentiles over, and frames a profile capture (F5) records
+stats_window = 120
+profile_frames = 120
+
+# Bytes of rendered node and label text to keep around before dropping the least recently drawn
+text_cache_budget = 16 * 1024 * 1024
+
+# Render nodes and labels to keep around before dropping the least recently drawn; they are made again as needed
+render_node_cache_size = 50000
+
+# Zoom levels to keep where each link's lines and arrowheads go for, so drawing a tile again doesn't work them out again
+link_geometry_levels = 2
+
+# Pixels left around the graph when exporting it to fit an image
+export_padding = 64
+
+# Bytes of pixels to draw at once when exporting the whole graph, a band of full width rows at a time
+export_band_budget = 64 * 1024 * 1024
+
+# The scene is drawn in squares of tile_size pixels; bytes of them to keep before dropping the least recently shown
+tile_size = 256
+tile_cache_budget = 64 * 1024 * 1024
+
 x_border_size = 20
 y_border_size = 10
 multibox_factor = 4
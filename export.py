@@ -0,0 +1,337 @@
+"""
+Renders graphs to PNG files without a window, e.g. many at a time from a nightly job, and writes
+PNGs on a thread of their own, a band of rows at a time if need be
+"""
+
+import os
+import sys
+import zlib
+import queue
+import struct
+import argparse
+import threading
+import multiprocessing
+import typing as tp
+from functools import partial
+import numpy as np
+import pygame
+
+from formation import FormationManager
+from importer import import_graph
+from translator import ModelToViewTranslator
+from view import ViewTransform
+import config as cfg
+
+def init_headless():
+    """
+    Sets pygame up to draw off screen with SDL's dummy video driver. Safe to call more than once.
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    # Otherwise SDL turns SIGTERM into a quit event, and pool workers never go away
+    os.environ.setdefault("SDL_NO_SIGNAL_HANDLERS", "1")
+    pygame.display.init()
+    pygame.font.init()
+    if pygame.display.get_surface() is None:
+        # Surfaces can only be converted to the display's pixel format once there is one
+        pygame.display.set_mode((1, 1))
+
+def fit_transform(positions: np.array, size: tp.Tuple[int, int], padding: int=cfg.export_padding, \
+                  max_zoom_out_level: int=32) -> ViewTransform:
+    """
+    The least zoomed out transform that shows every position with padding pixels to spare on each side,
+    centred. Positions need padding to cover the boxes drawn around them.
+    """
+    positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+    if len(positions) == 0:
+        return ViewTransform()
+
+    mins = positions.min(axis=0)
+    extent = positions.max(axis=0) - mins
+    zoom_out_level = 0
+    while zoom_out_level < max_zoom_out_level \
+      and np.any(extent / 2 ** zoom_out_level + 2 * padding > np.array(size)):
+        zoom_out_level += 1
+
+    divisor = 2 ** zoom_out_level
+    offset = (np.array(size) * divisor - extent) / 2 - mins
+    return ViewTransform(offset=tuple(int(coord) for coord in np.floor(offset)), zoom_out_level=zoom_out_level)
+
+def render(mgr: FormationManager, size: tp.Tuple[int, int]=cfg.screen_size, \
+           zoom_out_level: tp.Optional[int]=None, offset: tp.Tuple[int, int]=(0, 0)) -> pygame.Surface:
+    """
+    The graph drawn as the canvas would draw it on a screen of size. With zoom_out_level left as None,
+    zoom and offset are chosen to fit the whole graph instead.
+    """
+    init_headless()
+    if zoom_out_level is None:
+        transform = fit_transform(mgr.nodes.positions[mgr.nodes.has_texts], size)
+    else:
+        transform = ViewTransform(offset=offset, zoom_out_level=zoom_out_level)
+
+    translator = ModelToViewTranslator(mgr.nodes, mgr.links, mgr.labels, size, transform=transform)
+    surface = pygame.Surface(size).convert()
+    surface.fill((255, 255, 255))
+    translator._draw_labels_links_then_nodes(surface, crossing_links=True)
+    return surface
+
+def render_png(mgr: FormationManager, path: str, **kwargs) -> str:
+    """
+    render() saved to path; kwargs go to render(). Returns path.
+    """
+    pygame.image.save(render(mgr, **kwargs), path)
+    return path
+
+def _rows_of(surface) -> np.array:
+    """
+    A copy of surface's pixels as (height, width, 3) RGB rows.
+    """
+    width, height = surface.get_size()
+    return np.frombuffer(pygame.image.tobytes(surface, 'RGB'), dtype=np.uint8).reshape(height, width, 3)
+
+class PngStream:
+    """
+    Writes an RGB PNG of size to path a band of rows at a time, top to bottom, so the whole image
+    never has to be held at once. Rows are filtered with PNG's Sub filter, which suits flat colours.
+    """
+    def __init__(self, path: str, size: tp.Tuple[int, int]):
+        self.path = path
+        self._size = size
+        self._rows_left = size[1]
+        self._compressor = zlib.compressobj()
+        self._file = open(path, 'wb')
+        self._file.write(b'\x89PNG\r\n\x1a\n')
+        # 8 bits per channel, RGB, no interlacing
+        self._chunk(b'IHDR', struct.pack(">IIBBBBB", size[0], size[1], 8, 2, 0, 0, 0))
+
+    def _chunk(self, kind: bytes, data: bytes):
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(kind)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+    def write(self, rows: np.array):
+        """
+        Appends rows, (num_rows, width, 3) uint8, below those written so far.
+        """
+        if rows.shape[1:] != (self._size[0], 3) or len(rows) > self._rows_left:
+            raise ValueError("Can't write rows of shape {} to {}: {} of {} rows left" \
+                             .format(rows.shape, self.path, self._rows_left, self._size[1]))
+        flat = np.ascontiguousarray(rows, dtype=np.uint8).reshape(len(rows), -1)
+        filtered = np.empty((len(rows), flat.shape[1] + 1), dtype=np.uint8)
+        filtered[:,0] = 1 # Sub: each byte less the one a pixel to its left
+        filtered[:,1:4] = flat[:,:3]
+        np.subtract(flat[:,3:], flat[:,:-3], out=filtered[:,4:])
+
+        data = self._compressor.compress(filtered.tobytes())
+        if data:
+            self._chunk(b'IDAT', data)
+        self._rows_left -= len(rows)
+
+    def close(self):
+        """
+        Finishes the file; every row must have been written.
+        """
+        if self._rows_left:
+            self.abandon()
+            raise ValueError("{} was {} rows short and has been deleted".format(self.path, self._rows_left))
+        self._chunk(b'IDAT', self._compressor.flush())
+        self._chunk(b'IEND', b'')
+        self._file.close()
+
+    def abandon(self):
+        """
+        Closes and deletes the unfinished file.
+        """
+        self._file.close()
+        os.remove(self.path)
+
+    def __enter__(self) -> 'PngStream':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abandon()
+
+def write_png(rows: np.array, path: str) -> str:
+    """
+    Writes (height, width, 3) RGB rows to path in one go. Returns path.
+    """
+    with PngStream(path, (rows.shape[1], rows.shape[0])) as stream:
+        stream.write(rows)
+    return path
+
+class BackgroundWriter:
+    """
+    Runs writes on a thread of its own, in the order they were submitted, so drawing can carry on
+    meanwhile; zlib lets go of the GIL while it compresses. Once max_queued writes are waiting,
+    submitting another blocks until one is done, which bounds the pixels they hold on to.
+    Errors go to on_error on the writing thread if it is given, otherwise finish() raises the first.
+    """
+    def __init__(self, max_queued: int=4, on_error: tp.Optional[tp.Callable[[Exception], None]]=None):
+        self._jobs = queue.Queue(max_queued)
+        self._on_error = on_error
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            try:
+                job()
+            except Exception as e:
+                if self._on_error is not None:
+                    self._on_error(e)
+                elif self._error is None:
+                    self._error = e
+            finally:
+                self._jobs.task_done()
+
+    @property
+    def busy(self) -> bool:
+        """
+        Whether submitting another write would block.
+        """
+        return self._jobs.full()
+
+    def submit(self, job: tp.Callable[[], tp.Any]):
+        self._jobs.put(job)
+
+    def save(self, surface, path: str):
+        """
+        Writes what surface shows now to path as a PNG. Only copying the pixels happens on this thread.
+        """
+        self.submit(partial(write_png, _rows_of(surface), path))
+
+    def finish(self):
+        """
+        Waits for every write submitted so far, then raises the first error if there was one.
+        """
+        self._jobs.join()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+class WholeGraphExport:
+    """
+    Renders every node of translator's graph, plus padding pixels around them, at zoom_out_level into
+    one PNG at path. It is drawn as tiles spanning the whole width, as few rows high as fit in band_budget
+    bytes, and each one is handed to writer as soon as it is drawn, so only the bands waiting to be
+    written are held. render_band() draws the next one, e.g. once a frame so the canvas keeps responding.
+    """
+    def __init__(self, translator: ModelToViewTranslator, path: str, zoom_out_level: int, writer: BackgroundWriter, \
+                 padding: int=cfg.export_padding, band_budget: int=cfg.export_band_budget):
+        bounds = translator.graph_bounds
+        if bounds is None:
+            raise ValueError("There are no nodes to export")
+
+        divisor = 2 ** zoom_out_level
+        self._origin = (int(np.floor(bounds.min_x / divisor)) - padding, int(np.floor(bounds.min_y / divisor)) - padding)
+        self.size = (int(np.floor(bounds.max_x / divisor)) + 1 + padding - self._origin[0],
+                     int(np.floor(bounds.max_y / divisor)) + 1 + padding - self._origin[1])
+        # Each pixel is drawn on a 32 bit surface, then copied out as 3 bytes to be written
+        band_height = max(1, min(self.size[1], band_budget // (7 * self.size[0])))
+        self._band = pygame.Surface((self.size[0], band_height)).convert()
+        self._rows_done = 0
+
+        self.path = path
+        self._translator = translator
+        self._zoom_out_level = zoom_out_level
+        self._writer = writer
+        self._stream = PngStream(path, self.size)
+
+    @property
+    def done(self) -> bool:
+        return self._rows_done >= self.size[1]
+
+    def render_band(self):
+        height = min(self._band.get_height(), self.size[1] - self._rows_done)
+        band = self._band.subsurface((0, 0, self.size[0], height))
+        band.fill((255, 255, 255))
+        self._translator.draw_tiles([(band, self._zoom_out_level, (self._origin[0], self._origin[1] + self._rows_done))])
+        self._writer.submit(partial(self._stream.write, _rows_of(band)))
+
+        self._rows_done += height
+        if self.done:
+            self._writer.submit(self._stream.close)
+
+    def abandon(self):
+        """
+        Stops drawing; the unfinished file is deleted once whatever was submitted has been written.
+        """
+        self._rows_done = self.size[1]
+        self._writer.submit(self._stream.abandon)
+
+def render_whole_png(mgr: FormationManager, path: str, zoom_out_level: int=0) -> str:
+    """
+    The whole graph at zoom_out_level saved to path, however big that makes it. Returns path.
+    """
+    init_headless()
+    translator = ModelToViewTranslator(mgr.nodes, mgr.links, mgr.labels, cfg.screen_size,
+                                       transform=fit_transform(mgr.nodes.positions[mgr.nodes.has_texts],
+                                                               cfg.screen_size))
+    writer = BackgroundWriter()
+    export = WholeGraphExport(translator, path, zoom_out_level, writer)
+    while not export.done:
+        export.render_band()
+    writer.finish()
+    return path
+
+class RenderJob:
+    """
+    One PNG to render in render_many(). graph is a FormationManager or the path of a GraphSON or
+    JSON-lines dump to import; options go to render(), or with whole, to render_whole_png().
+    """
+    def __init__(self, graph: tp.Union[FormationManager, str], path: str, whole: bool=False, **options):
+        self.graph = graph
+        self.path = path
+        self.whole = whole
+        self.options = options
+
+def _run(job: RenderJob) -> str:
+    mgr = import_graph(job.graph) if isinstance(job.graph, str) else job.graph
+    if job.whole:
+        return render_whole_png(mgr, job.path, **job.options)
+    return render_png(mgr, job.path, **job.options)
+
+def render_many(jobs: tp.Iterable[RenderJob], processes: tp.Optional[int]=None) -> tp.List[str]:
+    """
+    Renders every job on a pool of processes, one per CPU by default, and returns the paths written
+    in the order of jobs. Workers are spawned rather than forked so they start without any pygame state.
+    Raises whatever the first failed job raised.
+    """
+    pool = multiprocessing.get_context("spawn").Pool(processes, initializer=init_headless)
+    try:
+        return pool.map(_run, list(jobs), chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+def _size_of(arg: str) -> tp.Tuple[int, int]:
+    width, height = arg.lower().split('x')
+    return int(width), int(height)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render graph dumps to PNG files without a window")
+    parser.add_argument("out_dir")
+    parser.add_argument("dumps", nargs='+', help="GraphSON or JSON-lines files")
+    parser.add_argument("--size", type=_size_of, default=cfg.screen_size, help="WIDTHxHEIGHT")
+    parser.add_argument("--zoom", type=int, default=None, help="zoom out level; fits the whole graph if left out")
+    parser.add_argument("--whole", action='store_true',
+                        help="render the whole graph at --zoom, 0 if left out, in an image as big as that takes")
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.whole:
+        options = {"zoom_out_level": args.zoom or 0}
+    else:
+        options = {"size": args.size, "zoom_out_level": args.zoom}
+    os.makedirs(args.out_dir, exist_ok=True)
+    jobs = [RenderJob(dump, os.path.join(args.out_dir, os.path.splitext(os.path.basename(dump))[0] + ".png"),
+                      whole=args.whole, **options)
+            for dump in args.dumps]
+    for path in render_many(jobs, args.processes):
+        print(path)
+    sys.exit(0)
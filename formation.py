@@ -1,52 +1,72 @@
 import sys
 import os
+import numbers
 
 sys.path.append( os.path.dirname(__file__) )
 
 import numpy as np
 import typing as tp
 import angles
+import layout
+import config as cfg
 
-from model import Node, Link, Label
+from model import NodeStore, LinkStore, LabelStore
 from spec import ArrowDraw, NodeSpec
 
 class FormationManager:
     def __init__(self):
-        self._nodes = {}
-        self._links = []
-        self._labels = []
+        self._nodes = NodeStore() # indexed by node id
+        # Filled in up to _num_indexed nodes whenever id_of() needs it, see _ids_by_text()
+        self._ids_by_text_so_far = {}
+        self._num_indexed = 0
+        self._links = LinkStore()
+        self._labels = LabelStore()
+        # Kept for layout_incremental(), see layout.relax_around(); None after layouts that move everything
+        self._neighbour_index = None
+
+    @classmethod
+    def from_stores(cls, nodes: NodeStore, links: LinkStore, labels: LabelStore) -> 'FormationManager':
+        """
+        A manager over stores that were filled some other way, e.g. loaded from a snapshot.
+        """
+        mgr = cls()
+        mgr._nodes = nodes
+        mgr._links = links
+        mgr._labels = labels
+        return mgr
 
     @property
-    def nodes(self) -> tp.List[Node]:
-        return [n for n in self._nodes.values()]
+    def nodes(self) -> NodeStore:
+        return self._nodes
 
     @property
-    def links(self) -> tp.List[Link]:
+    def links(self) -> LinkStore:
         return self._links
 
     @property
-    def labels(self) -> tp.List[Link]:
+    def labels(self) -> LabelStore:
         return self._labels
 
     def _id_if_str(self, node: tp.Tuple[str, int]) -> int:
-        if isinstance(node, int):
-            return node
+        # NumPy ints too, e.g. the ids add_nodes() returns
+        if isinstance(node, numbers.Integral):
+            return int(node)
         else:
             return self.id_of(node)
 
     def text_of(self, node_id: int) -> str:
-        if not isinstance(node_id, int):
+        if not isinstance(node_id, numbers.Integral):
             raise TypeError("Expected node_id to be int: {}".format(node_id))
 
-        return self._nodes[node_id].text
+        return self._nodes.texts[int(node_id)]
 
     def pos_of(self, node_id: tp.Tuple[str, int]) -> np.array:
         node_id = self._id_if_str(node_id)
-        return np.array(self._nodes[node_id].pos)
+        return self._nodes[node_id].pos
 
     def pos_perp_to(self, from_id: int, to_id: int, shift_breadth: int, to_left: bool) -> np.array:
-        from_vec2 = np.array(self._nodes[from_id].pos)
-        to_vec2 = np.array(self._nodes[to_id].pos)
+        from_vec2 = self._nodes[from_id].pos
+        to_vec2 = self._nodes[to_id].pos
         rel_vec2 = to_vec2 - from_vec2
         flipped_y_unit_rel = angles.flip_y( angles.unit(rel_vec2) )
         if to_left:
@@ -58,14 +78,71 @@ class FormationManager:
 
         return (from_vec2 + rel_vec2 / 2 + rotated_dir * shift_breadth).astype(int)
 
+    def layout_force_directed(self, pinned: tp.Optional[tp.List[tp.Tuple[str, int]]] = None, **kwargs) -> int:
+        """
+        Moves every node apart from those in pinned to where layout.force_directed() puts it,
+        returning the number of iterations it took; kwargs go to that function. Labels stay where they are.
+
+        With nothing pinned, the result keeps the top left corner of the nodes where it was,
+        so a graph that started on screen stays on screen.
+        """
+        positions = self._nodes.positions
+        pinned_mask = np.zeros(len(positions), dtype=bool)
+        pinned_mask[[self._id_if_str(node) for node in pinned or []]] = True
+
+        new_positions, iterations = layout.force_directed(positions, self._links.from_ids, self._links.to_ids, \
+                                                          pinned_mask, **kwargs)
+        if len(positions) and not np.any(pinned_mask):
+            new_positions += positions.min(axis=0) - new_positions.min(axis=0)
+        positions[:] = new_positions
+        self._neighbour_index = None
+        return iterations
+
+    def layout_incremental(self, added: tp.Optional[tp.List[tp.Tuple[str, int]]] = None, \
+                           affected: tp.Optional[tp.List[tp.Tuple[str, int]]] = None, **kwargs) -> int:
+        """
+        Relaxes the layout around nodes just added and nodes affected by a change, e.g. the ones
+        whose links or neighbours went, leaving the rest of the graph where it is; see layout.relax_around(),
+        which kwargs go to. Returns the number of iterations it took.
+
+        What this costs depends on the size of the change rather than of the graph, apart from the
+        first call, and the first after a layout of the whole graph, which index every node and link.
+        """
+        link_length = kwargs.pop('link_length', cfg.layout_link_length)
+        if self._neighbour_index is None or self._neighbour_index.cell_size != link_length:
+            self._neighbour_index = layout.NeighbourIndex(link_length)
+
+        positions = self._nodes.positions
+        ids, new_positions, iterations = layout.relax_around(positions, self._links.from_ids, self._links.to_ids, \
+                                                             [self._id_if_str(node) for node in added or []], \
+                                                             [self._id_if_str(node) for node in affected or []], \
+                                                             link_length=link_length, index=self._neighbour_index, \
+                                                             **kwargs)
+        positions[ids] = new_positions
+        self._neighbour_index.moved(ids)
+        return iterations
+
+    def layout_layered(self, dir: tp.Tuple[int, int] = (0, 1), **kwargs) -> int:
+        """
+        Places every node in layers along dir with layout.layered(), following links from -> to,
+        which is the way their arrows point (BACK_ARROWs were already turned round when added).
+        kwargs go to layout.layered(). Keeps the top left corner of the nodes where it was and
+        returns the number of layers.
+        """
+        positions = self._nodes.positions
+        new_positions, num_layers = layout.layered(len(positions), self._links.from_ids, self._links.to_ids, \
+                                                   dir, **kwargs)
+        if len(positions):
+            new_positions += positions.min(axis=0) - new_positions.min(axis=0)
+            positions[:] = new_positions
+        self._neighbour_index = None
+        return num_layers
+
     def id_of(self, text: str) -> int:
         if not isinstance(text, str):
             raise TypeError("{} should be a string".format(text))
 
-        ans = []
-        for key in self._nodes.keys():
-            if text == self._nodes[key].text:
-                ans.append(key)
+        ans = self._ids_by_text().get(text, [])
 
         if len(ans) == 0:
             raise ValueError("No node has this text: {}".format(text))
@@ -75,17 +152,42 @@ class FormationManager:
             raise ValueError("More than one node has the text {}: {}".format(text, ans))
 
     def add_node(self, text: str, pos: tp.Tuple[int, int], colour: str="green", multibox: bool = False) -> int:
-        new_node = Node(text, pos, colour, multibox)
-        new_id = id(new_node)
-        self._nodes[new_id] = new_node
-        return new_id
+        """
+        Node ids count up from 0 in the order nodes are added.
+        """
+        return self._nodes.append(text, pos, colour, multibox)
+
+    def add_nodes(self, texts: tp.List[str], positions: np.array, colours: tp.List[str], \
+                  multiboxes: tp.Optional[tp.List[bool]] = None) -> np.array:
+        """
+        Bulk add_node(); returns the new ids in order.
+        """
+        return self._nodes.extend(texts, positions, colours, multiboxes)
+
+    def _ids_by_text(self) -> tp.Dict[str, tp.List[int]]:
+        """
+        Node ids by text, brought up to date with the nodes added since it was last asked for.
+        Built on demand since most big graphs are never looked up by text.
+        """
+        texts = self._nodes.texts
+        for node_id in range(self._num_indexed, len(texts)):
+            self._ids_by_text_so_far.setdefault(texts[node_id], []).append(node_id)
+        self._num_indexed = len(texts)
+        return self._ids_by_text_so_far
 
     def add_label(self, text: str, pos: tp.Tuple[int, int], colour: str="red"):
-        self._labels.append( Label(text, pos, colour) )
+        self._labels.append(text, pos, colour)
 
     def add_link(self, from_id: tp.Tuple[str, int], to_id: tp.Tuple[str, int], colour: str="black", \
                  arrow_draw: ArrowDraw = ArrowDraw.FWD_ARROW, link_2_col: tp.Optional[str] = None):
-        self._links.append( Link(self._id_if_str(from_id), self._id_if_str(to_id), colour, arrow_draw, link_2_col) )
+        self._links.append(self._id_if_str(from_id), self._id_if_str(to_id), colour, arrow_draw, link_2_col)
+
+    def add_links(self, from_ids: tp.List[int], to_ids: tp.List[int], colours: tp.List[str], \
+                  arrow_draws: tp.List[ArrowDraw]):
+        """
+        Bulk add_link() for node ids; dual links have to be added one by one.
+        """
+        self._links.extend(from_ids, to_ids, colours, arrow_draws)
 
     def add_dual_link(self, from_id: tp.Tuple[str, int], to_id: tp.Tuple[str, int], colour: str="black", \
                       second_colour: str="black"):
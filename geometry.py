@@ -0,0 +1,230 @@
+"""
+Batched link geometry: where links leave their nodes' boxes and where their arrowheads go
+"""
+
+import typing as tp
+import math
+import numpy as np
+
+import angles
+
+class Boxes:
+    """
+    Axis aligned boxes, one per row. Rows where has_box is False have nothing drawn around the centre,
+    so links run right up to it.
+    """
+    def __init__(self, centers: np.array, half_extents: np.array, has_box: np.array):
+        self.centers = centers
+        self.half_extents = half_extents
+        self.has_box = has_box
+
+    def __getitem__(self, indices: np.array) -> 'Boxes':
+        return Boxes(self.centers[indices], self.half_extents[indices], self.has_box[indices])
+
+def exit_fractions(starts: np.array, ends: np.array, boxes: Boxes) -> np.array:
+    """
+    The fraction along each start->end at which it leaves the box it starts in; 0 where there is no box.
+    Box edges are treated as infinite lines, so starts shifted away from the centre work too.
+    """
+    deltas = ends - starts
+    rows = np.arange(len(starts))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Whichever pair of edges the link reaches first, given the box's proportions
+        exit_x_at = boxes.half_extents[:,0] / np.abs(deltas[:,0])
+        exit_y_at = boxes.half_extents[:,1] / np.abs(deltas[:,1])
+        axis = np.where(exit_y_at <= exit_x_at, 1, 0)
+
+        axis_deltas = deltas[rows, axis]
+        edges = boxes.centers[rows, axis] + np.sign(axis_deltas) * boxes.half_extents[rows, axis]
+        fractions = (edges - starts[rows, axis]) / axis_deltas
+    return np.where(boxes.has_box, fractions, 0.0)
+
+def clip_segments(starts: np.array, ends: np.array, start_boxes: Boxes, end_boxes: Boxes \
+                 ) -> tp.Tuple[np.array, np.array, np.array]:
+    """
+    Returns the part of each start->end that lies outside both its boxes, and a mask of the segments
+    that are hidden entirely because the boxes overlap (or the segment has no length).
+    """
+    deltas = ends - starts
+    from_fractions = exit_fractions(starts, ends, start_boxes)
+    to_fractions = 1 - exit_fractions(ends, starts, end_boxes)
+
+    # Written so that NaN fractions count as hidden
+    hidden = ~(to_fractions >= from_fractions) | ~np.any(deltas, axis=1)
+    visible_from = starts + deltas * from_fractions[:, np.newaxis]
+    visible_to = starts + deltas * to_fractions[:, np.newaxis]
+    return visible_from, visible_to, hidden
+
+def _unit_rows(vectors: np.array) -> np.array:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return vectors / np.linalg.norm(vectors, axis=1)[:, np.newaxis]
+
+def sideways_shifts(froms: np.array, tos: np.array, length: float) -> np.array:
+    """
+    How far to move each from->to to its left, in whole pixels as angles.shift_pair_pos_by() does.
+    The shift to the right is the negation.
+    """
+    units = _unit_rows(tos - froms)
+    return np.trunc(np.stack((-units[:,1], units[:,0]), axis=1) * length)
+
+def _rotated_on_screen(vectors: np.array, rad: float) -> np.array:
+    """
+    Rotates every row anticlockwise as it appears on screen, i.e. with y pointing down.
+    """
+    cos = math.cos(rad)
+    sin = math.sin(rad)
+    return np.stack((vectors[:,0] * cos + vectors[:,1] * sin,
+                     vectors[:,1] * cos - vectors[:,0] * sin), axis=1)
+
+def arrowheads(tips: np.array, directions: np.array, length: float) -> tp.Tuple[np.array, np.array]:
+    """
+    The ends of the two barbs of arrowheads at tips, pointing along directions.
+    """
+    units = _unit_rows(directions)
+    lefts = tips + _rotated_on_screen(units, angles.deg_to_rad(150)) * length
+    rights = tips + _rotated_on_screen(units, angles.deg_to_rad(210)) * length
+    return lefts, rights
+
+class LinkGeometry:
+    """
+    Where to draw a batch of links, worked out for all of them at once.
+
+    Each link is drawn as a line centre to centre with its arrowheads two thirds (and for double
+    arrows, one third) of the way along the part visible between the boxes. A dual link is two lines
+    shifted either side of the centre line; the second one runs backwards so its arrowhead points from
+    the to node to the from node.
+
+    Lines and arrowheads end up in flat arrays. line_links/arrow_links give the row of the batch
+    each one came from and line_second/arrow_second whether it takes the link's second colour.
+    """
+    def __init__(self, boxes: Boxes, from_nodes: np.array, to_nodes: np.array, arrow_counts: np.array, \
+                 is_dual: np.array, dual_link_gap: float, arrowhead_length: float):
+        """
+        boxes holds every node; from_nodes and to_nodes index into it, one row per link.
+        arrow_counts is how many arrowheads each line of a link gets: 0, 1 or 2.
+        """
+        centers = boxes.centers
+        _, _, hidden = clip_segments(centers[from_nodes], centers[to_nodes], boxes[from_nodes], boxes[to_nodes])
+        shown = np.flatnonzero(~hidden)
+        singles = shown[~is_dual[shown]]
+        duals = shown[is_dual[shown]]
+
+        shifts = sideways_shifts(centers[from_nodes[duals]], centers[to_nodes[duals]], dual_link_gap)
+        start_nodes = np.concatenate((from_nodes[singles], from_nodes[duals], to_nodes[duals]))
+        end_nodes = np.concatenate((to_nodes[singles], to_nodes[duals], from_nodes[duals]))
+        shifts = np.concatenate((np.zeros((len(singles), 2)), shifts, -shifts))
+
+        self.line_links = np.concatenate((singles, duals, duals))
+        self.line_second = np.arange(len(self.line_links)) >= len(singles) + len(duals)
+        lane_starts = centers[start_nodes] + shifts
+        lane_ends = centers[end_nodes] + shifts
+        # Lines are still drawn from the from node as wide lines don't come out quite the same reversed
+        reversed_lanes = self.line_second[:, np.newaxis]
+        self.line_starts = np.where(reversed_lanes, lane_ends, lane_starts)
+        self.line_ends = np.where(reversed_lanes, lane_starts, lane_ends)
+
+        visible_from, visible_to, line_hidden = clip_segments(lane_starts, lane_ends, \
+                                                              boxes[start_nodes], boxes[end_nodes])
+        line_arrow_counts = np.where(line_hidden, 0, arrow_counts[self.line_links])
+        visible_rel = visible_to - visible_from
+
+        fwd = np.flatnonzero(line_arrow_counts >= 1)
+        back = np.flatnonzero(line_arrow_counts >= 2)
+        arrow_lines = np.concatenate((fwd, back))
+        self.arrow_links = self.line_links[arrow_lines]
+        self.arrow_second = self.line_second[arrow_lines]
+        self.arrow_tips = np.concatenate((visible_from[fwd] + visible_rel[fwd] * 2 / 3,
+                                          visible_from[back] + visible_rel[back] * 1 / 3))
+        directions = np.concatenate((visible_rel[fwd], -visible_rel[back]))
+        self.arrow_lefts, self.arrow_rights = arrowheads(self.arrow_tips, directions, arrowhead_length)
+
+    def segments(self) -> tp.Tuple[np.array, np.array, np.array, np.array, np.array]:
+        """
+        Every line and arrowhead barb as (starts, ends, links, second, is_barb), barbs first.
+        links gives the row of the batch each came from.
+        """
+        tips = self.arrow_tips
+        starts = np.concatenate((np.stack((tips, tips), axis=1).reshape(-1, 2), self.line_starts))
+        ends = np.concatenate((np.stack((self.arrow_lefts, self.arrow_rights), axis=1).reshape(-1, 2), self.line_ends))
+        links = np.concatenate((self.arrow_links.repeat(2), self.line_links))
+        second = np.concatenate((self.arrow_second.repeat(2), self.line_second))
+        is_barb = np.arange(len(starts)) < 2 * len(tips)
+        return starts, ends, links, second, is_barb
+
+class LinkSegmentCache:
+    """
+    LinkGeometry.segments() of links at one zoom level, worked out the first time each link is asked
+    for and kept, grouped by link. Boxes only change size with the zoom level, and scrolling by whole
+    view pixels only shifts everything, so they are kept shifted to offset (0, 0) and shifted back.
+    """
+    def __init__(self):
+        # The links worked out, sorted, and where their segments are, so they take memory for what
+        # was drawn rather than for every link of the graph
+        self._links = np.empty(0, dtype=np.int64)
+        self._firsts = np.empty(0, dtype=np.int64)
+        self._counts = np.empty(0, dtype=np.int64)
+        self._len = 0
+        self._starts = np.empty((16, 2))
+        self._ends = np.empty((16, 2))
+        self._second = np.empty(16, dtype=bool)
+        self._is_barb = np.empty(16, dtype=bool)
+
+    def __len__(self) -> int:
+        """
+        How many segments are kept.
+        """
+        return self._len
+
+    def missing(self, link_indices: np.array) -> np.array:
+        if len(self._links) == 0:
+            return link_indices
+        rows = np.minimum(np.searchsorted(self._links, link_indices), len(self._links) - 1)
+        return link_indices[self._links[rows] != link_indices]
+
+    def add(self, link_indices: np.array, geometry: LinkGeometry, shift: np.array):
+        """
+        Keeps geometry, worked out for link_indices, none of them kept already, in view coordinates that
+        are shift away from offset (0, 0).
+        """
+        starts, ends, rows, second, is_barb = geometry.segments()
+        order = np.argsort(rows, kind='stable')
+        counts = np.bincount(rows, minlength=len(link_indices))
+        links = np.concatenate((self._links, link_indices))
+        by_link = np.argsort(links, kind='stable')
+        self._links = links[by_link]
+        self._firsts = np.concatenate((self._firsts, self._len + np.cumsum(counts) - counts))[by_link]
+        self._counts = np.concatenate((self._counts, counts))[by_link]
+
+        self._reserve(self._len + len(order))
+        added = slice(self._len, self._len + len(order))
+        self._starts[added] = starts[order] - shift
+        self._ends[added] = ends[order] - shift
+        self._second[added] = second[order]
+        self._is_barb[added] = is_barb[order]
+        self._len += len(order)
+
+    def take(self, link_indices: np.array, shift: np.array) -> tp.Tuple[np.array, np.array, np.array, np.array]:
+        """
+        The segments of link_indices, all of which must have been added, as LinkGeometry.segments() would
+        give them at shift from offset (0, 0), without is_barb.
+        """
+        kept = np.searchsorted(self._links, link_indices)
+        counts = self._counts[kept]
+        rows = np.repeat(np.arange(len(link_indices)), counts)
+        segments = np.arange(len(rows)) + np.repeat(self._firsts[kept] - (np.cumsum(counts) - counts), counts)
+        # Barbs first again
+        order = np.argsort(~self._is_barb[segments], kind='stable')
+        segments = segments[order]
+        return self._starts[segments] + shift, self._ends[segments] + shift, rows[order], self._second[segments]
+
+    def _reserve(self, capacity: int):
+        if capacity <= len(self._starts):
+            return
+        new_capacity = len(self._starts)
+        while new_capacity < capacity:
+            new_capacity *= 2
+        for name in ("_starts", "_ends", "_second", "_is_barb"):
+            old = getattr(self, name)
+            grown = np.empty((new_capacity,) + old.shape[1:], dtype=old.dtype)
+            grown[:self._len] = old[:self._len]
+            setattr(self, name, grown)
@@ -0,0 +1,283 @@
+"""
+Loads a graph from a Gremlin Server over WebSockets, a page at a time, without blocking the canvas
+"""
+
+import asyncio
+import json
+import queue
+import threading
+import typing as tp
+import uuid
+import websockets
+
+from importer import GraphImporter, StyleRules, unwrap_graphson
+from formation import FormationManager
+import config as cfg
+
+MIME_TYPE = "application/vnd.gremlin-v3.0+json"
+
+# Gremlin Server response status codes
+SUCCESS = 200
+NO_CONTENT = 204
+PARTIAL_CONTENT = 206
+SERVER_ERROR = 500
+
+def _request_frame(request_id: str, gremlin: str, batch_size: int) -> bytes:
+    """
+    Gremlin Server expects the mime type, prefixed by its length, in front of the JSON request.
+    """
+    mime_type = MIME_TYPE.encode()
+    message = {
+        "requestId": request_id,
+        "op": "eval",
+        "processor": "",
+        "args": {"gremlin": gremlin, "batchSize": batch_size, "language": "gremlin-groovy"}
+    }
+    return bytes([len(mime_type)]) + mime_type + json.dumps(message).encode()
+
+def _parse_request_frame(frame: bytes) -> dict:
+    mime_type_length = frame[0]
+    return json.loads(frame[1+mime_type_length:].decode())
+
+class _Connection:
+    """
+    One WebSocket to the server, with one request in flight at a time.
+    """
+    def __init__(self, websocket, recording: tp.Optional[tp.List[dict]]):
+        self._websocket = websocket
+        self._recording = recording
+
+    async def submit(self, gremlin: str, batch_size: int) -> tp.AsyncIterator[tp.List]:
+        """
+        Yields the results a batch at a time as the server streams them back.
+        Raises RuntimeError if the server reports an error.
+        """
+        request_id = str(uuid.uuid4())
+        await self._websocket.send(_request_frame(request_id, gremlin, batch_size))
+
+        responses = []
+        while True:
+            response = json.loads(await self._websocket.recv())
+            responses.append(response)
+            status = response["status"]
+            if status["code"] == NO_CONTENT:
+                break
+            if status["code"] not in (SUCCESS, PARTIAL_CONTENT):
+                raise RuntimeError("Gremlin Server returned {} for {}: {}" \
+                                   .format(status["code"], gremlin, status.get("message")))
+
+            yield unwrap_graphson(response["result"]["data"]) or []
+            if status["code"] == SUCCESS:
+                break
+
+        if self._recording is not None:
+            self._recording.append({"gremlin": gremlin, "responses": responses})
+
+    async def close(self):
+        await self._websocket.close()
+
+class ConnectionPool:
+    """
+    size connections to url, handed out to one request each at a time. A request that fails gives
+    back None in place of its connection, and whichever request takes that connects again.
+    If recording is a list, every request and its responses get appended to it, see ReplayServer.
+    """
+    def __init__(self, url: str, size: int, recording: tp.Optional[tp.List[dict]]=None):
+        self._url = url
+        self._size = size
+        self._recording = recording
+        self._idle = None
+
+    async def __aenter__(self) -> 'ConnectionPool':
+        self._idle = asyncio.Queue()
+        for _ in range(self._size):
+            self._idle.put_nowait(await self._connect())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        while not self._idle.empty():
+            connection = self._idle.get_nowait()
+            if connection is not None:
+                await connection.close()
+
+    async def _connect(self) -> _Connection:
+        websocket = await websockets.connect(self._url, max_size=None)
+        return _Connection(websocket, self._recording)
+
+    async def stream(self, gremlin: str, batch_size: int, on_batch: tp.Callable[[tp.List], None]):
+        connection = await self._idle.get()
+        try:
+            if connection is None:
+                connection = await self._connect()
+            async for batch in connection.submit(gremlin, batch_size):
+                on_batch(batch)
+        except BaseException:
+            # Whatever the server still had to send for this request would confuse the next one
+            failed, connection = connection, None
+            if failed is not None:
+                await failed.close()
+            raise
+        finally:
+            self._idle.put_nowait(connection)
+
+    async def fetch(self, gremlin: str, batch_size: int) -> tp.List:
+        results = []
+        await self.stream(gremlin, batch_size, results.extend)
+        return results
+
+def _element_of(element_map: dict) -> dict:
+    """
+    Turns an elementMap() result into what GraphImporter.feed_elements() takes.
+    """
+    properties = {key: value for key, value in element_map.items() if key not in ('id', 'label', 'IN', 'OUT')}
+    element = {"id": element_map.get("id"), "label": element_map.get("label"), "properties": properties}
+    if 'IN' in element_map and 'OUT' in element_map:
+        element["outV"] = element_map["OUT"]["id"]
+        element["inV"] = element_map["IN"]["id"]
+    return element
+
+class GraphLoader:
+    """
+    Fetches every vertex, then every edge, of traversal_source as pages of range() traversals spread over
+    a pool of connections. Each page is streamed back batch_size results at a time.
+
+    Paging relies on the graph giving the same order to every V()/E() traversal while loading, which holds
+    for graphs that aren't being written to on most providers.
+    """
+    def __init__(self, url: str, traversal_source: str="g", page_size: int=cfg.gremlin_page_size, \
+                 batch_size: int=cfg.gremlin_batch_size, pool_size: int=cfg.gremlin_pool_size, \
+                 recording: tp.Optional[tp.List[dict]]=None):
+        self._url = url
+        self._traversal_source = traversal_source
+        self._page_size = page_size
+        self._batch_size = batch_size
+        self._pool_size = pool_size
+        self._recording = recording
+
+    async def load(self, on_elements: tp.Callable[[tp.List[dict]], None]):
+        async with ConnectionPool(self._url, self._pool_size, self._recording) as pool:
+            for step in ('V', 'E'):
+                count = (await pool.fetch("{}.{}().count()".format(self._traversal_source, step), 1))[0]
+                pages = [pool.stream(self._page_query(step, start), self._batch_size, \
+                                     lambda batch: on_elements([_element_of(item) for item in batch]))
+                         for start in range(0, count, self._page_size)]
+                await asyncio.gather(*pages)
+
+    def _page_query(self, step: str, start: int) -> str:
+        return "{}.{}().range({}, {}).elementMap()" \
+            .format(self._traversal_source, step, start, start + self._page_size)
+
+class BackgroundLoad:
+    """
+    Runs a GraphLoader on a thread of its own so the canvas can keep drawing while the graph arrives.
+    The thread only queues up elements; they reach the FormationManager when the canvas calls poll().
+    """
+    def __init__(self, loader: GraphLoader, rules: tp.Optional[StyleRules]=None):
+        self._loader = loader
+        self._importer = GraphImporter(rules=rules)
+        self._arrived = queue.Queue()
+        self._done = threading.Event()
+        self._error = None
+        self._notified = threading.Event()
+        self.notify = lambda: None # called on the loading thread when something arrives after a poll()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def mgr(self) -> FormationManager:
+        return self._importer.mgr
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def start(self) -> 'BackgroundLoad':
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            asyncio.run(self._loader.load(self._on_elements))
+        except Exception as e:
+            self._error = e
+        self._done.set()
+        self.notify()
+
+    def _on_elements(self, elements: tp.List[dict]):
+        self._arrived.put(elements)
+        # One notification until the next poll(), however many batches arrive in between
+        if not self._notified.is_set():
+            self._notified.set()
+            self.notify()
+
+    def poll(self) -> bool:
+        """
+        Adds everything that has arrived to the FormationManager; True if anything was added.
+        Raises whatever stopped the load, once it has stopped.
+        """
+        self._notified.clear()
+        num_nodes = len(self.mgr.nodes)
+        num_links = len(self.mgr.links)
+        while True:
+            try:
+                elements = self._arrived.get_nowait()
+            except queue.Empty:
+                break
+            self._importer.feed_elements(elements)
+
+        if self.done and self._arrived.empty():
+            if self._error is not None:
+                # Keeping what did arrive
+                self._importer.flush()
+                raise self._error
+            self._importer.finish()
+        else:
+            self._importer.flush()
+        return len(self.mgr.nodes) != num_nodes or len(self.mgr.links) != num_links
+
+    def wait_for_nodes(self):
+        """
+        Blocks until there is at least one node to show, or the load has finished.
+        """
+        while not self.poll() and not self.done:
+            self._done.wait(cfg.gremlin_poll_interval)
+
+class ReplayServer:
+    """
+    A stand-in Gremlin Server that answers with recorded responses, looked up by the exact gremlin string.
+    recordings are what ConnectionPool appends to its recording list, e.g. as read back from a JSON-lines file.
+    """
+    def __init__(self, recordings: tp.List[dict], host: str="localhost", port: int=8182):
+        self._responses = {recording["gremlin"]: recording["responses"] for recording in recordings}
+        self._host = host
+        self._port = port
+        self._server = None
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> 'ReplayServer':
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls([json.loads(line) for line in f if line.strip()], **kwargs)
+
+    @property
+    def url(self) -> str:
+        return "ws://{}:{}/gremlin".format(self._host, self._port)
+
+    async def __aenter__(self) -> 'ReplayServer':
+        self._server = await websockets.serve(self._handle, self._host, self._port, max_size=None)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, websocket, path: tp.Optional[str]=None):
+        async for frame in websocket:
+            request = _parse_request_frame(frame)
+            gremlin = request["args"]["gremlin"]
+            responses = self._responses.get(gremlin)
+            if responses is None:
+                responses = [{"result": {"data": None, "meta": {}},
+                              "status": {"code": SERVER_ERROR, "message": "No recording for " + gremlin,
+                                         "attributes": {}}}]
+
+            for response in responses:
+                await websocket.send(json.dumps(dict(response, requestId=request["requestId"])))
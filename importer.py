@@ -0,0 +1,248 @@
+"""
+Streams a GraphSON 3.0 or JSON-lines graph dump into a FormationManager, a batch at a time
+"""
+
+import json
+import typing as tp
+import numpy as np
+
+from formation import FormationManager
+from spec import ArrowDraw
+import config as cfg
+
+class StyleRule:
+    """
+    Applies to vertices or edges whose label is label (any label if None) and, if given,
+    whose properties make where() return True. Attributes left as None fall through to
+    the next matching rule, then to the StyleRules defaults.
+
+    text is a str.format() template over the properties plus "label" and "id", e.g. "{name}".
+    """
+    def __init__(self, label: tp.Optional[str]=None, colour: tp.Optional[str]=None, \
+                 text: tp.Optional[str]=None, arrow_draw: tp.Optional[ArrowDraw]=None, \
+                 where: tp.Optional[tp.Callable[[tp.Dict[str, tp.Any]], bool]]=None):
+        self.label = label
+        self.colour = colour
+        self.text = text
+        self.arrow_draw = arrow_draw
+        self.where = where
+
+    def matches(self, label: str, properties: tp.Dict[str, tp.Any]) -> bool:
+        if self.label is not None and self.label != label:
+            return False
+        return self.where is None or self.where(properties)
+
+class StyleRules:
+    def __init__(self, vertex_rules: tp.Optional[tp.List[StyleRule]]=None, \
+                 edge_rules: tp.Optional[tp.List[StyleRule]]=None, \
+                 vertex_colour: str="green", vertex_text: str="{name}", \
+                 edge_colour: str="black", arrow_draw: ArrowDraw=ArrowDraw.FWD_ARROW):
+        """
+        Edges whose arrow_draw is NO_LINK are left out. DUAL_LINK isn't allowed, as there is no
+        second colour to give it.
+        """
+        # Caught here rather than partway through an import
+        if ArrowDraw.DUAL_LINK in [arrow_draw] + [rule.arrow_draw for rule in edge_rules or []]:
+            raise ValueError("Edge rules can't draw DUAL_LINKs, they have no second colour")
+        self.vertex_rules = vertex_rules or []
+        self.edge_rules = edge_rules or []
+        self.vertex_colour = vertex_colour
+        self.vertex_text = vertex_text
+        self.edge_colour = edge_colour
+        self.arrow_draw = arrow_draw
+
+    def _first(self, rules: tp.List[StyleRule], attr: str, default, label: str, properties: tp.Dict[str, tp.Any]):
+        for rule in rules:
+            value = getattr(rule, attr)
+            if value is not None and rule.matches(label, properties):
+                return value
+        return default
+
+    def vertex_style(self, vertex_id, label: str, properties: tp.Dict[str, tp.Any]) -> tp.Tuple[str, str]:
+        """
+        Returns the text and colour name for a vertex. Text falls back to the label
+        when the template names a property the vertex doesn't have.
+        """
+        colour = self._first(self.vertex_rules, 'colour', self.vertex_colour, label, properties)
+        template = self._first(self.vertex_rules, 'text', self.vertex_text, label, properties)
+        try:
+            text = template.format_map(dict(properties, label=label, id=vertex_id))
+        except (KeyError, IndexError):
+            text = label
+        return text, colour
+
+    def edge_style(self, label: str, properties: tp.Dict[str, tp.Any]) -> tp.Tuple[str, ArrowDraw]:
+        colour = self._first(self.edge_rules, 'colour', self.edge_colour, label, properties)
+        arrow_draw = self._first(self.edge_rules, 'arrow_draw', self.arrow_draw, label, properties)
+        return colour, arrow_draw
+
+def unwrap_graphson(value):
+    """
+    Strips GraphSON 3.0 type wrappers, {"@type": ..., "@value": ...}, all the way down.
+    """
+    if isinstance(value, dict):
+        if '@type' in value and '@value' in value:
+            if value['@type'] == 'g:Map':
+                items = unwrap_graphson(value['@value'])
+                return {_key(k): v for k, v in zip(items[::2], items[1::2])}
+            return unwrap_graphson(value['@value'])
+        return {k: unwrap_graphson(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [unwrap_graphson(item) for item in value]
+    return value
+
+def _key(element_id) -> tp.Hashable:
+    """
+    Some providers use maps for element ids, which can't be dict keys as they are.
+    """
+    if isinstance(element_id, (dict, list)):
+        return json.dumps(element_id, sort_keys=True)
+    return element_id
+
+def _property_values(properties: tp.Optional[dict]) -> tp.Dict[str, tp.Any]:
+    """
+    Flattens vertex properties ({"name": [{"id": ..., "value": "marko"}]}), edge properties
+    ({"weight": {"key": "weight", "value": 0.5}}) and plain {"name": "marko"} alike.
+    Multi-valued vertex properties keep their first value.
+    """
+    values = {}
+    for key, prop in (properties or {}).items():
+        if isinstance(prop, list):
+            if not prop:
+                continue
+            prop = prop[0]
+        if isinstance(prop, dict) and 'value' in prop:
+            prop = prop['value']
+        values[key] = prop
+    return values
+
+class GraphImporter:
+    """
+    Reads one JSON element per line, which covers both what TinkerPop's GraphSON writer
+    produces for a graph (a vertex per line with its edges under outE/inE) and dumps with
+    vertices and edges on lines of their own (edges being the ones with outV and inV).
+
+    Vertices and edges are buffered until batch_size of them have been read, then added to the
+    FormationManager in bulk, so memory use doesn't depend on the size of the file. The only things
+    kept for the whole import are the vertex id to node id map and edges waiting on a vertex that
+    hasn't been read yet.
+
+    Vertices are laid out on a grid in the order they are read.
+    """
+    def __init__(self, mgr: tp.Optional[FormationManager]=None, rules: tp.Optional[StyleRules]=None, \
+                 batch_size: int=cfg.import_batch_size, spacing: int=cfg.import_spacing, \
+                 grid_columns: int=cfg.import_grid_columns):
+        self.mgr = FormationManager() if mgr is None else mgr
+        self._rules = StyleRules() if rules is None else rules
+        self._batch_size = batch_size
+        self._spacing = spacing
+        self._grid_columns = grid_columns
+
+        self._node_ids = {}
+        self._num_vertices = 0
+        self._vertex_keys = []
+        self._vertex_texts = []
+        self._vertex_colours = []
+        self._edges = []
+        self._waiting_edges = {}
+
+    def import_file(self, path: str) -> FormationManager:
+        with open(path, 'r', encoding='utf-8') as f:
+            self.feed(f)
+        return self.finish()
+
+    def feed(self, lines: tp.Iterable[str]):
+        self.feed_elements(unwrap_graphson(json.loads(line)) for line in lines if line.strip())
+
+    def feed_elements(self, elements: tp.Iterable[dict]):
+        """
+        Takes elements that have already been parsed and had their GraphSON types stripped.
+        """
+        for element in elements:
+            if 'outV' in element and 'inV' in element:
+                self._add_edge(element.get('label', ''), element['outV'], element['inV'], element.get('properties'))
+            else:
+                self._add_vertex(element)
+
+            if len(self._vertex_keys) + len(self._edges) >= self._batch_size:
+                self.flush()
+
+    def finish(self) -> FormationManager:
+        """
+        Adds whatever is still buffered. Raises ValueError if an edge refers to a vertex that was never read.
+        """
+        self.flush()
+        if self._waiting_edges:
+            missing_key = next(iter(self._waiting_edges))
+            num_edges = sum(len(edges) for edges in self._waiting_edges.values())
+            raise ValueError("{} edges refer to vertices that were never read, e.g. {}" \
+                             .format(num_edges, missing_key))
+        return self.mgr
+
+    def _add_vertex(self, element: dict):
+        vertex_id = element.get('id')
+        vertex_key = _key(vertex_id)
+        if vertex_key in self._node_ids:
+            return
+
+        label = element.get('label', 'vertex')
+        text, colour = self._rules.vertex_style(vertex_id, label, _property_values(element.get('properties')))
+        # Reserved now so edges in the same batch can find it
+        self._node_ids[vertex_key] = None
+        self._vertex_keys.append(vertex_key)
+        self._vertex_texts.append(text)
+        self._vertex_colours.append(colour)
+
+        # inE is the same edges again, seen from the other end
+        for edge_label, edges in (element.get('outE') or {}).items():
+            for edge in edges:
+                self._add_edge(edge_label, vertex_id, edge['inV'], edge.get('properties'))
+
+    def _add_edge(self, label: str, out_id, in_id, properties: tp.Optional[dict]):
+        colour, arrow_draw = self._rules.edge_style(label, _property_values(properties))
+        self._edges.append((_key(out_id), _key(in_id), colour, arrow_draw))
+
+    def flush(self):
+        """
+        Adds everything buffered so far, apart from edges still waiting on a vertex.
+        """
+        if self._vertex_keys:
+            num_new = len(self._vertex_keys)
+            grid_indices = np.arange(self._num_vertices, self._num_vertices + num_new)
+            positions = np.stack((grid_indices % self._grid_columns,
+                                  grid_indices // self._grid_columns), axis=1) * self._spacing + self._spacing // 2
+
+            new_ids = self.mgr.add_nodes(self._vertex_texts, positions, self._vertex_colours)
+            self._num_vertices += num_new
+            for vertex_key, new_id in zip(self._vertex_keys, new_ids.tolist()):
+                self._node_ids[vertex_key] = new_id
+                self._edges.extend(self._waiting_edges.pop(vertex_key, []))
+
+            self._vertex_keys = []
+            self._vertex_texts = []
+            self._vertex_colours = []
+
+        ready = []
+        for edge in self._edges:
+            missing_key = self._missing_end_of(edge)
+            if missing_key is None:
+                if edge[3] != ArrowDraw.NO_LINK:
+                    ready.append(edge)
+            else:
+                self._waiting_edges.setdefault(missing_key, []).append(edge)
+        self._edges = []
+
+        if ready:
+            out_keys, in_keys, colours, arrow_draws = zip(*ready)
+            self.mgr.add_links([self._node_ids[key] for key in out_keys],
+                               [self._node_ids[key] for key in in_keys],
+                               list(colours), list(arrow_draws))
+
+    def _missing_end_of(self, edge: tp.Tuple) -> tp.Optional[tp.Hashable]:
+        for vertex_key in edge[:2]:
+            if self._node_ids.get(vertex_key) is None:
+                return vertex_key
+        return None
+
+def import_graph(path: str, rules: tp.Optional[StyleRules]=None) -> FormationManager:
+    return GraphImporter(rules=rules).import_file(path)
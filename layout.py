@@ -0,0 +1,558 @@
+"""
+Automatic layouts, working on arrays of node positions
+"""
+
+import typing as tp
+import numpy as np
+
+import config as cfg
+
+class _Level:
+    def __init__(self, keys: np.array, masses: np.array, centres: np.array):
+        self.keys = keys # sorted; (cell_x << depth) | cell_y
+        self.masses = masses
+        self.centres = centres # centre of mass, as x + yj
+        self.children = None # (cells, 4) rows of the next level, -1 where unoccupied
+        self.parents = None # row of the previous level each cell is in
+
+class QuadTree:
+    """
+    A Barnes-Hut quadtree, built a whole level at a time: level d has a row for each
+    occupied cell of a 2**d by 2**d grid over the points. Building stops at max_depth or once
+    every point has a cell of its own; leaves holds each point's cell in the last level.
+    """
+    def __init__(self, points: np.array, max_depth: int):
+        self._mins = points.min(axis=0)
+        # Slightly larger than the points' extent so the largest ones still land in the last cell
+        self.size = max(float(np.max(points.max(axis=0) - self._mins)), 1.0) * (1 + 1e-9)
+
+        finest = 2 ** max_depth
+        cells = np.minimum(((points - self._mins) / self.size * finest).astype(np.int64), finest - 1)
+
+        self.levels = []
+        for depth in range(max_depth + 1):
+            cell_xy = cells >> (max_depth - depth)
+            keys, self.leaves = np.unique((cell_xy[:,0] << depth) | cell_xy[:,1], return_inverse=True)
+            masses = np.bincount(self.leaves, minlength=len(keys)).astype(float)
+            centres = (np.bincount(self.leaves, weights=points[:,0], minlength=len(keys)) \
+                       + 1j * np.bincount(self.leaves, weights=points[:,1], minlength=len(keys))) / masses
+            level = _Level(keys, masses, centres)
+            if self.levels:
+                self._link_children(depth, level)
+            self.levels.append(level)
+            if len(keys) == len(points):
+                break
+
+    def _link_children(self, depth: int, level: _Level):
+        parent = self.levels[depth - 1]
+        cell_x = level.keys >> depth
+        cell_y = level.keys & ((1 << depth) - 1)
+        level.parents = np.searchsorted(parent.keys, ((cell_x >> 1) << (depth - 1)) | (cell_y >> 1))
+        parent.children = np.full((len(parent.keys), 4), -1, dtype=np.int64)
+        parent.children[level.parents, (cell_x & 1) * 2 + (cell_y & 1)] = np.arange(len(level.keys))
+
+    def repulsion(self, points: np.array, strength: float, theta: float, terms: int) -> np.array:
+        """
+        strength * mass * d / |d|**2 summed over everything else for each point, d pointing away from it.
+
+        Taking d as a complex number, that is strength * conj(f(z)) for f(z) = sum of mass / (z - centre),
+        which around any cell's centre is a power series in the offset from it. So rather than every point
+        walking the tree, pairs of cells do: once a pair is further apart than their width over theta,
+        the one cell's mass goes into the first terms coefficients of the other's series. Each level's
+        series are then moved onto the centres of the cells below it, and each point sums its own cell's.
+        """
+        series = [np.zeros((len(level.keys), terms), dtype=complex) for level in self.levels]
+        targets = np.zeros(1, dtype=np.int64)
+        sources = np.zeros(1, dtype=np.int64)
+        for depth, level in enumerate(self.levels):
+            gaps = level.centres[targets] - level.centres[sources]
+            dist2 = gaps.real ** 2 + gaps.imag ** 2
+            width = self.size / 2 ** depth
+            if depth == len(self.levels) - 1:
+                accepted = np.ones(len(targets), dtype=bool)
+            else:
+                accepted = ((level.masses[targets] == 1) & (level.masses[sources] == 1)) \
+                         | (width * width < theta * theta * dist2)
+
+            # A cell paired with itself, once it has nothing else in it, is at distance 0
+            pushing = accepted & (dist2 > 0)
+            self._expand(series[depth], targets[pushing], level.masses[sources[pushing]], gaps[pushing])
+
+            if np.all(accepted):
+                break
+            target_children = level.children[targets[~accepted]][:, :, np.newaxis]
+            source_children = level.children[sources[~accepted]][:, np.newaxis, :]
+            occupied = (target_children >= 0) & (source_children >= 0)
+            targets = np.broadcast_to(target_children, occupied.shape)[occupied]
+            sources = np.broadcast_to(source_children, occupied.shape)[occupied]
+
+        for depth in range(1, len(self.levels)):
+            level = self.levels[depth]
+            series[depth] += self._recentred(series[depth - 1][level.parents],
+                                             level.centres - self.levels[depth - 1].centres[level.parents])
+
+        last = self.levels[-1]
+        offsets = points[:,0] + 1j * points[:,1] - last.centres[self.leaves]
+        coefficients = series[-1][self.leaves]
+        sums = coefficients[:,-1]
+        for term in range(terms - 2, -1, -1):
+            sums = sums * offsets + coefficients[:,term]
+        sums = np.conj(sums)
+
+        # Points sharing a cell of the last level are pushed by the rest of it as one body
+        masses = last.masses[self.leaves]
+        sharing = (masses > 1) & (offsets != 0)
+        rest = offsets[sharing] * masses[sharing] / (masses[sharing] - 1)
+        sums[sharing] += (masses[sharing] - 1) / np.conj(rest)
+
+        return strength * np.stack((sums.real, sums.imag), axis=1)
+
+    @staticmethod
+    def _expand(series: np.array, targets: np.array, masses: np.array, gaps: np.array):
+        """
+        Adds mass / (gap + offset), as a power series in offset, to the targets' rows of series.
+        """
+        ratios = -1 / gaps
+        coefficients = masses / gaps
+        for term in range(series.shape[1]):
+            series[:,term] += np.bincount(targets, weights=coefficients.real, minlength=len(series)) \
+                            + 1j * np.bincount(targets, weights=coefficients.imag, minlength=len(series))
+            coefficients = coefficients * ratios
+
+    @staticmethod
+    def _recentred(series: np.array, shifts: np.array) -> np.array:
+        """
+        Rewrites power series in offset as series in offset - shift, term count unchanged.
+        """
+        series = series.copy()
+        terms = series.shape[1]
+        for first in range(terms - 1):
+            for term in range(terms - 2, first - 1, -1):
+                series[:,term] += shifts * series[:,term + 1]
+        return series
+
+def force_directed(positions: np.array, from_ids: np.array, to_ids: np.array, pinned: np.array, \
+                   link_length: float=cfg.layout_link_length, max_iterations: int=cfg.layout_max_iterations, \
+                   tolerance: float=cfg.layout_tolerance, theta: float=cfg.layout_theta, \
+                   cooling: float=cfg.layout_cooling, temperature: tp.Optional[float]=None, \
+                   step_scales: tp.Optional[np.array]=None, seed: int=0) -> tp.Tuple[np.array, int]:
+    """
+    Fruchterman-Reingold: every pair of nodes repels by link_length**2 / distance and every link
+    pulls its ends together by distance**2 / link_length. Repulsion goes through a Barnes-Hut QuadTree
+    rebuilt each iteration. Each node moves at most a temperature, by default a tenth of the layout's
+    extent, which is multiplied by cooling every iteration; the layout stops once no node moves further
+    than tolerance * link_length, whether because the forces have balanced or the temperature has fallen
+    that far, or after max_iterations.
+
+    Rows where pinned is True don't move, and if step_scales is given each node only moves that fraction
+    of its step. Returns the new positions and the iterations it took.
+    """
+    positions = np.array(positions, dtype=float).reshape(-1, 2)
+    free = ~np.asarray(pinned, dtype=bool)
+    if len(positions) < 2 or not np.any(free):
+        return positions, 0
+
+    # Nodes that start in the same place would have no direction to push each other in
+    rng = np.random.default_rng(seed)
+    positions[free] += rng.uniform(-1, 1, (np.count_nonzero(free), 2)) * link_length * 1e-3
+
+    if temperature is None:
+        extent = float(np.max(positions.max(axis=0) - positions.min(axis=0)))
+        temperature = max(extent / 10, link_length)
+
+    iteration = 0
+    while iteration < max_iterations:
+        iteration += 1
+        tree = QuadTree(positions, cfg.layout_max_depth)
+        moves = tree.repulsion(positions, link_length * link_length, theta, cfg.layout_series_terms)
+
+        deltas = positions[to_ids] - positions[from_ids]
+        pulls = deltas * (np.linalg.norm(deltas, axis=1) / link_length)[:, np.newaxis]
+        for axis in (0, 1):
+            moves[:,axis] += np.bincount(from_ids, weights=pulls[:,axis], minlength=len(positions))
+            moves[:,axis] -= np.bincount(to_ids, weights=pulls[:,axis], minlength=len(positions))
+        moves[~free] = 0
+
+        lengths = np.linalg.norm(moves, axis=1)
+        steps = np.minimum(lengths, temperature)
+        if step_scales is not None:
+            steps *= step_scales
+        moving = lengths > 0
+        positions[moving] += moves[moving] * (steps[moving] / lengths[moving])[:, np.newaxis]
+
+        if steps.max() <= tolerance * link_length:
+            break
+        temperature *= cooling
+
+    return positions, iteration
+
+_NEIGHBOUR_OFFSETS = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+
+def _cell_keys(cells: np.array) -> np.array:
+    return cells[:,0] * (1 << 32) + cells[:,1]
+
+class _Multimap:
+    """
+    Int64 keys to any number of int64 values each, added a batch at a time. Pairs are kept in runs sorted
+    by key, each at least twice as long as the next, and a batch merged with the runs no longer than it.
+    So adding costs O(log n) per pair over time and looking keys up searches O(log n) runs, with neither
+    going through every pair; together it is a CSR that can be added to.
+    """
+    def __init__(self, current: tp.Optional[tp.Callable[[np.array, np.array], np.array]]=None):
+        """
+        current(keys, values), if given, masks the pairs still wanted; the rest are dropped, along with
+        repeated pairs, when runs are merged.
+        """
+        self._current = current
+        self._runs = []
+
+    def add(self, keys: np.array, values: np.array):
+        keys = np.asarray(keys, dtype=np.int64)
+        values = np.asarray(values, dtype=np.int64)
+        merged = False
+        while self._runs and len(self._runs[-1][0]) <= 2 * len(keys):
+            run_keys, run_values = self._runs.pop()
+            keys = np.concatenate((run_keys, keys))
+            values = np.concatenate((run_values, values))
+            merged = True
+
+        if merged and self._current is not None:
+            wanted = self._current(keys, values)
+            pairs = np.unique(np.stack((keys[wanted], values[wanted]), axis=1), axis=0)
+            self._runs.append((pairs[:,0].copy(), pairs[:,1].copy()))
+        else:
+            order = np.argsort(keys, kind='stable')
+            self._runs.append((keys[order], values[order]))
+
+    def find(self, keys: np.array) -> tp.Tuple[np.array, np.array]:
+        """
+        The keys and values of every pair with one of keys.
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        found = [np.empty(0, dtype=np.int64)] * 2
+        for run_keys, run_values in self._runs:
+            starts = np.searchsorted(run_keys, keys)
+            rows = _runs(starts, np.searchsorted(run_keys, keys, side='right') - starts)
+            found = [np.concatenate((found[0], run_keys[rows])), np.concatenate((found[1], run_values[rows]))]
+        return found[0], found[1]
+
+class NeighbourIndex:
+    """
+    Each node's links, and the nodes in each cell of a grid cell_size wide, for relax_around(). It is
+    brought up to date with the nodes and links added, and told which nodes moved, at a cost that depends
+    on how many those are rather than on the size of the graph.
+    """
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self._positions = np.empty((0, 2))
+        self._num_links = 0
+        self._links_by_node = _Multimap()
+        self._nodes_by_cell = _Multimap(current=self._in_cell)
+
+    def update(self, positions: np.array, from_ids: np.array, to_ids: np.array):
+        """
+        Takes in the nodes and links added since the last update. positions is where nodes are
+        looked up from then on, until the next update.
+        """
+        num_indexed = len(self._positions)
+        self._positions = positions
+        if len(positions) > num_indexed:
+            self.moved(np.arange(num_indexed, len(positions)))
+        if len(from_ids) > self._num_links:
+            links = np.arange(self._num_links, len(from_ids))
+            self._links_by_node.add(np.concatenate((from_ids[links], to_ids[links])), np.concatenate((links, links)))
+            self._num_links = len(from_ids)
+
+    def moved(self, ids: np.array):
+        """
+        Takes in where ids are now.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        self._nodes_by_cell.add(self._keys_of(self._positions[ids]), ids)
+
+    def _keys_of(self, points: np.array) -> np.array:
+        return _cell_keys(np.floor(np.divide(points, self.cell_size, dtype=float)).astype(np.int64))
+
+    def _in_cell(self, keys: np.array, ids: np.array) -> np.array:
+        return self._keys_of(self._positions[ids]) == keys
+
+    def links_of(self, nodes: np.array) -> np.array:
+        """
+        The sorted links with either end in nodes.
+        """
+        return np.unique(self._links_by_node.find(nodes)[1])
+
+    def k_hop(self, from_ids: np.array, to_ids: np.array, seeds: np.array, hops: int) -> np.array:
+        """
+        The sorted nodes at most hops links away from any of seeds, whichever way the links point.
+        """
+        inside = np.unique(np.asarray(seeds, dtype=np.int64))
+        frontier = inside
+        for _ in range(hops):
+            links = self.links_of(frontier)
+            frontier = np.setdiff1d(np.concatenate((from_ids[links], to_ids[links])), inside)
+            if len(frontier) == 0:
+                break
+            inside = np.union1d(inside, frontier)
+        return inside
+
+    def nodes_near(self, points: np.array) -> np.array:
+        """
+        The sorted nodes in the same or a neighbouring cell as any of points.
+        """
+        cells = np.floor(np.divide(points, self.cell_size, dtype=float)).astype(np.int64)
+        keys = np.unique(_cell_keys((cells[:, np.newaxis, :] + _NEIGHBOUR_OFFSETS).reshape(-1, 2)))
+        found_keys, found = self._nodes_by_cell.find(keys)
+        # Left behind by nodes that have moved since
+        return np.unique(found[self._in_cell(found_keys, found)])
+
+def relax_around(positions: np.array, from_ids: np.array, to_ids: np.array, added: np.array, \
+                 affected: np.array, hops: int=cfg.relayout_hops, damping: float=cfg.relayout_damping, \
+                 link_length: float=cfg.layout_link_length, index: tp.Optional[NeighbourIndex]=None, \
+                 **kwargs) -> tp.Tuple[np.array, np.array, int]:
+    """
+    Runs force_directed() on just the nodes within hops links of added or affected ones (e.g. the
+    ones left behind when their links went), so the rest of an existing layout stays where it is.
+    Those nodes move damping times as far as the added and affected ones do, and the force
+    calculation only takes in them plus the fixed nodes linked to them or close enough to push them.
+
+    Added nodes first go to the mean position of their neighbours that weren't just added, if any.
+    Returns the ids that moved, their new positions and the iterations it took.
+
+    Only the nodes and links around the change are looked at, found through index, whose cells have to
+    be link_length wide. Kept from one call to the next and told which nodes moved each time, it only
+    has to take in what was added in between; without one, one is made for the whole graph.
+    """
+    positions = np.asarray(positions).reshape(-1, 2)
+    if index is None:
+        index = NeighbourIndex(link_length)
+    elif index.cell_size != link_length:
+        raise ValueError("Expected an index with cells {} wide, not {}".format(link_length, index.cell_size))
+    index.update(positions, from_ids, to_ids)
+
+    added = np.unique(np.asarray(added, dtype=np.int64))
+    changed = np.union1d(added, np.asarray(affected, dtype=np.int64))
+    free = index.k_hop(from_ids, to_ids, changed, hops)
+    if len(free) == 0:
+        return np.empty(0, dtype=np.int64), np.empty((0, 2)), 0
+
+    placed = index.links_of(added)
+    placed = placed[np.isin(from_ids[placed], added) != np.isin(to_ids[placed], added)]
+    from_added = np.isin(from_ids[placed], added)
+    new_ends = np.where(from_added, from_ids[placed], to_ids[placed])
+    old_ends = np.where(from_added, to_ids[placed], from_ids[placed])
+    new_nodes, new_rows, counts = np.unique(new_ends, return_inverse=True, return_counts=True)
+    new_positions = np.stack([np.bincount(new_rows.reshape(-1), weights=positions[old_ends, axis], minlength=len(new_nodes))
+                              for axis in (0, 1)], axis=1) / counts[:, np.newaxis]
+
+    # Nodes in the same or a neighbouring cell of a grid link_length wide as a free node are close
+    # enough to push it
+    free_positions = positions[free].astype(float)
+    free_positions[np.searchsorted(free, new_nodes)] = new_positions
+    links = index.links_of(free)
+    ids = np.union1d(np.union1d(free, np.concatenate((from_ids[links], to_ids[links]))),
+                     index.nodes_near(free_positions))
+
+    # Only what is around the change is read out of positions, and copied
+    local_positions = positions[ids].astype(float)
+    local_positions[np.searchsorted(ids, new_nodes)] = new_positions
+    is_free = np.isin(ids, free, assume_unique=True)
+    # Links between two fixed nodes don't move anything
+    new_positions, iterations = force_directed(local_positions, np.searchsorted(ids, from_ids[links]), \
+                                               np.searchsorted(ids, to_ids[links]), ~is_free, \
+                                               link_length=link_length, temperature=link_length, \
+                                               step_scales=np.where(np.isin(ids, changed), 1.0, damping), **kwargs)
+    return ids[is_free], new_positions[is_free], iterations
+
+def _out_edges(num_nodes: int, from_ids: np.array) -> tp.Tuple[np.array, np.array]:
+    """
+    Edge indices sorted by from node, and where each node's run of them starts (CSR).
+    """
+    order = np.argsort(from_ids, kind='stable')
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(from_ids, minlength=num_nodes))))
+    return order, offsets
+
+def _runs(starts: np.array, counts: np.array) -> np.array:
+    """
+    Every index from starts[i] up to starts[i] + counts[i], for each i in turn.
+    """
+    run_starts = np.repeat(starts - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    return run_starts + np.arange(counts.sum())
+
+def _edges_of(order: np.array, offsets: np.array, nodes: np.array) -> np.array:
+    starts = offsets[nodes]
+    return order[_runs(starts, offsets[nodes + 1] - starts)]
+
+def break_cycles(num_nodes: int, from_ids: np.array, to_ids: np.array) -> np.array:
+    """
+    Returns a mask of the edges to reverse so no cycles are left: the ones a depth-first search
+    finds pointing back up its own stack. Self loops are left alone.
+    """
+    order, offsets = _out_edges(num_nodes, from_ids)
+    order = order.tolist()
+    offsets = offsets.tolist()
+    targets = to_ids.tolist()
+
+    reversed_edges = []
+    state = bytearray(num_nodes) # 0 unvisited, 1 on the stack, 2 finished
+    for root in range(num_nodes):
+        if state[root]:
+            continue
+        state[root] = 1
+        stack = [[root, offsets[root]]]
+        while stack:
+            top = stack[-1]
+            node, next_edge = top
+            if next_edge == offsets[node + 1]:
+                state[node] = 2
+                stack.pop()
+                continue
+
+            top[1] += 1
+            edge = order[next_edge]
+            target = targets[edge]
+            if state[target] == 1 and target != node:
+                reversed_edges.append(edge)
+            elif state[target] == 0:
+                state[target] = 1
+                stack.append([target, offsets[target]])
+
+    reverse = np.zeros(len(from_ids), dtype=bool)
+    reverse[reversed_edges] = True
+    return reverse
+
+def longest_path_layers(num_nodes: int, from_ids: np.array, to_ids: np.array) -> np.array:
+    """
+    Layer of each node of a DAG: the length of the longest path reaching it, so every edge
+    goes down at least one layer. Works a whole layer of nodes at a time.
+    """
+    order, offsets = _out_edges(num_nodes, from_ids)
+    in_degrees = np.bincount(to_ids, minlength=num_nodes)
+    layers = np.zeros(num_nodes, dtype=np.int64)
+
+    frontier = np.flatnonzero(in_degrees == 0)
+    layer = 0
+    while len(frontier):
+        layers[frontier] = layer
+        targets = to_ids[_edges_of(order, offsets, frontier)]
+        in_degrees -= np.bincount(targets, minlength=num_nodes)
+        frontier = np.unique(targets[in_degrees[targets] == 0])
+        layer += 1
+
+    if np.any(in_degrees > 0):
+        raise ValueError("The graph still has cycles in it")
+    return layers
+
+def _split_long_edges(num_nodes: int, from_ids: np.array, to_ids: np.array, layers: np.array, \
+                      max_span: int) -> tp.Tuple[np.array, np.array, np.array]:
+    """
+    Replaces every edge spanning more than one layer with a chain through dummy nodes, one per layer
+    crossed, numbered from num_nodes. Returns the new edges and the layers of all nodes, dummies included.
+    Edges spanning more than max_span layers are dropped instead: a tangled graph can have thousands
+    of layers once its cycles are broken, and chains that long would dwarf the graph itself.
+    """
+    spans = layers[to_ids] - layers[from_ids]
+    short = spans == 1
+    long_edges = np.flatnonzero((spans > 1) & (spans <= max_span))
+    if len(long_edges) == 0:
+        return from_ids[short], to_ids[short], layers
+
+    num_dummies = spans[long_edges] - 1
+    chain_starts = np.cumsum(num_dummies) - num_dummies
+
+    owner = np.repeat(long_edges, num_dummies)
+    step = np.arange(num_dummies.sum()) - np.repeat(chain_starts, num_dummies)
+    dummy_ids = num_nodes + np.arange(len(owner))
+    dummy_layers = layers[from_ids[owner]] + step + 1
+
+    # Each dummy gets the edge into it; the last of each chain also gets the edge out of it
+    is_first = step == 0
+    is_last = step == np.repeat(num_dummies, num_dummies) - 1
+    into_dummies_from = np.where(is_first, from_ids[owner], dummy_ids - 1)
+
+    new_from = np.concatenate((from_ids[short], into_dummies_from, dummy_ids[is_last]))
+    new_to = np.concatenate((to_ids[short], dummy_ids, to_ids[owner[is_last]]))
+    return new_from, new_to, np.concatenate((layers, dummy_layers))
+
+def _reorder_by_barycentre(ranks: np.array, layer_nodes: tp.List[np.array], \
+                           edge_sources: tp.List[np.array], edge_targets: tp.List[np.array]):
+    """
+    One sweep over the layers in the order given: each layer is sorted by the mean rank of its
+    neighbours in the layer before, the ones without any keeping their place. edge_sources[i] and
+    edge_targets[i] are the edges from the previous layer in the sweep into layer_nodes[i].
+    """
+    for nodes, sources, targets in zip(layer_nodes, edge_sources, edge_targets):
+        if len(targets) == 0:
+            continue
+        sums = np.bincount(targets, weights=ranks[sources], minlength=len(ranks))[nodes]
+        counts = np.bincount(targets, minlength=len(ranks))[nodes]
+        current = ranks[nodes]
+        barycentres = np.where(counts > 0, sums / np.maximum(counts, 1), current)
+        ranks[nodes[np.lexsort((current, barycentres))]] = np.arange(len(nodes))
+
+def _pack(desired: np.array, gap: float) -> np.array:
+    """
+    Positions as close to desired as possible while keeping gap between neighbours and their order:
+    the average of packing everything right and packing everything left.
+    """
+    steps = np.arange(len(desired)) * gap
+    pushed_right = steps + np.maximum.accumulate(desired - steps)
+    pushed_left = steps + np.minimum.accumulate((desired - steps)[::-1])[::-1]
+    return (pushed_right + pushed_left) / 2
+
+def layered(num_nodes: int, from_ids: np.array, to_ids: np.array, \
+            dir: tp.Tuple[int, int]=(0, 1), layer_gap: float=cfg.layered_layer_gap, \
+            node_gap: float=cfg.layered_node_gap, sweeps: int=cfg.layered_sweeps, \
+            max_span: int=cfg.layered_max_span) -> tp.Tuple[np.array, int]:
+    """
+    Sugiyama-style: edges are followed from -> to, so every edge points along dir apart from the few
+    reversed to break cycles. Layers are the longest path into each node, layer_gap apart along dir;
+    edges spanning up to max_span layers get dummy nodes in between so they take part in the ordering.
+    Each layer is ordered by barycentre sweeps down and back up, then nodes are placed node_gap apart
+    across dir, as close to the mean of their parents as that allows.
+
+    Returns positions relative to the first layer and the number of layers.
+    """
+    from_ids = np.asarray(from_ids, dtype=np.int64)
+    to_ids = np.asarray(to_ids, dtype=np.int64)
+    not_loop = from_ids != to_ids
+    from_ids = from_ids[not_loop]
+    to_ids = to_ids[not_loop]
+
+    reverse = break_cycles(num_nodes, from_ids, to_ids)
+    from_ids, to_ids = np.where(reverse, to_ids, from_ids), np.where(reverse, from_ids, to_ids)
+    layers = longest_path_layers(num_nodes, from_ids, to_ids)
+    from_ids, to_ids, layers = _split_long_edges(num_nodes, from_ids, to_ids, layers, max_span)
+    num_layers = int(layers.max()) + 1 if len(layers) else 0
+
+    # Nodes grouped by layer, and edges grouped by the layer they go into
+    node_order = np.argsort(layers, kind='stable')
+    layer_nodes = np.split(node_order, np.searchsorted(layers[node_order], np.arange(1, num_layers)))
+    edge_order = np.argsort(layers[to_ids], kind='stable')
+    edge_splits = np.searchsorted(layers[to_ids][edge_order], np.arange(1, num_layers + 1))
+    edges_into = np.split(edge_order, edge_splits)[:num_layers]
+    edges_out_of = edges_into[1:] + [np.empty(0, dtype=np.int64)]
+
+    ranks = np.empty(len(layers), dtype=float)
+    for nodes in layer_nodes:
+        ranks[nodes] = np.arange(len(nodes))
+    for _ in range(sweeps):
+        _reorder_by_barycentre(ranks, layer_nodes[1:], [from_ids[e] for e in edges_into[1:]],
+                               [to_ids[e] for e in edges_into[1:]])
+        _reorder_by_barycentre(ranks, layer_nodes[-2::-1], [to_ids[e] for e in edges_out_of[-2::-1]],
+                               [from_ids[e] for e in edges_out_of[-2::-1]])
+
+    breadths = np.zeros(len(layers))
+    for nodes, edges in zip(layer_nodes, edges_into):
+        nodes = nodes[np.argsort(ranks[nodes])]
+        centred = (np.arange(len(nodes)) - (len(nodes) - 1) / 2) * node_gap
+        sums = np.bincount(to_ids[edges], weights=breadths[from_ids[edges]], minlength=len(layers))[nodes]
+        counts = np.bincount(to_ids[edges], minlength=len(layers))[nodes]
+        desired = np.where(counts > 0, sums / np.maximum(counts, 1), centred)
+        breadths[nodes] = _pack(desired, node_gap)
+
+    depth_dir = np.array(dir, dtype=float) / np.linalg.norm(dir)
+    breadth_dir = np.array((depth_dir[1], -depth_dir[0]))
+    positions = layers[:num_nodes, np.newaxis] * layer_gap * depth_dir \
+              + breadths[:num_nodes, np.newaxis] * breadth_dir
+    return positions, num_layers
@@ -1,8 +1,34 @@
+import os
+import sys
+
 from canvas import Canvas
 from spec import ArrowDraw, NodeSpec, NullNode
 from formation import FormationManager
+from importer import import_graph
+
+if __name__ == '__main__' and len(sys.argv) > 1 and sys.argv[1].startswith(('ws://', 'wss://')):
+    # A Gremlin Server to load from, shown as it arrives
+    from gremlin import GraphLoader, BackgroundLoad
+    source = BackgroundLoad(GraphLoader(sys.argv[1])).start()
+    source.wait_for_nodes()
+    c = Canvas(source.mgr.nodes, source.mgr.links, source.mgr.labels, source)
+    c.main_loop()
+
+elif __name__ == '__main__' and len(sys.argv) > 1 and (sys.argv[1].endswith('.npz') or os.path.isdir(sys.argv[1])):
+    # A snapshot saved by snapshot.save(), already laid out
+    import snapshot
+    loaded = snapshot.load(sys.argv[1])
+    c = Canvas(loaded.mgr.nodes, loaded.mgr.links, loaded.mgr.labels, text_sizes=loaded.text_sizes,
+               label_text_sizes=loaded.label_text_sizes)
+    c.main_loop()
+
+elif __name__ == '__main__' and len(sys.argv) > 1:
+    # A GraphSON or JSON-lines dump to show instead of the demo formation below
+    mgr = import_graph(sys.argv[1])
+    c = Canvas(mgr.nodes, mgr.links, mgr.labels)
+    c.main_loop()
 
-if __name__ == '__main__':
+elif __name__ == '__main__':
     mgr = FormationManager()
     n1 = mgr.add_node("abc\nwiga", (400,300), "lime", multibox=True)
     n2 = mgr.add_node("def", (200,100), "green")
@@ -4,38 +4,414 @@ import os
 sys.path.append( os.path.dirname(__file__) )
 
 import typing as tp
+import numpy as np
 
 from spec import ArrowDraw
 
-class Node:
-    def __init__(self, text: str, pos: tp.Tuple[int, int], colour: str, multibox: bool = False):
-        self.text = text
-        self.pos = pos
-        self.colour = colour # see render.ModelToViewTranslator._get_colours()
-        self.multibox = multibox
+class _Column:
+    """
+    A NumPy array that can be appended to; the capacity doubles whenever it runs out.
+    """
+    def __init__(self, dtype, row_shape: tp.Tuple[int, ...]=()):
+        self._data = np.empty((16,) + row_shape, dtype=dtype)
+        self._len = 0
 
-class Link:
-    def __init__(self, from_id: int, to_id: int, colour: str, arrow_draw: ArrowDraw, second_colour: tp.Optional[str] = None):
-        if arrow_draw == ArrowDraw.BACK_ARROW:
-            self.from_model_node_id = to_id
-            self.to_model_node_id = from_id
-            self.arrow_draw = ArrowDraw.FWD_ARROW
-        else:
-            self.from_model_node_id = from_id
-            self.to_model_node_id = to_id
-            self.arrow_draw = arrow_draw
+    @classmethod
+    def of(cls, array: np.array) -> '_Column':
+        """
+        A column holding array, without copying it; it is only copied once the column has to grow.
+        """
+        column = cls.__new__(cls)
+        column._data = array
+        column._len = len(array)
+        return column
+
+    def __len__(self) -> int:
+        return self._len
+
+    def append(self, value):
+        self._reserve(self._len + 1)
+        self._data[self._len] = value
+        self._len += 1
+
+    def extend(self, values: np.array):
+        values = np.asarray(values, dtype=self._data.dtype)
+        self._reserve(self._len + len(values))
+        self._data[self._len:self._len+len(values)] = values
+        self._len += len(values)
+
+    def _reserve(self, capacity: int):
+        if capacity <= len(self._data):
+            return
+        new_capacity = max(len(self._data), 16)
+        while new_capacity < capacity:
+            new_capacity *= 2
+        grown = np.empty((new_capacity,) + self._data.shape[1:], dtype=self._data.dtype)
+        grown[:self._len] = self._data[:self._len]
+        self._data = grown
+
+    @property
+    def array(self) -> np.array:
+        return self._data[:self._len]
+
+class _Codes:
+    """
+    Small int codes for the few distinct names that get repeated a lot, e.g. colours.
+    -1 stands for None.
+    """
+    def __init__(self, names: tp.Optional[tp.List[str]]=None):
+        self.names = [] if names is None else list(names)
+        self._codes = {name: code for code, name in enumerate(self.names)}
+
+    def code_of(self, name: tp.Optional[str]) -> int:
+        if name is None:
+            return -1
+        if name not in self._codes:
+            self._codes[name] = len(self.names)
+            self.names.append(name)
+        return self._codes[name]
+
+class PackedTexts:
+    """
+    Texts kept as one UTF-8 blob plus where each one ends in it, e.g. mapped from a snapshot,
+    and only decoded when asked for. Texts appended later are kept as they are.
+    """
+    def __init__(self, blob: np.array, ends: np.array):
+        self._blob = blob
+        self._ends = ends
+        self._appended = []
+
+    def __len__(self) -> int:
+        return len(self._ends) + len(self._appended)
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += len(self)
+        if index >= len(self._ends):
+            return self._appended[index - len(self._ends)]
+        # Each text is followed by a separator, see snapshot.save()
+        start = int(self._ends[index - 1]) + 1 if index > 0 else 0
+        return self._blob[start:int(self._ends[index])].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+    def append(self, text: str):
+        self._appended.append(text)
+
+    def extend(self, texts: tp.List[str]):
+        self._appended.extend(texts)
+
+    def non_empty(self) -> np.array:
+        """
+        Which texts aren't empty, without decoding any of them.
+        """
+        ends = np.asarray(self._ends)
+        starts = np.concatenate(([0], ends[:-1] + 1))[:len(ends)]
+        return np.concatenate((ends > starts, [bool(text) for text in self._appended])).astype(bool)
+
+class _Store:
+    """
+    Column-per-attribute storage for one kind of model object. Indexing or iterating gives
+    lightweight views that read from the columns.
+    """
+    _view_type = None
+
+    def __init__(self):
+        self._texts = []
+        self._positions = _Column(np.float32, (2,))
+        self._colour_codes = _Column(np.int16)
+        self._colours = _Codes()
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def _restore(self, texts: tp.Sequence[str], positions: np.array, colour_codes: np.array, colour_names: tp.List[str]):
+        if len(positions) != len(texts) or len(colour_codes) != len(texts):
+            raise ValueError("Expected {} positions and colour codes, got {} and {}".format( \
+                len(texts), len(positions), len(colour_codes)))
+        self._texts = texts if isinstance(texts, PackedTexts) else list(texts)
+        self._positions = _Column.of(np.ascontiguousarray(positions, dtype=np.float32).reshape(-1, 2))
+        self._colour_codes = _Column.of(np.ascontiguousarray(colour_codes, dtype=np.int16))
+        self._colours = _Codes(colour_names)
+
+    def __getitem__(self, index: int):
+        if index < 0 or index >= len(self):
+            raise IndexError("{} out of range for {} items".format(index, len(self)))
+        return self._view_type(self, index)
+
+    def __iter__(self):
+        return (self._view_type(self, index) for index in range(len(self)))
+
+    @property
+    def texts(self) -> tp.Sequence[str]:
+        return self._texts
+
+    @property
+    def has_texts(self) -> np.array:
+        """
+        Which items have a text; the rest aren't drawn.
+        """
+        if isinstance(self._texts, PackedTexts):
+            return self._texts.non_empty()
+        return np.array([bool(text) for text in self._texts], dtype=bool)
+
+    @property
+    def positions(self) -> np.array:
+        """
+        (N,2) float32, row i belongs to item i. This is a view, so writing to it moves the items.
+        """
+        return self._positions.array
+
+    @property
+    def colour_codes(self) -> np.array:
+        """
+        Index into colour_names for each item.
+        """
+        return self._colour_codes.array
+
+    @property
+    def colour_names(self) -> tp.List[str]:
+        return self._colours.names
+
+class NodeStore(_Store):
+    def __init__(self):
+        super().__init__()
+        self._multiboxes = _Column(bool)
+
+    def append(self, text: str, pos: tp.Tuple[int, int], colour: str, multibox: bool = False) -> int:
+        """
+        Returns the new node's index, which is also its node id.
+        """
+        self._positions.append(pos)
+        self._colour_codes.append(self._colours.code_of(colour))
+        self._multiboxes.append(multibox)
+        self._texts.append(text)
+        return len(self._texts) - 1
+
+    def extend(self, texts: tp.List[str], positions: np.array, colours: tp.List[str], \
+               multiboxes: tp.Optional[tp.List[bool]] = None) -> np.array:
+        """
+        Appends many nodes at once and returns their indices.
+        """
+        first_index = len(self._texts)
+        self._positions.extend(np.asarray(positions).reshape(-1, 2))
+        self._colour_codes.extend([self._colours.code_of(colour) for colour in colours])
+        self._multiboxes.extend([False] * len(texts) if multiboxes is None else multiboxes)
+        self._texts.extend(texts)
+        return np.arange(first_index, len(self._texts))
+
+    @classmethod
+    def from_arrays(cls, texts: tp.Sequence[str], positions: np.array, colour_codes: np.array, \
+                    colour_names: tp.List[str], multiboxes: np.array) -> 'NodeStore':
+        """
+        A store holding the given columns as they are, e.g. loaded from a snapshot. They can be
+        memory mapped and texts a PackedTexts; nothing is read until it is needed.
+        """
+        store = cls()
+        store._restore(texts, positions, colour_codes, colour_names)
+        if len(multiboxes) != len(texts):
+            raise ValueError("Expected {} multiboxes, got {}".format(len(texts), len(multiboxes)))
+        store._multiboxes = _Column.of(np.ascontiguousarray(multiboxes, dtype=bool))
+        return store
+
+    @property
+    def multiboxes(self) -> np.array:
+        return self._multiboxes.array
 
-        self.colour = colour
-        self.second_colour = second_colour # for DUAL_LINK
+class LabelStore(_Store):
+    def append(self, text: str, pos: tp.Tuple[int, int], colour: str):
+        self._positions.append(pos)
+        self._colour_codes.append(self._colours.code_of(colour))
+        self._texts.append(text)
 
+    @classmethod
+    def from_arrays(cls, texts: tp.Sequence[str], positions: np.array, colour_codes: np.array, \
+                    colour_names: tp.List[str]) -> 'LabelStore':
+        store = cls()
+        store._restore(texts, positions, colour_codes, colour_names)
+        return store
+
+class LinkStore:
+    def __init__(self):
+        self._from_ids = _Column(np.int32)
+        self._to_ids = _Column(np.int32)
+        self._arrow_draws = _Column(np.int8)
+        self._colour_codes = _Column(np.int16)
+        self._second_colour_codes = _Column(np.int16)
+        self._colours = _Codes()
+
+    def __len__(self) -> int:
+        return len(self._from_ids)
+
+    @classmethod
+    def from_arrays(cls, from_ids: np.array, to_ids: np.array, arrow_draws: np.array, colour_codes: np.array, \
+                    second_colour_codes: np.array, colour_names: tp.List[str]) -> 'LinkStore':
+        """
+        A store holding the given columns as they are, e.g. loaded from a snapshot.
+        arrow_draws are ArrowDraw values with no BACK_ARROWs, as the arrow_draws property gives them.
+        """
+        columns = (from_ids, to_ids, arrow_draws, colour_codes, second_colour_codes)
+        if any(len(column) != len(from_ids) for column in columns):
+            raise ValueError("Link columns differ in length: {}".format([len(column) for column in columns]))
+
+        store = cls()
+        store._from_ids = _Column.of(np.ascontiguousarray(from_ids, dtype=np.int32))
+        store._to_ids = _Column.of(np.ascontiguousarray(to_ids, dtype=np.int32))
+        store._arrow_draws = _Column.of(np.ascontiguousarray(arrow_draws, dtype=np.int8))
+        store._colour_codes = _Column.of(np.ascontiguousarray(colour_codes, dtype=np.int16))
+        store._second_colour_codes = _Column.of(np.ascontiguousarray(second_colour_codes, dtype=np.int16))
+        store._colours = _Codes(colour_names)
+        return store
+
+    def __getitem__(self, index: int) -> 'Link':
+        if index < 0 or index >= len(self):
+            raise IndexError("{} out of range for {} links".format(index, len(self)))
+        return Link(self, index)
+
+    def __iter__(self):
+        return (Link(self, index) for index in range(len(self)))
+
+    def append(self, from_id: int, to_id: int, colour: str, arrow_draw: ArrowDraw, \
+               second_colour: tp.Optional[str] = None):
         if second_colour is not None and arrow_draw != ArrowDraw.DUAL_LINK:
             raise ValueError("second_colour is not None yet arrow_draw is not DUAL_LINK")
 
+        if arrow_draw == ArrowDraw.BACK_ARROW:
+            from_id, to_id = to_id, from_id
+            arrow_draw = ArrowDraw.FWD_ARROW
+
+        self._from_ids.append(from_id)
+        self._to_ids.append(to_id)
+        self._arrow_draws.append(arrow_draw.value)
+        self._colour_codes.append(self._colours.code_of(colour))
+        self._second_colour_codes.append(self._colours.code_of(second_colour)) # for DUAL_LINK
+
+    def extend(self, from_ids: np.array, to_ids: np.array, colours: tp.List[str], arrow_draws: tp.List[ArrowDraw]):
+        """
+        Appends many links at once. Dual links aren't supported here, use append() for those.
+        """
+        if ArrowDraw.DUAL_LINK in arrow_draws:
+            raise ValueError("DUAL_LINK needs a second_colour, add it with append()")
+
+        from_ids = np.asarray(from_ids)
+        to_ids = np.asarray(to_ids)
+        arrow_values = np.array([arrow_draw.value for arrow_draw in arrow_draws], dtype=np.int8)
+        backwards = arrow_values == ArrowDraw.BACK_ARROW.value
+
+        self._from_ids.extend(np.where(backwards, to_ids, from_ids))
+        self._to_ids.extend(np.where(backwards, from_ids, to_ids))
+        self._arrow_draws.extend(np.where(backwards, ArrowDraw.FWD_ARROW.value, arrow_values))
+        self._colour_codes.extend([self._colours.code_of(colour) for colour in colours])
+        self._second_colour_codes.extend(np.full(len(from_ids), -1))
+
+    @property
+    def from_ids(self) -> np.array:
+        return self._from_ids.array
+
+    @property
+    def to_ids(self) -> np.array:
+        return self._to_ids.array
+
+    @property
+    def arrow_draws(self) -> np.array:
+        """
+        ArrowDraw values; BACK_ARROW never appears since those links are stored flipped.
+        """
+        return self._arrow_draws.array
+
+    @property
+    def colour_codes(self) -> np.array:
+        return self._colour_codes.array
+
+    @property
+    def second_colour_codes(self) -> np.array:
+        """
+        -1 unless the link is a DUAL_LINK.
+        """
+        return self._second_colour_codes.array
+
+    @property
+    def colour_names(self) -> tp.List[str]:
+        return self._colours.names
+
+class Node:
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store: NodeStore, index: int):
+        self._store = store
+        self._index = index
+
+    @property
+    def node_id(self) -> int:
+        return self._index # see formation.FormationManager.add_node()
+
+    @property
+    def text(self) -> str:
+        return self._store.texts[self._index]
+
+    @property
+    def pos(self) -> np.array:
+        return self._store.positions[self._index].copy()
+
+    @property
+    def colour(self) -> str:
+        # see translator.ModelToViewTranslator._get_colours()
+        return self._store.colour_names[self._store.colour_codes[self._index]]
+
+    @property
+    def multibox(self) -> bool:
+        return bool(self._store.multiboxes[self._index])
+
+class Link:
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store: LinkStore, index: int):
+        self._store = store
+        self._index = index
+
+    @property
+    def from_model_node_id(self) -> int:
+        return int(self._store.from_ids[self._index])
+
+    @property
+    def to_model_node_id(self) -> int:
+        return int(self._store.to_ids[self._index])
+
+    @property
+    def arrow_draw(self) -> ArrowDraw:
+        return ArrowDraw(int(self._store.arrow_draws[self._index]))
+
+    @property
+    def colour(self) -> str:
+        return self._store.colour_names[self._store.colour_codes[self._index]]
+
+    @property
+    def second_colour(self) -> tp.Optional[str]:
+        code = self._store.second_colour_codes[self._index]
+        return None if code < 0 else self._store.colour_names[code]
+
 class Label:
     """
     Nodes that are drawn under (instead of over) everything else.
     """
-    def __init__(self, text: str, pos: tp.Tuple[int, int], colour: str):
-        self.text = text
-        self.pos = pos
-        self.colour = colour
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store: LabelStore, index: int):
+        self._store = store
+        self._index = index
+
+    @property
+    def text(self) -> str:
+        return self._store.texts[self._index]
+
+    @property
+    def pos(self) -> np.array:
+        return self._store.positions[self._index].copy()
+
+    @property
+    def colour(self) -> str:
+        return self._store.colour_names[self._store.colour_codes[self._index]]
+
+NodeStore._view_type = Node
+LabelStore._view_type = Label
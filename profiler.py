@@ -0,0 +1,115 @@
+"""
+Per-frame timings and counters, to find out which part of drawing a stutter comes from
+"""
+
+import time
+import typing as tp
+from collections import deque, defaultdict
+from contextlib import contextmanager
+import numpy as np
+
+class FrameStats:
+    """
+    Phases are timed and counters added up over a frame, then end_frame() files the frame away
+    with the last window of them. Phases can nest, e.g. links within tiles; each is timed on its own.
+    Times are in seconds.
+    """
+    def __init__(self, window: int=120):
+        self._frames = deque(maxlen=window)
+        self._times = defaultdict(float)
+        self._counts = defaultdict(int)
+        self._watched = {}
+        self._last_watched = {}
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._times[name] += time.perf_counter() - start
+
+    def count(self, name: str, amount: int=1):
+        self._counts[name] += amount
+
+    def watch(self, name: str, read: tp.Callable[[], int]):
+        """
+        Counts name by how much read(), a running total kept elsewhere, went up each frame.
+        """
+        self._watched[name] = read
+        self._last_watched[name] = read()
+
+    def start_frame(self):
+        """
+        Drops whatever was timed or counted since the last frame ended, e.g. while idle.
+        """
+        self._times.clear()
+        self._counts.clear()
+        for name, read in self._watched.items():
+            self._last_watched[name] = read()
+
+    def end_frame(self):
+        for name, read in self._watched.items():
+            total = read()
+            self._counts[name] += total - self._last_watched[name]
+            self._last_watched[name] = total
+        self._frames.append((dict(self._times), dict(self._counts)))
+        self._times.clear()
+        self._counts.clear()
+
+    def percentiles(self, name: str, percents: tp.Sequence[float]=(50, 95, 99)) -> tp.Optional[np.array]:
+        """
+        Of the time spent in phase name per frame, over the frames kept; frames that never
+        entered the phase count as 0. None before the first frame.
+        """
+        if not self._frames:
+            return None
+        return np.percentile([times.get(name, 0.0) for times, _ in self._frames], percents)
+
+    def last_count(self, name: str) -> int:
+        """
+        From the last frame that counted name at all, e.g. the last one that drew something.
+        """
+        for _, counts in reversed(self._frames):
+            if name in counts:
+                return counts[name]
+        return 0
+
+    def total_count(self, name: str) -> int:
+        """
+        Over the frames kept.
+        """
+        return sum(counts.get(name, 0) for _, counts in self._frames)
+
+    def phases(self) -> tp.List[str]:
+        """
+        Every phase timed in the frames kept, in the order they were first seen.
+        """
+        names = {}
+        for times, _ in self._frames:
+            names.update(dict.fromkeys(times))
+        return list(names)
+
+    def summary_lines(self, percents: tp.Sequence[float]=(50, 95, 99)) -> tp.List[str]:
+        """
+        A few lines of text for the on-screen overlay.
+        """
+        lines = ["{} frames    {}".format(len(self._frames), "  ".join("p{:g}".format(percent) for percent in percents))]
+        for name in self.phases():
+            lines.append("{:<10}{}  ms".format(name, "".join("{:>7.1f}".format(1000 * value)
+                                                           for value in self.percentiles(name, percents))))
+
+        lines.append("{} surfaces drawn on, e.g. tiles".format(self.last_count("surfaces")))
+        for kind in ("labels", "nodes", "links"):
+            lines.append("{:<10}{} drawn, {} culled".format(kind, self.last_count(kind + "_drawn"),
+                                                          self.last_count(kind + "_culled")))
+        lines.append("{:<10}{} drawn".format("clusters", self.last_count("clusters_drawn")))
+
+        hits = self.total_count("text_hits")
+        lookups = hits + self.total_count("text_misses")
+        if lookups:
+            lines.append("text cache {:.1f}% hits of {}".format(100 * hits / lookups, lookups))
+        return lines
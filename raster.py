@@ -0,0 +1,208 @@
+"""
+Batched drawing straight into a surface's pixels, for when there is too much to draw one pygame call at a time
+"""
+
+import typing as tp
+import numpy as np
+import pygame
+
+def mapped_colours(surface, rgbs: np.array) -> np.array:
+    """
+    (N,3) RGB rows as the surface's own pixel values, the vectorised form of surface.map_rgb().
+    """
+    rgbs = np.asarray(rgbs, dtype=np.int64).reshape(-1, 3)
+    shifts = surface.get_shifts()
+    losses = surface.get_losses()
+    mapped = np.full(len(rgbs), surface.get_masks()[3], dtype=np.int64) # opaque, if there is alpha
+    for channel in range(3):
+        mapped |= (rgbs[:,channel] >> losses[channel]) << shifts[channel]
+    return mapped
+
+def clip_lines(starts: np.array, ends: np.array, size: tp.Tuple[int, int]) -> tp.Tuple[np.array, np.array, np.array]:
+    """
+    Liang-Barsky: the part of each start->end within (0, 0)-(size - 1), and a mask of those that have one.
+    """
+    deltas = ends - starts
+    lows = np.zeros(len(starts))
+    highs = np.ones(len(starts))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for axis in (0, 1):
+            # Parallel lines are either wholly inside this pair of edges or wholly outside
+            limit = size[axis] - 1
+            parallel = deltas[:,axis] == 0
+            outside = parallel & ((starts[:,axis] < 0) | (starts[:,axis] > limit))
+            highs[outside] = -1
+
+            enter = (np.where(deltas[:,axis] > 0, 0, limit) - starts[:,axis]) / deltas[:,axis]
+            leave = (np.where(deltas[:,axis] > 0, limit, 0) - starts[:,axis]) / deltas[:,axis]
+            lows = np.where(parallel, lows, np.maximum(lows, enter))
+            highs = np.where(parallel, highs, np.minimum(highs, leave))
+
+    visible = lows <= highs
+    return starts + deltas * lows[:, np.newaxis], starts + deltas * highs[:, np.newaxis], visible
+
+def draw_points(surface, centers: np.array, rgbs: np.array, size: int):
+    """
+    A size by size square of pixels at each of centers, coloured by the matching row of rgbs.
+    """
+    if len(centers) == 0:
+        return
+    offsets = np.arange(size) - size // 2
+    xs = (np.round(centers[:,0]).astype(np.int64)[:, np.newaxis, np.newaxis] + offsets[:, np.newaxis]).repeat(size, 2)
+    ys = (np.round(centers[:,1]).astype(np.int64)[:, np.newaxis, np.newaxis] + offsets).repeat(size, 1)
+    rows = np.broadcast_to(np.arange(len(centers))[:, np.newaxis, np.newaxis], xs.shape)
+    _set_pixels(surface, xs.reshape(-1), ys.reshape(-1), rgbs, rows.reshape(-1))
+
+def draw_lines(surface, starts: np.array, ends: np.array, rgbs: np.array, width: int=1, \
+               max_pixels: int=1 << 20, max_batched_pixels: int=48):
+    """
+    Lines width pixels wide, unantialiased, in the pixels pygame.draw.line() would give them: a Bresenham
+    line from the start, thickened across its shorter axis. Only lines that leave the surface can come
+    out a pixel apart, since pygame rasterises what is left of them once clipped, which isn't quite the
+    same line.
+
+    Lines of up to max_batched_pixels pixels on the surface, e.g. arrowheads and most links once zoomed
+    out, are drawn together, max_pixels at a time so memory use stays bounded. pygame's own line drawing
+    is quicker for longer ones, so they are drawn first, one call each. Otherwise later lines are drawn
+    over earlier ones.
+    """
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+    # e.g. the arrowheads of a link with both ends in one place
+    drawable = np.isfinite(starts).all(axis=1) & np.isfinite(ends).all(axis=1)
+    starts = np.floor(starts[drawable]).astype(np.int64)
+    ends = np.floor(ends[drawable]).astype(np.int64)
+    rgbs = np.asarray(rgbs).reshape(-1, 3)[drawable]
+    size = surface.get_size()
+
+    # Widened by the line width, so lines just off the surface still get their edge drawn
+    _, _, visible = clip_lines((starts + width).astype(float), (ends + width).astype(float),
+                               (size[0] + 2 * width, size[1] + 2 * width))
+    steps = _Steps(starts[visible], ends[visible], size)
+    rgbs = rgbs[visible]
+
+    long = steps.counts * width > max_batched_pixels
+    for start, end, rgb in zip(steps.starts[long].tolist(), steps.ends[long].tolist(), rgbs[long].tolist()):
+        pygame.draw.line(surface, rgb, start, end, width)
+
+    batched = np.flatnonzero(~long & (steps.counts > 0))
+    num_pixels = np.cumsum(steps.counts[batched] * width)
+    colours = mapped_colours(surface, rgbs) if surface.get_bytesize() in (2, 4) else None
+    first = 0
+    while first < len(batched):
+        done = num_pixels[first - 1] if first else 0
+        last = first + max(1, int(np.searchsorted(num_pixels[first:] - done, max_pixels, side='right')))
+        _draw_line_pixels(surface, steps, batched[first:last], rgbs, colours, width)
+        first = last
+
+class _Steps:
+    """
+    The Bresenham steps of lines along their longer axis, the major one, with the range of steps
+    that land on the surface along it worked out.
+    """
+    def __init__(self, starts: np.array, ends: np.array, size: tp.Tuple[int, int]):
+        self.starts = starts
+        self.ends = ends
+        deltas = np.abs(ends - starts)
+        signs = np.where(ends > starts, 1, -1)
+        # Ties go to y, as they do in pygame
+        self.x_major = deltas[:,0] > deltas[:,1]
+        major = np.where(self.x_major, 0, 1)
+        rows = np.arange(len(starts))
+
+        self.major_starts = starts[rows, major]
+        self.minor_starts = starts[rows, 1 - major]
+        self.major_signs = signs[rows, major]
+        self.minor_signs = signs[rows, 1 - major]
+        self.major_deltas = deltas[rows, major]
+        self.minor_deltas = deltas[rows, 1 - major]
+
+        limits = np.array(size)[major] - 1
+        forward = self.major_signs > 0
+        self.firsts = np.maximum(0, np.where(forward, -self.major_starts, self.major_starts - limits))
+        self.lasts = np.minimum(self.major_deltas, np.where(forward, limits - self.major_starts, self.major_starts))
+        self.counts = np.maximum(0, self.lasts - self.firsts + 1)
+
+    def minor_nums(self, lines: np.array, nums: np.array, counts: np.array) -> np.array:
+        """
+        How many steps along the minor axis lines have taken after nums steps along the major one;
+        nums holds counts of them for each line in turn.
+        """
+        # Bresenham's error term starts at half the major delta and wraps every major delta
+        major_deltas = self.major_deltas[lines]
+        return -((np.repeat(major_deltas // 2, counts) - nums * np.repeat(self.minor_deltas[lines], counts)) \
+                 // np.repeat(np.maximum(major_deltas, 1), counts))
+
+def _draw_line_pixels(surface, steps: _Steps, lines: np.array, rgbs: np.array, colours: tp.Optional[np.array], \
+                      width: int):
+    counts = steps.counts[lines]
+    nums = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts - steps.firsts[lines], counts)
+    surface_width, surface_height = surface.get_size()
+    x_major = steps.x_major[lines]
+    minor_sizes = np.where(x_major, surface_height, surface_width)
+
+    majors = np.repeat(steps.major_starts[lines], counts) + np.repeat(steps.major_signs[lines], counts) * nums
+    minors = np.repeat(steps.minor_starts[lines], counts) \
+           + np.repeat(steps.minor_signs[lines], counts) * steps.minor_nums(lines, nums, counts)
+    # Majors are on the surface already; minors that aren't stay off it, and both then fit in 32 bits
+    majors = majors.astype(np.int32)
+    minors = np.clip(minors, -width, np.repeat(minor_sizes, counts) + width).astype(np.int32)
+
+    # Thickened as pygame does, one pixel more to the positive side for even widths
+    minors = minors[:, np.newaxis] + np.arange(-((width - 1) // 2), width // 2 + 1, dtype=np.int32)
+    major_strides = np.repeat(np.where(x_major, 1, surface_width).astype(np.int32), counts)
+    minor_strides = np.repeat(np.where(x_major, surface_width, 1).astype(np.int32), counts)
+    indices = (minors * minor_strides[:, np.newaxis] + (majors * major_strides)[:, np.newaxis]).reshape(-1)
+
+    # Only checked pixel by pixel if some line runs off across its minor axis, which its ends show
+    ends = [steps.minor_starts[lines] + steps.minor_signs[lines] * steps.minor_nums(lines, nums_at[lines], 1)
+            for nums_at in (steps.firsts, steps.lasts)]
+    inside = None
+    if np.any(np.minimum(*ends) - (width - 1) // 2 < 0) or np.any(np.maximum(*ends) + width // 2 >= minor_sizes):
+        inside = ((minors >= 0) & (minors < np.repeat(minor_sizes, counts)[:, np.newaxis])).reshape(-1)
+        indices = indices[inside]
+
+    if colours is not None:
+        values = np.repeat(colours[lines], counts * width)
+        _set_pixel_values(surface, indices, values if inside is None else values[inside])
+    else:
+        rows = np.repeat(lines, counts * width)
+        _set_pixel_rgbs(surface, indices, rgbs, rows if inside is None else rows[inside])
+
+def _set_pixels(surface, xs: np.array, ys: np.array, rgbs: np.array, rows: np.array):
+    """
+    Colours pixel (xs[i], ys[i]) with rgbs[rows[i]], skipping any off the surface.
+    """
+    width, height = surface.get_size()
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    xs = xs[inside]
+    ys = ys[inside]
+    rows = rows[inside]
+
+    if surface.get_bytesize() in (2, 4):
+        _set_pixel_values(surface, ys * width + xs, mapped_colours(surface, rgbs)[rows])
+    else:
+        _set_pixel_rgbs(surface, ys * width + xs, rgbs, rows)
+
+def _set_pixel_values(surface, indices: np.array, values: np.array):
+    """
+    Sets pixel indices[i], counted row by row across a surface with 2 or 4 bytes per pixel, to values[i],
+    in the surface's own pixel format, see mapped_colours().
+    """
+    pixels = pygame.surfarray.pixels2d(surface).T
+    if pixels.flags.c_contiguous:
+        pixels.reshape(-1)[indices] = values
+    else:
+        # Rows are padded
+        pixels[indices // pixels.shape[1], indices % pixels.shape[1]] = values
+    del pixels # unlocks the surface
+
+def _set_pixel_rgbs(surface, indices: np.array, rgbs: np.array, rows: np.array):
+    """
+    Colours pixel indices[i] with rgbs[rows[i]] one at a time, for 8 and 24 bit surfaces,
+    which can't be viewed as one RGB int per pixel.
+    """
+    width = surface.get_width()
+    colours = [tuple(rgb) for rgb in np.asarray(rgbs).tolist()]
+    for index, row in zip(indices.tolist(), rows.tolist()):
+        surface.set_at((index % width, index // width), colours[row])
@@ -1,76 +1,137 @@
 import typing as tp
+from collections import OrderedDict
 import pygame
 from pygame.locals import *
 import numpy as np
-import math
-
 from model import ArrowDraw
-import angles
+from view import ViewTransform
+from geometry import Boxes, LinkGeometry, LinkSegmentCache
+from text import TextSurfaceCache
+from cluster import GridClusters
+import raster
 import config as cfg
 
+# One per zoom level that shows text
+TEXT_FONT_SIZES = (cfg.big_font_size, cfg.small_font_size, cfg.tiny_font_size)
+
+def text_sizes_of(texts: tp.List[str], text_cache: TextSurfaceCache) -> np.array:
+    """
+    (N,len(TEXT_FONT_SIZES),2) width and height of each text at each font size; 0s for empty texts,
+    which aren't drawn.
+    """
+    sizes = np.zeros((len(texts), len(TEXT_FONT_SIZES), 2), dtype=np.int32)
+    for index, text in enumerate(texts):
+        if text:
+            sizes[index] = [text_cache.size_of(text, font_size) for font_size in TEXT_FONT_SIZES]
+    return sizes
+
+def box_half_extents(text_sizes: np.array, has_text: np.array, multiboxes: np.array, zoom_out_level: int) -> np.array:
+    """
+    Node.view_half_extent() for many nodes at once, from text_sizes_of() their texts.
+    """
+    if zoom_out_level < len(TEXT_FONT_SIZES):
+        sizes = text_sizes[:, zoom_out_level].astype(float)
+    else:
+        sizes = (text_sizes[:, 0] // 2 ** zoom_out_level).astype(float)
+
+    sizes += np.array([cfg.x_border_size // 2 ** zoom_out_level, cfg.y_border_size // 2 ** zoom_out_level]) * 2
+    sizes[multiboxes] *= 1 + 2/cfg.multibox_factor
+    sizes[~has_text] = 0
+    return sizes / 2
+
 class Node:
-    def __init__(self, text: tp.Optional[str], big_font, small_font, tiny_font, \
-                 pos: tp.Tuple[int, int], colour: tp.Tuple[int, int, int], \
+    def __init__(self, text: tp.Optional[str], text_cache: TextSurfaceCache, \
+                 view_positions: np.array, index: int, transform: ViewTransform, \
+                 colour: tp.Tuple[int, int, int], \
                  background: tp.Tuple[int, int, int], \
-                 bounds_check: tp.Callable[[tp.Tuple[int, int, int, int]], bool], multibox: bool):
+                 bounds_check: tp.Callable[[tp.Tuple[int, int], tp.Tuple[int, int, int, int]], bool], multibox: bool, \
+                 text_sizes: tp.Optional[tp.List[tp.Tuple[int, int]]]=None):
+        """
+        view_positions is owned by whoever owns the transform and kept up to date by them;
+        this node's view position is row index of it. bounds_check(surface_size, rect) says whether
+        a box is on the surface being drawn on.
+
+        Text is only rendered, through text_cache, when drawn at a zoom level; until then
+        only its size at each level is known. It is measured here unless text_sizes gives it
+        for each of TEXT_FONT_SIZES already.
+        """
         self._text = text
+        self._text_cache = text_cache
+        self._colour = colour
         self._background = background
-        self._model_pos = pos
-        self._view_pos = pos
-        self._new_view_pos = None
+        self._view_positions = view_positions
+        self._index = index
+        self._transform = transform
         self.x_border = cfg.x_border_size
         self.y_border = cfg.y_border_size
         self._bounds_check = bounds_check
         self._multibox = multibox
-        self._zoom_out_level = 0
-
-        self._big_text_surface = self._render_text_surface(text, big_font, colour, background)
-        self._small_text_surface = self._render_text_surface(text, small_font, colour, background)
-        self._tiny_text_surface = self._render_text_surface(text, tiny_font, colour, background)
-        self._current_text_surface = self._big_text_surface
         self._multibox_factor = cfg.multibox_factor
 
-    def _render_text_surface(self, text: tp.Optional[str], font, colour: tp.Tuple[int, int, int], \
-                             background: tp.Tuple[int, int, int]) -> tp.Optional[pygame.Surface]:
+        self._font_sizes = TEXT_FONT_SIZES
         if not text:
-            return None
-        # antialias = True
-        if '\n' not in text:
-            return font.render(text, True, colour, background)
-
-        line_surfs = []
-        total_height = 0
-        max_width = 0
-        for line in text.strip().split('\n'):
-            surf = font.render(line, True, colour, background)
-            total_height += surf.get_height()
-            max_width = max(max_width, surf.get_width())
-            line_surfs.append(surf)
-
-        out_surf = pygame.Surface((max_width, total_height))
-        out_surf.fill(background)
-        y = 0
-        for surf in line_surfs:
-            x = (max_width - surf.get_width()) / 2
-            out_surf.blit(surf, (x,y))
-            y += surf.get_height()
-
-        return out_surf
-
-    def draw_on(self, surface):
-        if self._current_text_surface is None:
-            return
+            self._text_sizes = None
+        elif text_sizes is not None:
+            self._text_sizes = text_sizes
+        else:
+            self._text_sizes = [text_cache.size_of(text, font_size) for font_size in self._font_sizes]
+
+    @property
+    def has_text(self) -> bool:
+        return self._text_sizes is not None
+
+    def model_half_extent(self, max_zoom_level: int) -> tp.Tuple[float, float]:
+        """
+        Half the width and height of the drawn box in model units, taking whichever zoom level
+        up to max_zoom_level makes it the largest.
+        """
+        half_width = 0
+        half_height = 0
+        for zoom_out_level in range(max_zoom_level+1):
+            view_half_width, view_half_height = self.view_half_extent(zoom_out_level)
+            half_width = max(half_width, view_half_width * 2 ** zoom_out_level)
+            half_height = max(half_height, view_half_height * 2 ** zoom_out_level)
+
+        return half_width, half_height
+
+    def view_half_extent(self, zoom_out_level: int) -> tp.Tuple[float, float]:
+        """
+        Half the width and height of the drawn box in pixels at the given zoom level,
+        the same box as box_bounds. (0, 0) if nothing is drawn.
+        """
+        text_size = self._text_size_at(zoom_out_level)
+        if text_size is None:
+            return 0, 0
+
+        width = text_size[0] + (self.x_border // 2 ** zoom_out_level) * 2
+        height = text_size[1] + (self.y_border // 2 ** zoom_out_level) * 2
+        if self._multibox:
+            width *= 1 + 2/self._multibox_factor
+            height *= 1 + 2/self._multibox_factor
+
+        return width / 2, height / 2
+
+    def draw_on(self, surface) -> bool:
+        """
+        Returns whether the node was drawn, i.e. has a box and it is on surface.
+        """
+        if self._current_text_size is None:
+            return False
 
         adjusted_pos = self._adjust_view_pos_for_centering_box()
         border = self._border_dimen(adjusted_pos)
-        if self._bounds_check(border):
-            pygame.draw.rect(surface, self._background, border)
-            if self._multibox:
-                pygame.draw.rect(surface, self._background, self._offset_border_by( \
-                    border, ( border[2]/self._multibox_factor,  border[3]/self._multibox_factor) ))
-                pygame.draw.rect(surface, self._background, self._offset_border_by( \
-                    border, (-border[2]/self._multibox_factor, -border[3]/self._multibox_factor) ))
+        if not self._bounds_check(surface.get_size(), border):
+            return False
+
+        pygame.draw.rect(surface, self._background, border)
+        if self._multibox:
+            pygame.draw.rect(surface, self._background, self._offset_border_by( \
+                border, ( border[2]/self._multibox_factor,  border[3]/self._multibox_factor) ))
+            pygame.draw.rect(surface, self._background, self._offset_border_by( \
+                border, (-border[2]/self._multibox_factor, -border[3]/self._multibox_factor) ))
+        if self._shows_text(self._transform.zoom_out_level):
             surface.blit(self._current_text_surface, adjusted_pos)
+        return True
 
     def _offset_border_by(self, border_dimen: tp.Tuple[int, int, int, int], \
                           border_offset: tp.Tuple[int, int]) -> tp.Tuple[int, int, int, int]:
@@ -79,97 +140,45 @@ class Node:
                 border_dimen[2], border_dimen[3])
 
     def _adjust_view_pos_for_centering_box(self) -> tp.Tuple[int, int]:
-        text_rect = self._current_text_surface.get_rect()
-        return (self._view_pos[0] - text_rect.width/2, \
-                self._view_pos[1] - text_rect.height/2)
-
-    def consider_new_offset(self, offset: tp.Tuple[int, int]) -> bool:
-        """
-        Returns True if the node would appear on the screen given the new offset.
-        """
-        new_view_pos_at_full_zoom = (self._model_pos[0] + offset[0], self._model_pos[1] + offset[1])
-        self._new_view_pos = (new_view_pos_at_full_zoom[0] // 2 ** self._zoom_out_level,
-                              new_view_pos_at_full_zoom[1] // 2 ** self._zoom_out_level)
-
-        if self._current_text_surface is None:
-            return False
-
-        new_border = self._border_dimen(self._new_view_pos)
-        return self._bounds_check(new_border)
-
-    def accept_new_offset(self):
-        self._view_pos = self._new_view_pos
+        text_size = self._current_text_size
+        view_pos = self.center
+        return (view_pos[0] - text_size[0]/2, \
+                view_pos[1] - text_size[1]/2)
 
     def _border_dimen(self, view_pos: tp.Tuple[int, int]) -> tp.Tuple[int, int, int, int]:
-        text_rect = self._current_text_surface.get_rect()
-        x_border = self.x_border // 2 ** self._zoom_out_level
-        y_border = self.y_border // 2 ** self._zoom_out_level
+        text_size = self._current_text_size
+        x_border = self._transform.scaled(self.x_border)
+        y_border = self._transform.scaled(self.y_border)
         return (view_pos[0]-x_border, view_pos[1]-y_border, \
-                text_rect.width + x_border * 2, text_rect.height + y_border * 2)
-
-    def zoom_out(self):
-        self._zoom_out_level += 1
-        self._select_text_surface_for_zoom_level()
-        self._view_pos = (self._view_pos[0] // 2, self._view_pos[1] // 2)
-
-    def zoom_in(self):
-        self._zoom_out_level -= 1
-        self._select_text_surface_for_zoom_level()
-        self._view_pos = (self._view_pos[0] * 2, self._view_pos[1] * 2)
-
-    def _select_text_surface_for_zoom_level(self):
-        if self._zoom_out_level == 0:
-            self._current_text_surface = self._big_text_surface
-        elif self._zoom_out_level == 1:
-            self._current_text_surface = self._small_text_surface
-        elif self._zoom_out_level == 2:
-            self._current_text_surface = self._tiny_text_surface
-        else:
-            raise ValueError("Unknown zoom level: {}".format(self._zoom_out_level))
-
-    def get_intersection_point_to_link(self, link_from: np.array, link_to: np.array \
-                                      ) -> tp.Tuple[float, np.array]:
-        """
-        Get the fraction of the relative link vector to the intersection and the actual coordinates for it
-        between the link and the node's rectangle.
-
-        link_from and link_to assume the link is pointing from this node to somewhere else.
-        It's up to the caller to flip the results if the link is actually the reverse.
-        """
-        if self._current_text_surface is None:
-            return 0, np.array(self.center)
-
-        box_bounds = self.box_bounds
-
-        top_left_vec2 = np.array((box_bounds[0], box_bounds[1]))
-        top_right_vec2 = np.array((box_bounds[0]+box_bounds[2], box_bounds[1]))
-        bottom_right_vec2 = np.array((box_bounds[0]+box_bounds[2], box_bounds[1]+box_bounds[3]))
-        bottom_left_vec2 = np.array((box_bounds[0], box_bounds[1]+box_bounds[3]))
-
-        top_left_bear, top_right_bear, bottom_right_bear, bottom_left_bear = \
-            self._get_bearings_of_corners( top_left_vec2 )
+                text_size[0] + x_border * 2, text_size[1] + y_border * 2)
 
-        link_rel_vec2 = link_to - link_from
-        link_bear = angles.get_bearing_rad_of( \
-                        angles.flip_y(link_rel_vec2) )
+    @property
+    def _current_text_size(self) -> tp.Optional[tp.Tuple[int, int]]:
+        return self._text_size_at(self._transform.zoom_out_level)
 
-        if link_bear >= top_right_bear and link_bear < top_left_bear:
-            return angles.line_intersection(top_left_vec2, top_right_vec2, link_from, link_to)
-        elif link_bear >= top_left_bear and link_bear < bottom_left_bear:
-            return angles.line_intersection(bottom_left_vec2, top_left_vec2, link_from, link_to)
-        elif link_bear >= bottom_left_bear and link_bear < bottom_right_bear:
-            return angles.line_intersection(bottom_right_vec2, bottom_left_vec2, link_from, link_to)
-        else:
-            return angles.line_intersection(top_right_vec2, bottom_right_vec2, link_from, link_to)
+    def _shows_text(self, zoom_out_level: int) -> bool:
+        return zoom_out_level < len(self._font_sizes)
 
-    def _get_bearings_of_corners(self, rect_top_left: np.array) -> tp.Tuple[float, float, float, float]:
-        top_left = angles.get_bearing_rad_of( \
-                        angles.flip_y(rect_top_left - self.center) )
-        top_right = math.pi - top_left
-        bottom_right = math.pi + top_left
-        bottom_left = math.pi + top_right
+    def _text_size_at(self, zoom_out_level: int) -> tp.Optional[tp.Tuple[int, int]]:
+        """
+        Past the zoom levels with a font of their own, boxes are drawn without text as big
+        as the text at full zoom would be.
+        """
+        if zoom_out_level < 0 or zoom_out_level > cfg.lod_box_zoom_level:
+            raise ValueError("Unknown zoom level: {}".format(zoom_out_level))
+        if self._text_sizes is None:
+            return None
+        if self._shows_text(zoom_out_level):
+            return self._text_sizes[zoom_out_level]
+        full_size = self._text_sizes[0]
+        return (full_size[0] // 2 ** zoom_out_level, full_size[1] // 2 ** zoom_out_level)
 
-        return top_left, top_right, bottom_right, bottom_left
+    @property
+    def _current_text_surface(self) -> tp.Optional[pygame.Surface]:
+        if self._text_sizes is None or not self._shows_text(self._transform.zoom_out_level):
+            return None
+        font_size = self._font_sizes[self._transform.zoom_out_level]
+        return self._text_cache.surface_for(self._text, font_size, self._colour, self._background)
 
     @property
     def width(self) -> int:
@@ -180,12 +189,12 @@ class Node:
         return self.border_details[3]
 
     @property
-    def center(self) -> tp.Tuple[int, int]:
-        return self._view_pos
+    def center(self) -> np.array:
+        return self._view_positions[self._index]
 
     @property
     def box_bounds(self) -> tp.Optional[tp.Tuple[int, int, int, int]]:
-        if self._current_text_surface is None:
+        if self._current_text_size is None:
             return None
 
         border_dimen = self._border_dimen(self._adjust_view_pos_for_centering_box())
@@ -196,124 +205,195 @@ class Node:
                             border_dimen[3] * (1 + 2/self._multibox_factor))
         return border_dimen
 
-class Link:
-    def __init__(self, from_node: Node, to_node: Node, colour: tp.Tuple[int, int, int], width: int, \
-                 arrow_draw: ArrowDraw, \
-                 bounds_check: tp.Callable[[tp.Tuple[int, int], tp.Tuple[int, int]], bool], \
-                 second_colour: tp.Optional[tp.Tuple[int, int, int]]):
-        self._from_node = from_node
-        self._to_node = to_node
-        self._colour = colour
-        self._second_colour = second_colour # If not None, draw dual link
-        self._width = width
-        self._arrowhead_length = cfg.link_arrowhead_length
-        self._arrow_draw = arrow_draw
-        self._dual_link_gap = cfg.dual_link_gap
-        self._bounds_check = bounds_check
-        self._zoom_out_level = 0
-
-    def draw_on(self, surface):
-        from_coord = self._from_node.center
-        to_coord = self._to_node.center
-        if self._bounds_check(from_coord, to_coord):
-            if self._second_colour is None:
-                if self._draw_arrowhead(surface, from_coord, to_coord):
-                    pygame.draw.line(surface, self._colour, from_coord, to_coord, self._width)
-            else:
-                if self._draw_arrowhead(surface, from_coord, to_coord, dry_run=True):
-                    self._draw_dual_link(surface, from_coord, to_coord)
-
-    def _draw_arrowhead(self, surface, from_coord: tp.Tuple[int, int], to_coord: tp.Tuple[int, int], \
-                        dry_run: bool=False, is_second_link: bool=False) -> bool:
+class LinkLayer:
+    """
+    Every link of the graph. The geometry of all the links being drawn is worked out in one go
+    by geometry.LinkGeometry, so drawing only hands precomputed coordinates to pygame.
+    """
+    def __init__(self, from_nodes: np.array, to_nodes: np.array, \
+                 colour_codes: np.array, second_colour_codes: np.array, palette: np.array, \
+                 arrow_draws: np.array, width: int, transform: ViewTransform, \
+                 node_view_positions: np.array, node_half_extents: tp.Callable[[int], np.array], \
+                 node_has_box: np.array, \
+                 bounds_check: tp.Callable[[tp.Tuple[int, int], np.array, np.array], np.array]):
         """
-        Calculates where to draw the arrowhead based on where the link would be visible between
-        the two nodes, i.e. from the two intersection points.
-
-        Returns False if, during the above calculation, it discovers the nodes are overlapping.
-        That means the link would be entirely obscured.
+        from_nodes and to_nodes are rows of node_view_positions, which is kept up to date by the owner
+        of the transform. node_half_extents(zoom_out_level) gives rows of an (N,2) array for a zoom level
+        that draws boxes, see Node.view_half_extent(), indexed like one.
+        arrow_draws are ArrowDraw values. Colour codes are rows of palette, an (N,3) array of RGBs;
+        second_colour_codes are -1 but for DUAL_LINKs. bounds_check(surface_size, starts, ends) masks
+        the lines with an end on the surface being drawn on.
         """
+        self._from_nodes = from_nodes
+        self._to_nodes = to_nodes
+        self._colour_codes = colour_codes
+        self._second_colour_codes = second_colour_codes
+        self._palette = palette
+        self._is_dual = second_colour_codes >= 0
+        self._arrow_counts = np.select([arrow_draws == ArrowDraw.NO_ARROW.value,
+                                        arrow_draws == ArrowDraw.DOUBLE_ARROW.value], [0, 2], default=1)
+        self._full_zoom_width = width
+        self._transform = transform
+        self._node_view_positions = node_view_positions
+        self._node_half_extents = node_half_extents
+        self._node_has_box = node_has_box
+        self._bounds_check = bounds_check
+        self._segment_caches = OrderedDict() # zoom_out_level -> LinkSegmentCache
 
-        from_vec2 = angles.vec2(from_coord)
-        to_vec2 = angles.vec2(to_coord)
-
-        if not is_second_link:
-            rel_vec_frac_from, intersection_from = \
-                self._from_node.get_intersection_point_to_link(from_vec2, to_vec2)
-            rel_vec_frac_to, intersection_to = \
-                self._to_node.get_intersection_point_to_link(to_vec2, from_vec2)
-        else:
-            rel_vec_frac_from, intersection_from = \
-                self._to_node.get_intersection_point_to_link(to_vec2, from_vec2)
-            rel_vec_frac_to, intersection_to = \
-                self._from_node.get_intersection_point_to_link(from_vec2, to_vec2)
-        rel_vec_frac_to = 1 - rel_vec_frac_to
-
-        if rel_vec_frac_to < rel_vec_frac_from:
-            # The nodes have overlapped, the link would be completely obscured
-            return False
-
-        if dry_run or self._arrow_draw == ArrowDraw.NO_ARROW:
-            return True
-
-        rel_vec2 = intersection_to - intersection_from
-        draw_arrow_at = intersection_from + (rel_vec2 * 2 / 3)
-
-        left_endpoint, right_endpoint = self._get_arrow_endpoints(rel_vec2, draw_arrow_at)
-
-        colour = self._second_colour if is_second_link \
-            else self._colour
-
-        pygame.draw.line(surface, colour, draw_arrow_at, left_endpoint, self._width)
-        pygame.draw.line(surface, colour, draw_arrow_at, right_endpoint, self._width)
-
-        if not is_second_link and self._arrow_draw == ArrowDraw.DOUBLE_ARROW:
-            draw_arrow_at = intersection_from + (rel_vec2 * 1 / 3)
-
-            left_endpoint, right_endpoint = self._get_arrow_endpoints(-rel_vec2, draw_arrow_at)
-
-            pygame.draw.line(surface, colour, draw_arrow_at, left_endpoint, self._width)
-            pygame.draw.line(surface, colour, draw_arrow_at, right_endpoint, self._width)
-
-        return True
-
-    def _get_arrow_endpoints(self, rel_vec2: np.array, draw_arrow_at: np.array \
-                             ) -> tp.Tuple[np.array, np.array]:
-
-        left_unit_vec  = angles.flip_y( \
-                            angles.get_unit_vector_after_rotating( \
-                                angles.flip_y(rel_vec2), angles.deg_to_rad(150)) )
-        right_unit_vec = angles.flip_y( \
-                            angles.get_unit_vector_after_rotating( \
-                                angles.flip_y(rel_vec2), angles.deg_to_rad(210)) )
-
-        left_endpoint  = draw_arrow_at + left_unit_vec * self._arrowhead_length
-        right_endpoint = draw_arrow_at + right_unit_vec * self._arrowhead_length
-
-        return left_endpoint, right_endpoint
+    def __len__(self) -> int:
+        return len(self._colour_codes)
 
-    def _draw_dual_link(self, surface, from_coord: tp.Tuple[int, int], to_coord: tp.Tuple[int, int]):
-        from_coord = np.array(from_coord)
-        to_coord = np.array(to_coord)
+    @property
+    def _width(self) -> int:
+        # pygame draws nothing for lines less than a pixel wide
+        return max(1, self._transform.scaled(self._full_zoom_width))
 
-        left_from, left_to = \
-            angles.shift_pair_pos_by(from_coord, to_coord, self._dual_link_gap, to_left=True)
-        right_from, right_to = \
-            angles.shift_pair_pos_by(from_coord, to_coord, self._dual_link_gap, to_left=False)
+    @property
+    def _arrowhead_length(self) -> int:
+        return self._transform.scaled(cfg.link_arrowhead_length)
 
-        self._draw_arrowhead(surface, left_from, left_to)
-        pygame.draw.line(surface, self._colour, left_from, left_to, self._width)
+    @property
+    def _dual_link_gap(self) -> int:
+        return self._transform.scaled(cfg.dual_link_gap)
 
-        self._draw_arrowhead(surface, right_from, right_to, is_second_link=True)
-        pygame.draw.line(surface, self._second_colour, right_from, right_to, self._width)
+    def geometry_of(self, link_indices: np.array) -> LinkGeometry:
+        """
+        Where to draw link_indices at the current transform; the geometry's rows are theirs.
+        """
+        boxes = Boxes(self._node_view_positions,
+                      self._node_half_extents(self._transform.zoom_out_level),
+                      self._node_has_box)
+        return LinkGeometry(boxes, self._from_nodes[link_indices], self._to_nodes[link_indices],
+                            self._arrow_counts[link_indices], self._is_dual[link_indices],
+                            self._dual_link_gap, self._arrowhead_length)
+
+    def segments_of(self, link_indices: np.array) -> tp.Tuple[np.array, np.array, np.array, np.array]:
+        """
+        geometry_of(link_indices).segments(), without is_barb. While the offset is a whole number of view
+        pixels, as it always is for tiles, each link is only worked out once per zoom level, for the last
+        cfg.link_geometry_levels levels drawn.
+        """
+        offset = np.array(self._transform.offset)
+        divisor = self._transform.divisor
+        if np.any(offset % divisor):
+            starts, ends, rows, second, _ = self.geometry_of(link_indices).segments()
+            return starts, ends, rows, second
+
+        zoom_out_level = self._transform.zoom_out_level
+        cache = self._segment_caches.pop(zoom_out_level, None)
+        if cache is None:
+            cache = LinkSegmentCache()
+        self._segment_caches[zoom_out_level] = cache
+        while len(self._segment_caches) > cfg.link_geometry_levels:
+            self._segment_caches.popitem(last=False)
+
+        shift = offset // divisor
+        missing = cache.missing(link_indices)
+        if len(missing):
+            cache.add(missing, self.geometry_of(missing), shift)
+        return cache.take(link_indices, shift)
+
+    def draw_on(self, surface, link_indices: np.array, cull: bool=True) -> int:
+        """
+        Drops the links with neither end on screen, unless cull is False, then draws every line and
+        arrowhead of the rest with raster.draw_lines() in one batch, arrowheads first.
+        Returns how many links were drawn.
+        """
+        if cull:
+            on_screen = self._bounds_check(surface.get_size(),
+                                           self._node_view_positions[self._from_nodes[link_indices]],
+                                           self._node_view_positions[self._to_nodes[link_indices]])
+            link_indices = link_indices[on_screen]
 
-    def zoom_out(self):
-        self._zoom_out_level += 1
-        self._width //= 2
-        self._arrowhead_length //= 2
-        self._dual_link_gap //= 2
+        starts, ends, rows, second = self.segments_of(link_indices)
+        raster.draw_lines(surface, starts, ends, self._rgbs_of(link_indices[rows], second), self._width)
+        return len(link_indices)
 
-    def zoom_in(self):
-        self._zoom_out_level -= 1
-        self._width *= 2
-        self._arrowhead_length *= 2
-        self._dual_link_gap *= 2
+    def draw_thin_on(self, surface, link_indices: np.array, cull: bool=True) -> int:
+        """
+        Far out, links are one pixel lines centre to centre in their first colour, with no arrowheads
+        and no boxes to stop at, drawn in one batch. Returns how many links were drawn.
+        """
+        from_nodes = self._from_nodes[link_indices]
+        to_nodes = self._to_nodes[link_indices]
+        starts = self._node_view_positions[from_nodes]
+        ends = self._node_view_positions[to_nodes]
+        on_screen = self._bounds_check(surface.get_size(), starts, ends) if cull \
+               else np.ones(len(link_indices), dtype=bool)
+        raster.draw_lines(surface, starts[on_screen], ends[on_screen],
+                          self._palette[self._colour_codes[link_indices[on_screen]]])
+        return int(np.count_nonzero(on_screen))
+
+    def _rgbs_of(self, link_indices: np.array, second: np.array) -> np.array:
+        return self._palette[np.where(second, self._second_colour_codes[link_indices],
+                                      self._colour_codes[link_indices])]
+
+class ClusterLayer:
+    """
+    Far out, nodes are drawn grouped by cluster.GridClusters: one box per cluster showing how many nodes
+    are in it, or just a point for a cluster of one, under them one line per pair of linked clusters,
+    wider the more links it stands for.
+    """
+    def __init__(self, clusters: GridClusters, text_cache: TextSurfaceCache, transform: ViewTransform, \
+                 box_rgbs: np.array, text_rgbs: np.array, link_rgbs: np.array):
+        """
+        box_rgbs and text_rgbs are indexed by node colour code, link_rgbs by link colour code.
+        """
+        self._clusters = clusters
+        self._text_cache = text_cache
+        self._transform = transform
+        self._box_rgbs = box_rgbs
+        self._text_rgbs = text_rgbs
+        self._link_rgbs = link_rgbs
+
+    @staticmethod
+    def _overlapping(size: tp.Tuple[int, int], mins: np.array, maxs: np.array) -> np.array:
+        margin = cfg.cluster_cell_size
+        return (maxs[:,0] >= -margin) & (mins[:,0] <= size[0] + margin) \
+             & (maxs[:,1] >= -margin) & (mins[:,1] <= size[1] + margin)
+
+    def draw_on(self, surface, crossing_links: bool=False) -> int:
+        """
+        Links are drawn if either end is on the surface, or with crossing_links, if they cross it.
+        Only the clusters and links the level's grids find around the surface are transformed.
+        Returns how many clusters and links between them were drawn.
+        """
+        size = surface.get_size()
+        level = self._clusters.level(self._transform.zoom_out_level)
+        viewport = self._transform.model_viewport(size, margin=(cfg.cluster_cell_size * self._transform.divisor,) * 2)
+
+        links = level.link_grid.query(*viewport)
+        starts = self._transform.to_view(level.link_ends[level.link_froms[links]])
+        ends = self._transform.to_view(level.link_ends[level.link_tos[links]])
+        if crossing_links:
+            shown = self._overlapping(size, np.minimum(starts, ends), np.maximum(starts, ends))
+        else:
+            shown = self._overlapping(size, starts, starts) | self._overlapping(size, ends, ends)
+        links, starts, ends = links[shown], starts[shown], ends[shown]
+        widths = np.minimum(1 + np.log2(level.link_weights[links]).astype(int), cfg.cluster_max_link_width)
+        # Thinnest first, so the links standing for the most are drawn on top
+        for width in np.unique(widths).tolist():
+            same_width = widths == width
+            raster.draw_lines(surface, starts[same_width], ends[same_width],
+                              self._link_rgbs[level.link_colour_codes[links[same_width]]], width)
+
+        clusters = level.centre_grid.query(*viewport)
+        view_centres = self._transform.to_view(level.centres[clusters])
+        on_screen = self._overlapping(size, view_centres, view_centres)
+        clusters, view_centres = clusters[on_screen], view_centres[on_screen]
+
+        singles = level.counts[clusters] == 1
+        raster.draw_points(surface, view_centres[singles], self._box_rgbs[level.colour_codes[clusters[singles]]], \
+                           cfg.lod_point_size)
+
+        groups = clusters[level.counts[clusters] > 1]
+        group_centres = view_centres[level.counts[clusters] > 1]
+        for center, count, colour_code in zip(group_centres.tolist(), level.counts[groups].tolist(), \
+                                              level.colour_codes[groups].tolist()):
+            box_rgb = tuple(self._box_rgbs[colour_code])
+            text_surface = self._text_cache.surface_for(str(count), cfg.small_font_size, \
+                                                        tuple(self._text_rgbs[colour_code]), box_rgb)
+            text_rect = text_surface.get_rect(center=center)
+            pygame.draw.rect(surface, box_rgb, text_rect.inflate(cfg.x_border_size // 4, cfg.y_border_size // 4))
+            surface.blit(text_surface, text_rect)
+        return len(clusters) + len(links)
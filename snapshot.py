@@ -0,0 +1,195 @@
+"""
+Saves a prepared graph to one .npz file and opens it again without redoing layout or measuring text.
+Saved as a directory of .npy files instead, it can be memory mapped rather than read in.
+"""
+
+import os
+import sys
+import json
+import argparse
+import typing as tp
+import numpy as np
+
+from formation import FormationManager
+from model import NodeStore, LinkStore, LabelStore, PackedTexts
+from render import TEXT_FONT_SIZES
+import config as cfg
+
+FORMAT_VERSION = 1
+
+# Texts are stored as one UTF-8 blob, so they can't contain this
+_SEPARATOR = '\0'
+
+def _pack_texts(texts: tp.List[str]) -> np.array:
+    texts = ['' if text is None else text for text in texts]
+    if any(_SEPARATOR in text for text in texts):
+        raise ValueError("Texts can't contain NUL characters")
+    return np.frombuffer(_SEPARATOR.join(texts).encode('utf-8'), dtype=np.uint8)
+
+def _text_ends(texts: tp.List[str]) -> np.array:
+    """
+    Where each text packed by _pack_texts() ends, so any one of them can be found without the rest.
+    """
+    lengths = np.fromiter((len(text.encode('utf-8')) if text else 0 for text in texts), dtype=np.int64, count=len(texts))
+    return np.cumsum(lengths + 1) - 1
+
+def _unpack_texts(blob: np.array, count: int) -> tp.List[str]:
+    if count == 0:
+        return []
+    texts = blob.tobytes().decode('utf-8').split(_SEPARATOR)
+    if len(texts) != count:
+        raise ValueError("Expected {} texts, found {}".format(count, len(texts)))
+    return texts
+
+class Snapshot:
+    """
+    A graph as loaded from a snapshot: mgr holds its stores, metadata whatever was saved with it,
+    e.g. which layout placed it, and text_sizes and label_text_sizes the node and label text measurements
+    to give ModelToViewTranslator, if they were saved and still match the configured fonts.
+    """
+    def __init__(self, mgr: FormationManager, metadata: tp.Dict[str, tp.Any], text_sizes: tp.Optional[np.array], \
+                 label_text_sizes: tp.Optional[np.array]=None):
+        self.mgr = mgr
+        self.metadata = metadata
+        self.text_sizes = text_sizes
+        self.label_text_sizes = label_text_sizes
+
+class _MappedArrays:
+    """
+    The arrays of a snapshot directory, each memory mapped when first asked for. Mappings are
+    copy on write, so e.g. laying out the nodes again changes them in memory but not on disk.
+    """
+    def __init__(self, path: str):
+        self._path = path
+
+    def _file_of(self, name: str) -> str:
+        return os.path.join(self._path, name + ".npy")
+
+    def __contains__(self, name: str) -> bool:
+        return os.path.exists(self._file_of(name))
+
+    def __getitem__(self, name: str) -> np.array:
+        array = np.load(self._file_of(name), mmap_mode='c', allow_pickle=False)
+        # Nothing to map for empty and 0-d arrays
+        return np.array(array) if array.size == 0 or array.ndim == 0 else array
+
+def save(mgr: FormationManager, path: str, metadata: tp.Optional[tp.Dict[str, tp.Any]]=None, \
+         text_sizes: tp.Optional[np.array]=None, mapped: bool=False, label_text_sizes: tp.Optional[np.array]=None):
+    """
+    Writes every node, link and label of mgr, plus metadata as JSON, to path. text_sizes and
+    label_text_sizes are render.text_sizes_of() the node and label texts, for loading to skip measuring them again.
+    Arrays are stored uncompressed, since loading them is what needs to be quick; with mapped,
+    path is a directory with a .npy file per array, which load() maps instead of reading.
+    """
+    nodes, links, labels = mgr.nodes, mgr.links, mgr.labels
+    arrays = {
+        "version": np.array(FORMAT_VERSION),
+        "metadata": np.frombuffer(json.dumps(metadata or {}).encode('utf-8'), dtype=np.uint8),
+
+        "node_count": np.array(len(nodes)),
+        "node_texts": _pack_texts(nodes.texts),
+        "node_text_ends": _text_ends(nodes.texts),
+        "node_positions": nodes.positions,
+        "node_colour_codes": nodes.colour_codes,
+        "node_colour_names": _pack_texts(nodes.colour_names),
+        "node_multiboxes": nodes.multiboxes,
+
+        "link_from_ids": links.from_ids,
+        "link_to_ids": links.to_ids,
+        "link_arrow_draws": links.arrow_draws,
+        "link_colour_codes": links.colour_codes,
+        "link_second_colour_codes": links.second_colour_codes,
+        "link_colour_names": _pack_texts(links.colour_names),
+
+        "label_count": np.array(len(labels)),
+        "label_texts": _pack_texts(labels.texts),
+        "label_text_ends": _text_ends(labels.texts),
+        "label_positions": labels.positions,
+        "label_colour_codes": labels.colour_codes,
+        "label_colour_names": _pack_texts(labels.colour_names),
+    }
+    for kind, store, sizes in (("node", nodes, text_sizes), ("label", labels, label_text_sizes)):
+        if sizes is None:
+            continue
+        if len(sizes) != len(store):
+            raise ValueError("Expected text sizes for {} {}s, got {}".format(len(store), kind, len(sizes)))
+        arrays[kind + "_text_sizes"] = sizes
+        arrays["text_font_sizes"] = np.array(TEXT_FONT_SIZES)
+
+    if not mapped:
+        # A file object, so numpy doesn't append .npz to a path that lacks it
+        with open(path, 'wb') as snapshot_file:
+            np.savez(snapshot_file, **arrays)
+        return
+
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + ".npy"), array)
+
+def load(path: str) -> Snapshot:
+    """
+    Opens a snapshot file, or maps a snapshot directory; see save().
+    """
+    if os.path.isdir(path):
+        return _from_arrays(path, _MappedArrays(path), mapped=True)
+    with np.load(path, allow_pickle=False) as arrays:
+        return _from_arrays(path, arrays, mapped=False)
+
+def _from_arrays(path: str, arrays: tp.Mapping[str, np.array], mapped: bool) -> Snapshot:
+    version = int(arrays["version"])
+    if version != FORMAT_VERSION:
+        raise ValueError("{} is snapshot version {}, expected {}".format(path, version, FORMAT_VERSION))
+
+    def names(key: str) -> tp.List[str]:
+        blob = arrays[key]
+        return _unpack_texts(blob, 1 + int(np.count_nonzero(blob == 0))) if len(blob) else []
+
+    def texts(kind: str) -> tp.Sequence[str]:
+        # Decoding them all up front is quicker overall, but reads in every one
+        if mapped:
+            return PackedTexts(arrays[kind + "_texts"], arrays[kind + "_text_ends"])
+        return _unpack_texts(arrays[kind + "_texts"], int(arrays[kind + "_count"]))
+
+    nodes = NodeStore.from_arrays(texts("node"), arrays["node_positions"], arrays["node_colour_codes"],
+                                  names("node_colour_names"), arrays["node_multiboxes"])
+    links = LinkStore.from_arrays(arrays["link_from_ids"], arrays["link_to_ids"], arrays["link_arrow_draws"],
+                                  arrays["link_colour_codes"], arrays["link_second_colour_codes"],
+                                  names("link_colour_names"))
+    labels = LabelStore.from_arrays(texts("label"), arrays["label_positions"], arrays["label_colour_codes"],
+                                    names("label_colour_names"))
+
+    def text_sizes(kind: str) -> tp.Optional[np.array]:
+        # Measured for other fonts, the boxes would be the wrong size
+        if kind + "_text_sizes" in arrays and tuple(arrays["text_font_sizes"].tolist()) == TEXT_FONT_SIZES:
+            return arrays[kind + "_text_sizes"]
+        return None
+
+    metadata = json.loads(arrays["metadata"].tobytes().decode('utf-8'))
+    return Snapshot(FormationManager.from_stores(nodes, links, labels), metadata, text_sizes("node"),
+                    text_sizes("label"))
+
+if __name__ == '__main__':
+    from export import init_headless
+    from importer import import_graph
+    from render import text_sizes_of
+    from text import TextSurfaceCache
+
+    parser = argparse.ArgumentParser(description="Import a graph dump, lay it out and save it as a snapshot")
+    parser.add_argument("dump", help="GraphSON or JSON-lines file")
+    parser.add_argument("out", help=".npz file to write, or a directory to write one that can be memory mapped")
+    parser.add_argument("--layout", choices=("none", "force_directed", "layered"), default="none")
+    args = parser.parse_args()
+
+    mgr = import_graph(args.dump)
+    metadata = {"source": args.dump, "layout": args.layout}
+    if args.layout == "force_directed":
+        metadata["iterations"] = mgr.layout_force_directed()
+    elif args.layout == "layered":
+        metadata["layers"] = mgr.layout_layered()
+
+    init_headless()
+    text_cache = TextSurfaceCache(cfg.text_cache_budget)
+    save(mgr, args.out, metadata, text_sizes_of(mgr.nodes.texts, text_cache), mapped=not args.out.endswith(".npz"),
+         label_text_sizes=text_sizes_of(mgr.labels.texts, text_cache))
+    print("Saved {} nodes and {} links to {}".format(len(mgr.nodes), len(mgr.links), args.out))
+    sys.exit(0)
@@ -0,0 +1,143 @@
+"""
+Uniform grid over model coordinates, used to cull whatever is outside the viewport
+"""
+
+import typing as tp
+import numpy as np
+
+class UniformGrid:
+    """
+    Buckets point items into square cells of cell_size model units.
+    Built once; items are referred to by their index into the points given.
+
+    Points are kept sorted by cell, column by column, so the cells of one column that a box
+    touches hold one contiguous run of points, found by binary search. Cells are numbered within
+    the occupied ones, which keeps the numbers, like the indices, 32 bit for all but huge graphs.
+    """
+    def __init__(self, points: np.array, cell_size: int):
+        self._cell_size = cell_size
+        self._num_points = len(points)
+
+        if self._num_points == 0:
+            self._sorted_indices = np.empty(0, dtype=int)
+            self._sorted_keys = np.empty(0, dtype=np.int64)
+            self._occupied = None
+            return
+
+        # Divided as float64 whatever the points are, the same as query() divides its box. Column by
+        # column, as reducing along the short axis of an N x 2 array is many times slower.
+        points = np.asarray(points).reshape(-1, 2)
+        cxs, cys = (self._cell_coords(points[:,axis]) for axis in (0, 1))
+        self._occupied = (int(cxs.min()), int(cys.min()), int(cxs.max()), int(cys.max()))
+        self._column_height = self._occupied[3] - self._occupied[1] + 1
+        num_cells = (self._occupied[2] - self._occupied[0] + 1) * self._column_height
+        key_type = np.int32 if num_cells < 2 ** 31 else np.int64
+        index_type = np.int32 if self._num_points < 2 ** 31 else np.int64
+
+        keys = self._keys(cxs, cys).astype(key_type)
+        del cxs, cys
+        self._sorted_indices = np.argsort(keys).astype(index_type)
+        self._sorted_keys = keys[self._sorted_indices]
+
+    def _cell_coords(self, coords: np.array) -> np.array:
+        cells = np.divide(coords, self._cell_size, dtype=float)
+        return np.floor(cells, out=cells).astype(np.int64)
+
+    def _keys(self, cxs: np.array, cys: np.array) -> np.array:
+        """
+        One int per occupied cell that sorts by column, then row.
+        """
+        return (cxs - self._occupied[0]) * self._column_height + (cys - self._occupied[1])
+
+    def __len__(self) -> int:
+        return self._num_points
+
+    def query(self, min_x: float, min_y: float, max_x: float, max_y: float) -> np.array:
+        """
+        Returns the sorted indices of every point whose cell touches the given box.
+        This can include a few points just outside the box; it never misses one inside.
+        """
+        if self._occupied is None:
+            return np.empty(0, dtype=int)
+
+        # Only the occupied cells can hold anything, however big the box
+        min_cx = max(int(np.floor(min_x / self._cell_size)), self._occupied[0])
+        min_cy = max(int(np.floor(min_y / self._cell_size)), self._occupied[1])
+        max_cx = min(int(np.floor(max_x / self._cell_size)), self._occupied[2])
+        max_cy = min(int(np.floor(max_y / self._cell_size)), self._occupied[3])
+        if min_cx > max_cx or min_cy > max_cy:
+            return np.empty(0, dtype=int)
+
+        # Zoomed out far enough to see everything
+        if (min_cx, min_cy, max_cx, max_cy) == self._occupied:
+            return np.arange(self._num_points)
+
+        # Searched for as the same type as the keys, or all of them get converted every time
+        columns = np.arange(min_cx, max_cx + 1)
+        key_type = self._sorted_keys.dtype
+        firsts = np.searchsorted(self._sorted_keys, self._keys(columns, min_cy).astype(key_type)).tolist()
+        lasts = np.searchsorted(self._sorted_keys, self._keys(columns, max_cy).astype(key_type), side='right').tolist()
+        slices = [self._sorted_indices[first:last] for first, last in zip(firsts, lasts) if first < last]
+        if not slices:
+            return np.empty(0, dtype=int)
+        return np.sort(np.concatenate(slices)).astype(int)
+
+class BoxGrid:
+    """
+    Buckets box items, one (min_x, min_y, max_x, max_y) row each, by their centre. Each box goes in a
+    UniformGrid whose cells are at least as big as it is, one grid per power of two times cell_size,
+    so a query only has to look half a cell further out in each grid to find every box it overlaps.
+    """
+    def __init__(self, boxes: np.array, cell_size: int):
+        # Kept as given, e.g. float32 like model positions
+        self._boxes = np.asarray(boxes).reshape(-1, 4)
+        extents = np.maximum(self._boxes[:,2] - self._boxes[:,0], self._boxes[:,3] - self._boxes[:,1])
+        levels = np.ceil(np.log2(np.maximum(extents / cell_size, 1.0))).astype(np.int16)
+        del extents
+        centres = self._boxes[:,:2] + self._boxes[:,2:]
+        centres /= 2
+        index_type = np.int32 if len(self._boxes) < 2 ** 31 else np.int64
+
+        self._grids = []
+        for level in np.unique(levels).tolist():
+            rows = np.flatnonzero(levels == level).astype(index_type)
+            level_cell_size = cell_size << level
+            self._grids.append((rows, UniformGrid(centres[rows], level_cell_size), level_cell_size / 2))
+
+    def __len__(self) -> int:
+        return len(self._boxes)
+
+    def query(self, min_x: float, min_y: float, max_x: float, max_y: float) -> np.array:
+        """
+        Returns the sorted indices of every box that overlaps the given one, edges included.
+        """
+        found = [rows[grid.query(min_x - reach, min_y - reach, max_x + reach, max_y + reach)]
+                 for rows, grid, reach in self._grids]
+        if not found:
+            return np.empty(0, dtype=int)
+        candidates = np.sort(np.concatenate(found)).astype(int)
+        boxes = self._boxes[candidates]
+        return candidates[(boxes[:,0] <= max_x) & (boxes[:,2] >= min_x) & (boxes[:,1] <= max_y) & (boxes[:,3] >= min_y)]
+
+class BoundingBox:
+    def __init__(self, min_x: float, min_y: float, max_x: float, max_y: float):
+        self.min_x = min_x
+        self.min_y = min_y
+        self.max_x = max_x
+        self.max_y = max_y
+
+    @classmethod
+    def of_points(cls, points: np.array, margin: tp.Tuple[float, float]=(0, 0)) -> tp.Optional['BoundingBox']:
+        if len(points) == 0:
+            return None
+
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        mins = [points[:,axis].min() for axis in (0, 1)]
+        maxs = [points[:,axis].max() for axis in (0, 1)]
+        return cls(mins[0] - margin[0], mins[1] - margin[1], maxs[0] + margin[0], maxs[1] + margin[1])
+
+    def intersects(self, min_x: float, min_y: float, max_x: float, max_y: float) -> bool:
+        return self.min_x <= max_x \
+           and self.max_x >= min_x \
+           and self.min_y <= max_y \
+           and self.max_y >= min_y
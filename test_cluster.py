@@ -0,0 +1,45 @@
+import numpy as np
+import pygame
+
+import bench
+import config as cfg
+import export
+from cluster import GridClusters
+from formation import FormationManager
+from translator import ModelToViewTranslator
+
+def _clusters(graph: FormationManager, link_reach: int) -> GridClusters:
+    return GridClusters(graph.nodes.positions, graph.nodes.has_texts, graph.nodes.colour_codes,
+                        graph.links.from_ids, graph.links.to_ids, graph.links.colour_codes,
+                        cfg.cluster_cell_size, 3, link_reach)
+
+def test_far_links_join_bigger_cells():
+    graph = bench.scale_free(2000).build()
+    clusters = _clusters(graph, link_reach=2)
+    for zoom_out_level in (3, 5):
+        level = clusters.level(zoom_out_level)
+        cell_size = cfg.cluster_cell_size * 2 ** zoom_out_level
+        cells = np.floor(np.divide(graph.nodes.positions, cell_size, dtype=float)).astype(int)
+        between = np.any(cells[graph.links.from_ids] != cells[graph.links.to_ids], axis=1)
+        # Every link between two clusters is still stood for, once
+        assert level.link_weights.sum() == between.sum()
+
+        gaps = np.abs(level.link_ends[level.link_froms] - level.link_ends[level.link_tos]).max(axis=1)
+        assert len(level.link_froms) < between.sum() / 4
+        assert np.all(gaps > 0)
+
+def test_drawn_stays_bounded_on_dense_graph():
+    export.init_headless()
+    graph = bench.scale_free(20000).build()
+    translator = ModelToViewTranslator(graph.nodes, graph.links, graph.labels, cfg.screen_size)
+    tile_size = cfg.tile_size
+    # Twice the budget, which is worked out for the average square of the graph and not each one
+    bound = 2 * cfg.cluster_max_density * tile_size ** 2
+    for zoom_out_level in range(translator.max_zoom_level + 1):
+        for origin in ((0, 0), (tile_size, 0), (0, tile_size), (tile_size, tile_size)):
+            translator.stats.start_frame()
+            translator.draw_tiles([(pygame.Surface((tile_size, tile_size)), zoom_out_level, origin)])
+            translator.stats.end_frame()
+            num_drawn = sum(translator.stats.last_count(kind + "_drawn")
+                            for kind in ("labels", "nodes", "links", "clusters"))
+            assert num_drawn <= bound, (zoom_out_level, origin, num_drawn)
@@ -0,0 +1,44 @@
+import numpy as np
+import pygame
+
+import config as cfg
+import export
+from formation import FormationManager
+from translator import ModelToViewTranslator
+
+def _graph_with_far_node() -> FormationManager:
+    mgr = FormationManager()
+    near = mgr.add_node("near", (100, 100), "red")
+    # Well outside the first screen_size pixels of the export, across and down
+    far = mgr.add_node("far", (cfg.screen_size[0] * 4, cfg.screen_size[1] * 4), "blue")
+    mgr.add_link(near, far)
+    return mgr
+
+def _has_colour(pixels: np.array, rgb: tuple) -> bool:
+    return bool(np.any(np.all(pixels == rgb, axis=2)))
+
+def test_whole_png_draws_far_node(tmp_path):
+    path = export.render_whole_png(_graph_with_far_node(), str(tmp_path / "whole.png"))
+    pixels = pygame.surfarray.array3d(pygame.image.load(path))
+    assert pixels.shape[0] > cfg.screen_size[0] * 3 and pixels.shape[1] > cfg.screen_size[1] * 3
+
+    bottom_right = pixels[-cfg.screen_size[0]:, -cfg.screen_size[1]:]
+    assert _has_colour(bottom_right, cfg.colour_set["blue"].box_col)
+    assert not _has_colour(bottom_right, cfg.colour_set["red"].box_col)
+
+def test_whole_export_in_bands_draws_far_node(tmp_path):
+    export.init_headless()
+    mgr = _graph_with_far_node()
+    translator = ModelToViewTranslator(mgr.nodes, mgr.links, mgr.labels, cfg.screen_size)
+    writer = export.BackgroundWriter()
+    whole = export.WholeGraphExport(translator, str(tmp_path / "bands.png"), 0, writer, band_budget=1024 * 1024)
+    num_bands = 0
+    while not whole.done:
+        whole.render_band()
+        num_bands += 1
+    writer.finish()
+    assert num_bands > 1
+
+    pixels = pygame.surfarray.array3d(pygame.image.load(whole.path))
+    assert pixels.shape[:2] == whole.size
+    assert _has_colour(pixels[-cfg.screen_size[0]:, -cfg.screen_size[1]:], cfg.colour_set["blue"].box_col)
@@ -0,0 +1,143 @@
+import asyncio
+import contextlib
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+import gremlin
+from gremlin import BackgroundLoad, ConnectionPool, GraphLoader, ReplayServer
+
+NUM_VERTICES = 250
+NUM_EDGES = 300
+PAGE_SIZE = 100
+BATCH_SIZE = 64
+
+def _typed(type_name: str, value) -> dict:
+    return {"@type": type_name, "@value": value}
+
+def _response(data, code: int) -> dict:
+    return {"result": {"data": data, "meta": {}}, "status": {"code": code, "message": "", "attributes": {}}}
+
+def _streamed(items: list) -> list:
+    """
+    The responses to a request, a batch at a time, PARTIAL_CONTENT until the last.
+    """
+    batches = [items[start:start + BATCH_SIZE] for start in range(0, len(items), BATCH_SIZE)] or [[]]
+    return [_response(_typed("g:List", batch), gremlin.PARTIAL_CONTENT if index < len(batches) - 1 else gremlin.SUCCESS)
+            for index, batch in enumerate(batches)]
+
+def _vertex(index: int) -> dict:
+    # As GraphSON, the way Gremlin Server sends an elementMap()
+    return _typed("g:Map", [_typed("g:T", "id"), _typed("g:Int64", index),
+                            _typed("g:T", "label"), "person",
+                            "name", "v{}".format(index)])
+
+def _edge(index: int) -> dict:
+    return {"id": 1000 + index, "label": "knows",
+            "OUT": {"id": index % NUM_VERTICES, "label": "person"},
+            "IN": {"id": (index * 7 + 1) % NUM_VERTICES, "label": "person"}}
+
+def _recordings(with_edges: bool=True) -> list:
+    recordings = []
+    for step, count, element in (('V', NUM_VERTICES, _vertex), ('E', NUM_EDGES, _edge)):
+        recordings.append({"gremlin": "g.{}().count()".format(step),
+                           "responses": _streamed([_typed("g:Int64", count)])})
+        if step == 'E' and not with_edges:
+            continue
+        for start in range(0, count, PAGE_SIZE):
+            recordings.append({"gremlin": "g.{}().range({}, {}).elementMap()".format(step, start, start + PAGE_SIZE),
+                               "responses": _streamed([element(index) for index in range(start, min(start + PAGE_SIZE, count))])})
+    return recordings
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+@contextlib.contextmanager
+def _serving(server: ReplayServer):
+    """
+    Runs server on a thread of its own, as BackgroundLoad runs its own event loop.
+    """
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(server.__aenter__(), loop).result(5)
+    try:
+        yield server
+    finally:
+        asyncio.run_coroutine_threadsafe(server.__aexit__(None, None, None), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+def _load(url: str, recording: list=None) -> BackgroundLoad:
+    load = BackgroundLoad(GraphLoader(url, page_size=PAGE_SIZE, batch_size=BATCH_SIZE, pool_size=2, recording=recording))
+    notified = threading.Event()
+    load.notify = notified.set
+    load.start()
+
+    load.wait_for_nodes()
+    assert len(load.mgr.nodes) > 0
+    num_nodes_seen = [len(load.mgr.nodes)]
+    while not load.done:
+        notified.wait(5)
+        notified.clear()
+        load.poll()
+        num_nodes_seen.append(len(load.mgr.nodes))
+    load.poll()
+    assert num_nodes_seen == sorted(num_nodes_seen)
+    return load
+
+def _check_graph(load: BackgroundLoad):
+    mgr = load.mgr
+    assert len(mgr.nodes) == NUM_VERTICES
+    assert len(mgr.links) == NUM_EDGES
+    node_of_text = {mgr.nodes.texts[node]: node for node in range(len(mgr.nodes))}
+    expected = sorted((node_of_text["v{}".format(edge["OUT"]["id"])], node_of_text["v{}".format(edge["IN"]["id"])])
+                      for edge in map(_edge, range(NUM_EDGES)))
+    assert sorted(zip(mgr.links.from_ids.tolist(), mgr.links.to_ids.tolist())) == expected
+
+def test_load_replays_recording(tmp_path):
+    recording = []
+    with _serving(ReplayServer(_recordings(), port=_free_port())) as server:
+        _check_graph(_load(server.url, recording))
+    # The count and 3 pages, for both vertices and edges
+    assert len(recording) == 8
+
+    path = tmp_path / "recording.jsonl"
+    path.write_text("".join(json.dumps(request) + "\n" for request in recording))
+    with _serving(ReplayServer.from_file(str(path), port=_free_port())) as server:
+        _check_graph(_load(server.url))
+
+def test_error_response_raises_and_pool_recovers():
+    async def refuse():
+        raise OSError("refused")
+
+    async def fetch_after_error(url: str):
+        async with ConnectionPool(url, 1) as pool:
+            connect = pool._connect
+            pool._connect = refuse
+            with pytest.raises(RuntimeError):
+                await pool.fetch("g.V().drop()", 1)
+            # The closed connection isn't handed out again, failing to connect or not
+            with pytest.raises(OSError):
+                await pool.fetch("g.V().count()", 1)
+            pool._connect = connect
+            return await pool.fetch("g.V().count()", 1)
+
+    with _serving(ReplayServer(_recordings(), port=_free_port())) as server:
+        assert asyncio.run(fetch_after_error(server.url)) == [NUM_VERTICES]
+
+def test_load_error_raised_by_poll():
+    with _serving(ReplayServer(_recordings(with_edges=False), port=_free_port())) as server:
+        load = BackgroundLoad(GraphLoader(server.url, page_size=PAGE_SIZE, batch_size=BATCH_SIZE)).start()
+        # Raised by the poll() after the load stops, once everything before it has been added
+        with pytest.raises(RuntimeError):
+            for _ in range(500):
+                load.poll()
+                time.sleep(0.01)
+        assert len(load.mgr.nodes) == NUM_VERTICES
@@ -0,0 +1,94 @@
+import json
+
+import numpy as np
+import pytest
+
+from formation import FormationManager
+from importer import GraphImporter, StyleRule, StyleRules
+from spec import ArrowDraw
+
+def _typed(type_name: str, value) -> dict:
+    return {"@type": type_name, "@value": value}
+
+def _graphson_vertex(vertex_id: int, name: str, out_edges: list) -> str:
+    """
+    A line as TinkerPop's GraphSON 3.0 writer puts it, with out_edges as (edge id, in vertex id, weight).
+    """
+    edges = [_typed("g:Edge", {"id": _typed("g:Int32", edge_id), "inV": _typed("g:Int32", in_id),
+                               "properties": {"weight": _typed("g:Property", {"key": "weight",
+                                                                               "value": _typed("g:Double", weight)})}})
+             for edge_id, in_id, weight in out_edges]
+    return json.dumps(_typed("g:Vertex", {
+        "id": _typed("g:Int32", vertex_id),
+        "label": "person",
+        "outE": {"knows": edges} if edges else {},
+        "properties": {"name": [_typed("g:VertexProperty", {"id": _typed("g:Int64", vertex_id * 10),
+                                                            "value": name, "label": "name"})]}}))
+
+def _links_by_text(mgr: FormationManager) -> list:
+    return sorted((mgr.text_of(from_id), mgr.text_of(to_id)) for from_id, to_id in
+                  zip(mgr.links.from_ids.tolist(), mgr.links.to_ids.tolist()))
+
+def test_graphson_types_unwrapped():
+    lines = [_graphson_vertex(1, "marko", [(7, 2, 0.5), (8, 3, 0.25)]),
+             _graphson_vertex(2, "vadas", []),
+             _graphson_vertex(3, "lop", [])]
+    rules = StyleRules(edge_rules=[StyleRule(colour="red", where=lambda properties: properties["weight"] > 0.4)])
+    importer = GraphImporter(rules=rules)
+    importer.feed(lines)
+    mgr = importer.finish()
+
+    assert [mgr.text_of(node) for node in range(len(mgr.nodes))] == ["marko", "vadas", "lop"]
+    assert _links_by_text(mgr) == [("marko", "lop"), ("marko", "vadas")]
+    colour_names = mgr.links.colour_names
+    assert sorted(colour_names[code] for code in mgr.links.colour_codes.tolist()) == ["black", "red"]
+
+def test_edges_wait_for_their_vertices():
+    importer = GraphImporter(batch_size=2)
+    importer.feed_elements([{"id": 10, "label": "knows", "outV": 1, "inV": 2},
+                            {"id": 11, "label": "knows", "outV": 2, "inV": 3}])
+    importer.flush()
+    assert len(importer.mgr.links) == 0
+    assert sorted(importer._waiting_edges) == [1, 2]
+
+    importer.feed_elements([{"id": 1, "properties": {"name": "a"}},
+                            {"id": 2, "properties": {"name": "b"}},
+                            {"id": 3, "properties": {"name": "c"}}])
+    mgr = importer.finish()
+    assert not importer._waiting_edges
+    assert _links_by_text(mgr) == [("a", "b"), ("b", "c")]
+
+def test_finish_raises_for_edges_to_missing_vertices():
+    importer = GraphImporter()
+    importer.feed_elements([{"id": 1, "properties": {"name": "a"}},
+                            {"id": 10, "label": "knows", "outV": 1, "inV": 99}])
+    with pytest.raises(ValueError, match="1 edges refer to vertices that were never read, e.g. 99"):
+        importer.finish()
+    # Whatever could be added still was
+    assert len(importer.mgr.nodes) == 1
+
+def test_no_link_edges_left_out():
+    rules = StyleRules(edge_rules=[StyleRule(label="hidden", arrow_draw=ArrowDraw.NO_LINK)])
+    importer = GraphImporter(rules=rules)
+    importer.feed_elements([{"id": 1, "properties": {"name": "a"}},
+                            {"id": 2, "properties": {"name": "b"}},
+                            {"id": 10, "label": "hidden", "outV": 1, "inV": 2},
+                            {"id": 11, "label": "knows", "outV": 2, "inV": 1}])
+    mgr = importer.finish()
+    assert _links_by_text(mgr) == [("b", "a")]
+    assert mgr.links.arrow_draws.tolist() == [ArrowDraw.FWD_ARROW.value]
+
+def test_dual_link_rules_rejected():
+    with pytest.raises(ValueError):
+        StyleRules(arrow_draw=ArrowDraw.DUAL_LINK)
+    with pytest.raises(ValueError):
+        StyleRules(edge_rules=[StyleRule(label="both", arrow_draw=ArrowDraw.DUAL_LINK)])
+
+def test_numpy_ids_from_add_nodes():
+    mgr = FormationManager()
+    ids = mgr.add_nodes(["a", "b"], np.array([(0, 0), (200, 0)]), ["green", "green"])
+    assert isinstance(ids[0], np.integer)
+    mgr.add_link(ids[0], ids[1])
+    assert mgr.text_of(ids[1]) == "b"
+    assert np.allclose(mgr.pos_of(ids[1]), (200, 0))
+    assert _links_by_text(mgr) == [("a", "b")]
@@ -0,0 +1,67 @@
+import numpy as np
+
+import config as cfg
+import layout
+from formation import FormationManager
+
+def _edges_go_down_one_layer(positions: np.array, from_ids: list, to_ids: list, layer_gap: float):
+    steps = positions[to_ids, 1] - positions[from_ids, 1]
+    assert np.allclose(steps, layer_gap)
+
+def test_layered_chain():
+    positions, num_layers = layout.layered(3, [0, 1], [1, 2], layer_gap=100)
+    assert num_layers == 3
+    assert np.allclose(positions, [(0, 0), (0, 100), (0, 200)])
+
+def test_layered_tree():
+    from_ids, to_ids = [0, 0, 1, 1, 2], [1, 2, 3, 4, 5]
+    positions, num_layers = layout.layered(6, from_ids, to_ids, layer_gap=100, node_gap=50)
+    assert num_layers == 3
+    _edges_go_down_one_layer(positions, from_ids, to_ids, 100)
+    assert len(np.unique(positions, axis=0)) == 6
+
+def test_layered_without_links():
+    positions, num_layers = layout.layered(3, [], [], node_gap=50)
+    assert num_layers == 1
+    assert np.allclose(positions[:,1], 0)
+    assert np.allclose(np.sort(positions[:,0]), [-50, 0, 50])
+
+def test_layered_empty():
+    positions, num_layers = layout.layered(0, [], [])
+    assert num_layers == 0
+    assert positions.shape == (0, 2)
+
+def test_layered_long_edge_gets_dummies():
+    positions, num_layers = layout.layered(4, [0, 1, 2, 0], [1, 2, 3, 3], layer_gap=100)
+    assert num_layers == 4
+    _edges_go_down_one_layer(positions, [0, 1, 2], [1, 2, 3], 100)
+
+def test_layout_layered_keeps_top_left():
+    mgr = FormationManager()
+    a, b, c = (mgr.add_node(text, (x, 500)) for text, x in (("a", 500), ("b", 600), ("c", 700)))
+    mgr.add_link(a, b)
+    mgr.add_link(b, c)
+    assert mgr.layout_layered() == 3
+    assert np.allclose(mgr.nodes.positions.min(axis=0), (500, 500))
+
+def test_layout_layered_empty():
+    assert FormationManager().layout_layered() == 0
+
+def test_layout_incremental_moves_only_near_the_change():
+    mgr = FormationManager()
+    chain = [mgr.add_node("n{}".format(index), (index * 200, 0)) for index in range(30)]
+    for from_id, to_id in zip(chain, chain[1:]):
+        mgr.add_link(from_id, to_id)
+
+    # Twice, so the second finds the first's nodes, and where they moved to, from what it kept
+    for anchor in (chain[0], chain[20]):
+        before = mgr.nodes.positions.copy()
+        added = mgr.add_node("new{}".format(anchor), (5000, 5000))
+        mgr.add_link(anchor, added)
+        mgr.layout_incremental(added=[added], hops=2)
+
+        positions = mgr.nodes.positions
+        near = [added, anchor] + [node for node in (anchor - 1, anchor + 1) if 0 <= node < len(chain)]
+        far = np.setdiff1d(np.arange(len(before)), near)
+        assert np.array_equal(positions[far], before[far])
+        assert np.linalg.norm(positions[added] - positions[anchor]) < 2 * cfg.layout_link_length
@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import pytest
+
+import snapshot
+from formation import FormationManager
+from model import PackedTexts
+from render import TEXT_FONT_SIZES, text_sizes_of
+from spec import ArrowDraw
+from text import TextSurfaceCache
+from translator import ModelToViewTranslator
+import config as cfg
+import export
+
+def _graph() -> FormationManager:
+    mgr = FormationManager()
+    ids = mgr.add_nodes(["alpha", "", "β-node", "multi\nline"], np.array([(0, 0), (150, 0), (0, 150), (-300, 75)]),
+                        ["green", "green", "blue", "green"])
+    mgr.add_node("boxed", (400, 400), colour="red", multibox=True)
+    mgr.add_link(ids[0], ids[2], colour="red")
+    mgr.add_link(ids[2], ids[3], arrow_draw=ArrowDraw.NO_ARROW)
+    mgr.add_dual_link(ids[1], "boxed", colour="blue", second_colour="green")
+    mgr.add_label("a label", (75, 75))
+    mgr.add_label("ünïcode", (-75, 20), colour="blue")
+    return mgr
+
+def _assert_same(loaded: FormationManager, mgr: FormationManager):
+    assert list(loaded.nodes.texts) == list(mgr.nodes.texts)
+    assert list(loaded.labels.texts) == list(mgr.labels.texts)
+    for saved, read in ((mgr.nodes, loaded.nodes), (mgr.links, loaded.links), (mgr.labels, loaded.labels)):
+        assert read.colour_names == saved.colour_names
+        assert np.array_equal(read.colour_codes, saved.colour_codes)
+    for array in ("positions", "multiboxes"):
+        assert np.array_equal(getattr(loaded.nodes, array), getattr(mgr.nodes, array))
+    for array in ("from_ids", "to_ids", "arrow_draws", "second_colour_codes"):
+        assert np.array_equal(getattr(loaded.links, array), getattr(mgr.links, array))
+    assert np.array_equal(loaded.labels.positions, mgr.labels.positions)
+
+@pytest.mark.parametrize("mapped", [False, True])
+def test_round_trip(tmp_path, mapped: bool):
+    export.init_headless()
+    mgr = _graph()
+    text_cache = TextSurfaceCache(cfg.text_cache_budget)
+    text_sizes = text_sizes_of(mgr.nodes.texts, text_cache)
+    label_text_sizes = text_sizes_of(mgr.labels.texts, text_cache)
+    path = str(tmp_path / ("graph" if mapped else "graph.npz"))
+    snapshot.save(mgr, path, {"layout": "none"}, text_sizes, mapped=mapped, label_text_sizes=label_text_sizes)
+    assert os.path.isdir(path) == mapped
+
+    loaded = snapshot.load(path)
+    _assert_same(loaded.mgr, mgr)
+    assert loaded.metadata == {"layout": "none"}
+    assert np.array_equal(loaded.text_sizes, text_sizes)
+    assert np.array_equal(loaded.label_text_sizes, label_text_sizes)
+    translator = ModelToViewTranslator(loaded.mgr.nodes, loaded.mgr.links, loaded.mgr.labels, cfg.screen_size,
+                                       text_sizes=loaded.text_sizes, label_text_sizes=loaded.label_text_sizes)
+    assert translator.label_text_sizes is loaded.label_text_sizes
+    # Mapped texts are only decoded when asked for
+    assert isinstance(loaded.mgr.nodes.texts, PackedTexts) == mapped
+
+    # Still a graph that can be added to
+    added = loaded.mgr.add_node("added", (600, 0))
+    loaded.mgr.add_link("alpha", added)
+    assert loaded.mgr.text_of(added) == "added"
+    assert loaded.mgr.text_of(loaded.mgr.id_of("β-node")) == "β-node"
+    assert len(loaded.mgr.links) == len(mgr.links) + 1
+
+def test_text_sizes_dropped_for_other_fonts(tmp_path, monkeypatch):
+    mgr = _graph()
+    path = str(tmp_path / "graph.npz")
+    snapshot.save(mgr, path, text_sizes=np.ones((len(mgr.nodes), len(TEXT_FONT_SIZES), 2), dtype=np.int32),
+                  label_text_sizes=np.ones((len(mgr.labels), len(TEXT_FONT_SIZES), 2), dtype=np.int32))
+    monkeypatch.setattr(snapshot, "TEXT_FONT_SIZES", tuple(size + 1 for size in TEXT_FONT_SIZES))
+    loaded = snapshot.load(path)
+    assert loaded.text_sizes is None
+    assert loaded.label_text_sizes is None
+
+def test_text_sizes_must_match(tmp_path):
+    mgr = _graph()
+    with pytest.raises(ValueError, match="for 2 labels"):
+        snapshot.save(mgr, str(tmp_path / "graph.npz"),
+                      label_text_sizes=np.ones((1, len(TEXT_FONT_SIZES), 2), dtype=np.int32))
+
+def test_other_versions_refused(tmp_path, monkeypatch):
+    mgr = _graph()
+    file_path, dir_path = str(tmp_path / "graph.npz"), str(tmp_path / "graph")
+    snapshot.save(mgr, file_path)
+    snapshot.save(mgr, dir_path, mapped=True)
+    np.save(os.path.join(dir_path, "version.npy"), np.array(snapshot.FORMAT_VERSION + 1))
+    with pytest.raises(ValueError, match="expected {}".format(snapshot.FORMAT_VERSION)):
+        snapshot.load(dir_path)
+
+    monkeypatch.setattr(snapshot, "FORMAT_VERSION", snapshot.FORMAT_VERSION + 1)
+    with pytest.raises(ValueError, match="is snapshot version"):
+        snapshot.load(file_path)
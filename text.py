@@ -0,0 +1,97 @@
+"""
+Rendered text shared between every node and label that shows it
+"""
+
+import typing as tp
+from collections import OrderedDict
+import pygame
+
+class TextSurfaceCache:
+    """
+    Text is rendered the first time it is drawn and kept, keyed by text, font size and colours,
+    so identical labels share one surface. Once the surfaces held take up more than budget bytes
+    the least recently drawn ones are dropped; they get rendered again if they are needed again.
+    """
+    def __init__(self, budget: int, font_name: str="Arial"):
+        self._budget = budget
+        self._font_name = font_name
+        self._fonts = {}
+        self._surfaces = OrderedDict()
+        self._bytes_used = 0
+        self.hits = 0
+        self.misses = 0 # i.e. renders
+
+    def font(self, font_size: int):
+        if font_size not in self._fonts:
+            self._fonts[font_size] = pygame.font.SysFont(self._font_name, font_size)
+        return self._fonts[font_size]
+
+    @property
+    def bytes_used(self) -> int:
+        return self._bytes_used
+
+    def __len__(self) -> int:
+        return len(self._surfaces)
+
+    def size_of(self, text: str, font_size: int) -> tp.Tuple[int, int]:
+        """
+        The size surface_for() would return, without rendering anything.
+        """
+        font = self.font(font_size)
+        if '\n' not in text:
+            return font.size(text)
+
+        line_sizes = [font.size(line) for line in text.strip().split('\n')]
+        return max(size[0] for size in line_sizes), sum(size[1] for size in line_sizes)
+
+    def surface_for(self, text: str, font_size: int, colour: tp.Tuple[int, int, int], \
+                    background: tp.Tuple[int, int, int]) -> pygame.Surface:
+        key = (text, font_size, colour, background)
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = self._render(text, self.font(font_size), colour, background)
+        self._surfaces[key] = surface
+        self._bytes_used += self._bytes_of(surface)
+        self._evict()
+        return surface
+
+    def _evict(self):
+        # Always keep the surface just rendered, even if it alone is over budget
+        while self._bytes_used > self._budget and len(self._surfaces) > 1:
+            _, surface = self._surfaces.popitem(last=False)
+            self._bytes_used -= self._bytes_of(surface)
+
+    @staticmethod
+    def _bytes_of(surface: pygame.Surface) -> int:
+        return surface.get_pitch() * surface.get_height()
+
+    @staticmethod
+    def _render(text: str, font, colour: tp.Tuple[int, int, int], \
+                background: tp.Tuple[int, int, int]) -> pygame.Surface:
+        # antialias = True
+        if '\n' not in text:
+            return font.render(text, True, colour, background)
+
+        line_surfs = []
+        total_height = 0
+        max_width = 0
+        for line in text.strip().split('\n'):
+            surf = font.render(line, True, colour, background)
+            total_height += surf.get_height()
+            max_width = max(max_width, surf.get_width())
+            line_surfs.append(surf)
+
+        out_surf = pygame.Surface((max_width, total_height))
+        out_surf.fill(background)
+        y = 0
+        for surf in line_surfs:
+            x = (max_width - surf.get_width()) / 2
+            out_surf.blit(surf, (x,y))
+            y += surf.get_height()
+
+        return out_surf
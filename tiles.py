@@ -0,0 +1,137 @@
+"""
+The graph pre-rendered in square tiles, so scrolling only has to blit what was already drawn
+"""
+
+import typing as tp
+from collections import OrderedDict
+import pygame
+
+from view import ViewTransform
+
+class TileCache:
+    """
+    Tiles are tile_size pixel squares of view space at one zoom level, taken with the offset at (0, 0)
+    so they stay valid however far the view is scrolled. Missing tiles are drawn by draw_tiles, a batch
+    at a time, see ModelToViewTranslator.draw_tiles(). The least recently shown tiles are dropped once
+    the pixels kept pass budget bytes.
+
+    Scroll offsets that aren't a multiple of the zoom divisor are rounded down to whole view pixels,
+    so zoomed out views can sit up to a pixel away from drawing the scene directly.
+
+    The surface last covered is remembered, so scrolling it again only shifts what it already shows
+    and blits the strips that uncovers. Nothing else may draw on that surface.
+    """
+    def __init__(self, draw_tiles: tp.Callable[[tp.List[tp.Tuple[pygame.Surface, int, tp.Tuple[int, int]]]], None], \
+                 tile_size: int, budget: int, background: tp.Tuple[int, int, int]=(255, 255, 255)):
+        self._draw_tiles = draw_tiles
+        self._tile_size = tile_size
+        self._budget = budget
+        self._background = background
+        self._tiles = OrderedDict() # (zoom_out_level, tile_x, tile_y) -> pygame.Surface
+        self._bytes_used = 0
+        self._last_view = None # (surface, zoom_out_level, shift) of the last blit_view()
+
+    def __len__(self) -> int:
+        return len(self._tiles)
+
+    @property
+    def bytes_used(self) -> int:
+        return self._bytes_used
+
+    def _shift(self, transform: ViewTransform) -> tp.Tuple[int, int]:
+        """
+        Where view position (0, 0) at offset (0, 0) ends up on screen.
+        """
+        return (transform.offset[0] // transform.divisor, transform.offset[1] // transform.divisor)
+
+    def _keys_covering(self, transform: ViewTransform, rect: pygame.Rect, \
+                       border: int=0) -> tp.List[tp.Tuple[int, int, int]]:
+        """
+        The tiles under rect, in screen coordinates, plus border more rings of them around it.
+        """
+        shift = self._shift(transform)
+        first = [(rect.topleft[axis] - shift[axis]) // self._tile_size - border for axis in (0, 1)]
+        last = [(rect.bottomright[axis] - 1 - shift[axis]) // self._tile_size + border for axis in (0, 1)]
+        return [(transform.zoom_out_level, tile_x, tile_y)
+                for tile_y in range(first[1], last[1] + 1)
+                for tile_x in range(first[0], last[0] + 1)]
+
+    def blit_view(self, surface, transform: ViewTransform):
+        """
+        Covers surface with the tiles it shows at transform, drawing any that are missing first.
+        If surface is still showing the last view at the same zoom level, that is scrolled along
+        with Surface.scroll() and only the strips left uncovered are blitted.
+        """
+        shift = self._shift(transform)
+        last_view = self._last_view
+        self._last_view = (surface, transform.zoom_out_level, shift)
+
+        width, height = surface.get_size()
+        if last_view is not None and last_view[0] is surface and last_view[1] == transform.zoom_out_level:
+            delta_x, delta_y = shift[0] - last_view[2][0], shift[1] - last_view[2][1]
+            if abs(delta_x) < width and abs(delta_y) < height:
+                surface.scroll(delta_x, delta_y)
+                if delta_x:
+                    self._blit_rect(surface, transform, pygame.Rect(0 if delta_x > 0 else width + delta_x, 0,
+                                                                    abs(delta_x), height))
+                if delta_y:
+                    self._blit_rect(surface, transform, pygame.Rect(0, 0 if delta_y > 0 else height + delta_y,
+                                                                    width, abs(delta_y)))
+                return
+
+        self._blit_rect(surface, transform, surface.get_rect())
+
+    def _blit_rect(self, surface, transform: ViewTransform, rect: pygame.Rect):
+        """
+        Blits the tiles under rect, clipped to it.
+        """
+        keys = self._keys_covering(transform, rect)
+        self._draw_missing(keys)
+
+        shift = self._shift(transform)
+        surface.set_clip(rect)
+        surface.blits([(self._tiles[key], (key[1] * self._tile_size + shift[0], key[2] * self._tile_size + shift[1]))
+                       for key in keys], doreturn=False)
+        surface.set_clip(None)
+
+    def prefetch(self, transform: ViewTransform, screen_size: tp.Tuple[int, int]) -> bool:
+        """
+        Draws the ring of tiles just off screen, so the next scroll finds them ready.
+        Returns whether there was anything to draw.
+        """
+        keys = self._keys_covering(transform, pygame.Rect((0, 0), screen_size), border=1)
+        num_missing = sum(key not in self._tiles for key in keys)
+        self._draw_missing(keys)
+        return num_missing > 0
+
+    def clear(self):
+        self._tiles.clear()
+        self._bytes_used = 0
+        self._last_view = None
+
+    def _draw_missing(self, keys: tp.List[tp.Tuple[int, int, int]]):
+        """
+        Makes sure every one of keys has a tile, and marks them all as the most recently used.
+        """
+        missing = [key for key in keys if key not in self._tiles]
+        for key in keys:
+            if key in self._tiles:
+                self._tiles.move_to_end(key)
+        if not missing:
+            return
+
+        batch = []
+        for key in missing:
+            tile = pygame.Surface((self._tile_size, self._tile_size)).convert()
+            tile.fill(self._background)
+            batch.append((tile, key[0], (key[1] * self._tile_size, key[2] * self._tile_size)))
+        self._draw_tiles(batch)
+
+        for key, (tile, _, _) in zip(missing, batch):
+            self._tiles[key] = tile
+            self._bytes_used += tile.get_bytesize() * self._tile_size * self._tile_size
+
+        # Never drop what was just asked for, even if that alone goes over budget
+        while self._bytes_used > self._budget and len(self._tiles) > len(keys):
+            _, dropped = self._tiles.popitem(last=False)
+            self._bytes_used -= dropped.get_bytesize() * self._tile_size * self._tile_size
@@ -3,13 +3,20 @@ Translates from model.Node/Link to render.Node/Link
 """
 
 import typing as tp
+from collections import OrderedDict
 from functools import partial
 import pygame
 from pygame.locals import *
 import numpy as np
 
 import model
-from render import Node, Link
+from render import Node, LinkLayer, ClusterLayer, TEXT_FONT_SIZES, text_sizes_of, box_half_extents
+from cluster import GridClusters
+from spatial import UniformGrid, BoxGrid, BoundingBox
+from view import ViewTransform
+from text import TextSurfaceCache
+from profiler import FrameStats
+import raster
 import config as cfg
 
 def point_within_bounds(display_surface_size: tp.Tuple[int, int], point: tp.Tuple[int, int]) -> bool:
@@ -20,81 +27,360 @@ def point_within_bounds(display_surface_size: tp.Tuple[int, int], point: tp.Tupl
 
 def rect_within_bounds(display_surface_size: tp.Tuple[int, int], \
                        rect_dimen: tp.Tuple[int, int, int, int]) -> bool:
-    top_left  = (rect_dimen[0], rect_dimen[1])
-    top_right = (rect_dimen[0] + rect_dimen[2], rect_dimen[1])
-    bot_left  = (rect_dimen[0], rect_dimen[1] + rect_dimen[3])
-    bot_right = (rect_dimen[0] + rect_dimen[2], rect_dimen[1] + rect_dimen[3])
-
-    return point_within_bounds(display_surface_size, top_left) \
-        or point_within_bounds(display_surface_size, top_right) \
-        or point_within_bounds(display_surface_size, bot_left) \
-        or point_within_bounds(display_surface_size, bot_right)
+    # Overlapping at all, so a rect bigger than the surface counts even with every corner outside it
+    return rect_dimen[0] <= display_surface_size[0] \
+       and rect_dimen[0] + rect_dimen[2] >= 0 \
+       and rect_dimen[1] <= display_surface_size[1] \
+       and rect_dimen[1] + rect_dimen[3] >= 0
 
 def line_within_bounds(display_surface_size: tp.Tuple[int, int], \
                        line_start: tp.Tuple[int, int], line_end: tp.Tuple[int, int]) -> bool:
     return point_within_bounds(display_surface_size, line_start) \
         or point_within_bounds(display_surface_size, line_end)
 
+def points_within_bounds(display_surface_size: tp.Tuple[int, int], points: np.array) -> np.array:
+    return (points[:,0] >= 0) \
+         & (points[:,0] <= display_surface_size[0]) \
+         & (points[:,1] >= 0) \
+         & (points[:,1] <= display_surface_size[1])
+
+def lines_within_bounds(display_surface_size: tp.Tuple[int, int], \
+                        line_starts: np.array, line_ends: np.array) -> np.array:
+    return points_within_bounds(display_surface_size, line_starts) \
+         | points_within_bounds(display_surface_size, line_ends)
+
+class _LazyList:
+    """
+    make(index) for each index below length, made the first time it is asked for, so items that never
+    get drawn cost nothing. Only the max_kept most recently asked for are kept.
+    """
+    def __init__(self, length: int, make: tp.Callable[[int], tp.Any], max_kept: int):
+        self._length = length
+        self._make = make
+        self._max_kept = max_kept
+        self._items = OrderedDict()
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: int):
+        item = self._items.get(index)
+        if item is not None:
+            self._items.move_to_end(index)
+            return item
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+
+        item = self._items[index] = self._make(index)
+        if len(self._items) > self._max_kept:
+            self._items.popitem(last=False)
+        return item
+
+class _ViewPositions:
+    """
+    Rows of model_positions at the current transform, read like an (N,2) array of them, but only kept
+    for the rows last passed to update(), so they take memory for what gets drawn, not the whole graph.
+    """
+    def __init__(self, model_positions: np.array, transform: ViewTransform):
+        self._model_positions = model_positions
+        self._transform = transform
+        self._indices = np.empty(0, dtype=np.int64)
+        self._positions = np.empty((0, 2))
+
+    def update(self, indices: np.array):
+        """
+        Applies the current transform to indices, forgetting every other row.
+        """
+        self._indices = np.unique(indices)
+        self._positions = self._transform.to_view(self._model_positions[self._indices]).astype(float)
+
+    def __getitem__(self, indices: np.array) -> np.array:
+        return self._positions[np.searchsorted(self._indices, indices)]
+
+class _RowsOf:
+    """
+    Read like an array, but each read is rows(indices), worked out for just the rows asked for.
+    """
+    def __init__(self, rows: tp.Callable[[np.array], np.array]):
+        self._rows = rows
+
+    def __getitem__(self, indices: np.array) -> np.array:
+        return self._rows(indices)
+
 class ModelToViewTranslator:
-    def __init__(self, nodes: tp.List[model.Node], links: tp.List[model.Link], \
-                 labels: tp.List[model.Label], screen_size: tp.Tuple[int, int]):
-        self._big_font = pygame.font.SysFont("Arial", cfg.big_font_size)
-        self._small_font = pygame.font.SysFont("Arial", cfg.small_font_size)
-        self._tiny_font = pygame.font.SysFont("Arial", cfg.tiny_font_size)
-        self._nodes = {}
-        self._links = []
-        self._labels = []
-        self.rect_within_bounds = partial(rect_within_bounds, screen_size)
-        self.line_within_bounds = partial(line_within_bounds, screen_size)
+    def __init__(self, nodes: model.NodeStore, links: model.LinkStore, \
+                 labels: model.LabelStore, screen_size: tp.Tuple[int, int], \
+                 transform: tp.Optional[ViewTransform]=None, text_cache: tp.Optional[TextSurfaceCache]=None, \
+                 stats: tp.Optional[FrameStats]=None, text_sizes: tp.Optional[np.array]=None, \
+                 label_text_sizes: tp.Optional[np.array]=None):
+        """
+        Reads the stores' columns directly; node ids are row indices of nodes. Its indices are built from
+        where nodes are now, so moving them, e.g. with a layout, wants a new translator afterwards.
+        transform and text_cache can be carried over from a translator of an earlier state of the graph.
+        Drawing is timed by phase and what gets drawn counted in stats.
+        text_sizes and label_text_sizes are render.text_sizes_of() the node and label texts, if they were
+        measured already, e.g. in a snapshot.
+        """
+        self._text_cache = TextSurfaceCache(cfg.text_cache_budget) if text_cache is None else text_cache
+        self.stats = FrameStats() if stats is None else stats
+        self._big_font = self._text_cache.font(cfg.big_font_size)
+        self._screen_size = screen_size
 
         self.offset_step = cfg.offset_step
-        self.total_offset = (0,0)
-        self.zoom_out_level = 0
-        self.max_zoom_level = 2
-
-        node_in_canvas_bounds = False
-        for model_node in nodes:
-            text_col, box_col = self._get_colours(model_node.colour)
-
-            render_node = Node(model_node.text,
-                               self._big_font,
-                               self._small_font,
-                               self._tiny_font,
-                               pos=model_node.pos,
-                               colour=text_col,
-                               background=box_col,
-                               bounds_check=self.rect_within_bounds,
-                               multibox=model_node.multibox)
-            self._nodes[id(model_node)] = render_node
-            if point_within_bounds(screen_size, model_node.pos):
-                node_in_canvas_bounds = True
-
-        if not node_in_canvas_bounds:
+        self._transform = ViewTransform() if transform is None else transform
+
+        # Render nodes and labels read their view position out of these, see _update_view_positions().
+        # Nothing is copied out of the stores, which may be memory mapped, and view positions are only
+        # kept for what is being drawn
+        self._node_model_positions = nodes.positions.reshape(-1, 2)
+        self._node_view_positions = _ViewPositions(self._node_model_positions, self._transform)
+        self._label_model_positions = labels.positions.reshape(-1, 2)
+        self._label_view_positions = _ViewPositions(self._label_model_positions, self._transform)
+
+        self._node_grid = UniformGrid(self._node_model_positions, cfg.spatial_cell_size)
+        on_screen = self._node_grid.query(*self._transform.model_viewport(screen_size))
+        self._update_view_positions(node_indices=on_screen)
+        if not np.any(points_within_bounds(screen_size, self._node_view_positions[on_screen])):
             raise ValueError("At least one node must start within the canvas bounds")
 
-        for model_link in links:
-            sec_col = None if model_link.second_colour is None \
-                 else self._get_colours(model_link.second_colour)[1]
-            render_link = Link(self._nodes[model_link.from_model_node_id],
-                               self._nodes[model_link.to_model_node_id],
-                               colour=self._get_colours(model_link.colour)[1],
-                               width=cfg.link_width,
-                               arrow_draw=model_link.arrow_draw,
-                               second_colour=sec_col,
-                               bounds_check=self.line_within_bounds)
-            self._links.append(render_link)
-
-        for model_label in labels:
-            render_node = Node(model_label.text,
-                               self._big_font,
-                               self._small_font,
-                               self._tiny_font,
-                               pos=model_label.pos,
-                               colour=self._get_colours(model_label.colour)[1],
-                               background=(255,255,255),
-                               bounds_check=self.rect_within_bounds,
-                               multibox=False)
-            self._labels.append(render_node)
+        self._node_text_sizes = self._text_sizes("node", nodes.texts, text_sizes)
+        self._node_has_box = nodes.has_texts
+        self._node_multiboxes = np.asarray(nodes.multiboxes, dtype=bool)
+
+        node_colours = [self._get_colours(colour_name) for colour_name in nodes.colour_names]
+        self._node_box_rgbs = np.array([box_col for _, box_col in node_colours], dtype=np.uint8).reshape(-1, 3)
+        self._node_colour_codes = nodes.colour_codes
+        self._node_list = _LazyList(len(nodes), partial(self._make_node, nodes.texts, nodes.colour_codes.copy(),
+                                                        node_colours), cfg.render_node_cache_size)
+
+        self._label_text_sizes = self._text_sizes("label", labels.texts, label_text_sizes)
+        self._label_has_text = labels.has_texts
+        label_colours = [self._get_colours(colour_name)[1] for colour_name in labels.colour_names]
+        self._labels = _LazyList(len(labels), partial(self._make_label, labels.texts, labels.colour_codes.copy(),
+                                                      label_colours), cfg.render_node_cache_size)
+
+        self.max_zoom_level = self._zoom_level_to_see_all()
+        self._build_spatial_index(links)
+        self._build_link_layer(links)
+        self._build_cluster_layer(nodes, links)
+
+    def _text_sizes(self, kind: str, texts: tp.Sequence[str], text_sizes: tp.Optional[np.array]) -> np.array:
+        if text_sizes is None:
+            return text_sizes_of(texts, self._text_cache)
+        if text_sizes.shape[:1] != (len(texts),):
+            raise ValueError("Expected text sizes for {} {}s, got {}".format(len(texts), kind, len(text_sizes)))
+        return text_sizes
+
+    def _make_node(self, texts: tp.List[str], colour_codes: np.array, \
+                   colours: tp.List[tp.Tuple[tp.Tuple[int, int, int], tp.Tuple[int, int, int]]], index: int) -> Node:
+        text_col, box_col = colours[colour_codes[index]]
+        return Node(texts[index],
+                    self._text_cache,
+                    view_positions=self._node_view_positions,
+                    index=index,
+                    transform=self._transform,
+                    colour=text_col,
+                    background=box_col,
+                    bounds_check=rect_within_bounds,
+                    multibox=bool(self._node_multiboxes[index]),
+                    text_sizes=self._node_text_sizes[index].tolist())
+
+    def _make_label(self, texts: tp.List[str], colour_codes: np.array, colours: tp.List[tp.Tuple[int, int, int]], \
+                    index: int) -> Node:
+        return Node(texts[index],
+                    self._text_cache,
+                    view_positions=self._label_view_positions,
+                    index=index,
+                    transform=self._transform,
+                    colour=colours[colour_codes[index]],
+                    background=(255,255,255),
+                    bounds_check=rect_within_bounds,
+                    multibox=False,
+                    text_sizes=self._label_text_sizes[index].tolist())
+
+    @property
+    def transform(self) -> ViewTransform:
+        return self._transform
+
+    @property
+    def text_cache(self) -> TextSurfaceCache:
+        return self._text_cache
+
+    @property
+    def node_text_sizes(self) -> np.array:
+        """
+        render.text_sizes_of() every node text, e.g. to pass on to a translator for more of the graph.
+        """
+        return self._node_text_sizes
+
+    @property
+    def label_text_sizes(self) -> np.array:
+        return self._label_text_sizes
+
+    @property
+    def graph_bounds(self) -> tp.Optional[BoundingBox]:
+        """
+        Model coordinates covering every node drawn as a box, boxes included; None if there are none.
+        """
+        return self._graph_bounds
+
+    @property
+    def total_offset(self) -> tp.Tuple[int, int]:
+        return self._transform.offset
+
+    @property
+    def zoom_out_level(self) -> int:
+        return self._transform.zoom_out_level
+
+    def _update_view_positions(self, node_indices: tp.Optional[np.array]=None, \
+                               label_indices: tp.Optional[np.array]=None):
+        """
+        Applies the current transform to the given nodes and labels, which is all of them that can be
+        read until the next update. Drawing only updates what it is about to draw, so scrolling costs
+        nothing per node.
+        """
+        if node_indices is not None:
+            self._node_view_positions.update(node_indices)
+        if label_indices is not None:
+            self._label_view_positions.update(label_indices)
+
+    @property
+    def _box_zoom_levels(self) -> int:
+        """
+        How many zoom levels draw nodes as boxes, with or without text.
+        """
+        return min(self.max_zoom_level, cfg.lod_box_zoom_level) + 1
+
+    def _zoom_level_to_see_all(self) -> int:
+        """
+        Zooming out stops once every node fits on screen, but never before the last level with text.
+        """
+        min_level = 2 # the last with a font of its own, see render.Node
+        drawable_positions = self._node_model_positions[self._node_has_box]
+        if len(drawable_positions) == 0:
+            return min_level
+        extent = np.array([np.ptp(drawable_positions[:,axis]) for axis in (0, 1)]) / np.array(self._screen_size)
+        return max(min_level, int(np.ceil(np.log2(max(float(extent.max()), 1.0)))))
+
+    def _build_spatial_index(self, links: model.LinkStore):
+        """
+        Everything is indexed by model position, so this only needs doing once; the node grid
+        already is. Links are found from the nodes at either end, since they are only drawn if
+        either endpoint is on screen, or for tiles by the box between their endpoints.
+        """
+        self._node_margin = self._max_half_extent(self._node_text_sizes, self._node_has_box, self._node_multiboxes)
+
+        self._label_grid = UniformGrid(self._label_model_positions, cfg.spatial_cell_size)
+        self._label_margin = self._max_half_extent(self._label_text_sizes, self._label_has_text,
+                                                   np.zeros(len(self._label_has_text), dtype=bool))
+
+        self._link_from_ids = links.from_ids
+        self._link_to_ids = links.to_ids
+        # Each node's links, as a run of _node_links starting at _node_link_starts[node]
+        num_links = len(self._link_from_ids)
+        endpoints = np.concatenate((self._link_from_ids, self._link_to_ids))
+        self._node_link_starts = np.concatenate(([0], np.cumsum(np.bincount(endpoints, minlength=len(self._node_list)))))
+        node_links = np.argsort(endpoints)
+        node_links %= max(num_links, 1)
+        self._node_links = node_links.astype(np.int32 if num_links < 2 ** 31 else np.int64)
+        del endpoints, node_links
+
+        # Filled in an axis at a time to keep the copies of 2 x num_links positions down
+        boxes = np.empty((num_links, 4), dtype=self._node_model_positions.dtype)
+        for axis in (0, 1):
+            starts = self._node_model_positions[self._link_from_ids, axis]
+            ends = self._node_model_positions[self._link_to_ids, axis]
+            np.minimum(starts, ends, out=boxes[:,axis])
+            np.maximum(starts, ends, out=boxes[:,axis + 2])
+        self._link_box_grid = BoxGrid(boxes, cfg.spatial_cell_size)
+
+        drawable_positions = self._node_model_positions[self._node_has_box]
+        self._graph_bounds = BoundingBox.of_points(drawable_positions, self._node_margin)
+
+    def _node_half_extents(self, zoom_out_level: int) -> _RowsOf:
+        """
+        Node box sizes at a zoom level, only worked out for the nodes whose links are being drawn.
+        """
+        return _RowsOf(lambda indices: box_half_extents(self._node_text_sizes[indices], self._node_has_box[indices],
+                                                        self._node_multiboxes[indices], zoom_out_level))
+
+    def _build_link_layer(self, links: model.LinkStore):
+        box_cols = [self._get_colours(colour_name)[1] for colour_name in links.colour_names]
+        self._link_layer = LinkLayer(self._link_from_ids,
+                                     self._link_to_ids,
+                                     colour_codes=links.colour_codes,
+                                     second_colour_codes=links.second_colour_codes,
+                                     palette=np.array(box_cols, dtype=np.uint8).reshape(-1, 3),
+                                     arrow_draws=links.arrow_draws,
+                                     width=cfg.link_width,
+                                     transform=self._transform,
+                                     node_view_positions=self._node_view_positions,
+                                     node_half_extents=self._node_half_extents,
+                                     node_has_box=self._node_has_box,
+                                     bounds_check=lines_within_bounds)
+
+    def _build_cluster_layer(self, nodes: model.NodeStore, links: model.LinkStore):
+        """
+        Clusters are only worked out for a zoom level once it is drawn, as is whether it wants them.
+        """
+        self._clustered_levels = {}
+        self._link_lengths = None
+        clusters = GridClusters(self._node_model_positions, self._node_has_box, nodes.colour_codes,
+                                links.from_ids, links.to_ids, links.colour_codes,
+                                cfg.cluster_cell_size, len(TEXT_FONT_SIZES), cfg.cluster_link_reach)
+        node_colours = [self._get_colours(colour_name) for colour_name in nodes.colour_names]
+        self._cluster_layer = ClusterLayer(clusters, self._text_cache, self._transform,
+                                           box_rgbs=np.array([box_col for _, box_col in node_colours]).reshape(-1, 3),
+                                           text_rgbs=np.array([text_col for text_col, _ in node_colours]).reshape(-1, 3),
+                                           link_rgbs=np.array([self._get_colours(colour_name)[1] \
+                                                               for colour_name in links.colour_names]).reshape(-1, 3))
+
+    def _clustered(self, zoom_out_level: int) -> bool:
+        """
+        Whether nodes are drawn clustered at a zoom level: from cfg.cluster_zoom_level out, and from
+        the first level without text out wherever the graph is too dense to draw one by one.
+        """
+        if zoom_out_level >= cfg.cluster_zoom_level:
+            return True
+        if zoom_out_level < len(TEXT_FONT_SIZES):
+            return False
+        if zoom_out_level not in self._clustered_levels:
+            self._clustered_levels[zoom_out_level] = self._clustered(zoom_out_level - 1) \
+                                                     or self._too_dense(zoom_out_level)
+        return self._clustered_levels[zoom_out_level]
+
+    def _too_dense(self, zoom_out_level: int) -> bool:
+        """
+        Whether the busiest cfg.cluster_density_window square at a zoom level has more than cfg.cluster_max_density
+        things to draw per pixel: its nodes, the ends of their links, and the links crossing an average square.
+        """
+        if len(self._node_model_positions) == 0:
+            return False
+        window = cfg.cluster_density_window * 2 ** zoom_out_level
+        cells = [np.floor(np.divide(self._node_model_positions[:,axis], window, dtype=float)).astype(np.int64)
+                 for axis in (0, 1)]
+        _, windows = np.unique((cells[0] << 32) | (cells[1] & 0xffffffff), return_inverse=True)
+        counts = np.bincount(windows.reshape(-1), weights=1 + np.diff(self._node_link_starts))
+
+        if self._link_lengths is None:
+            # Manhattan, as a link crosses about that many windows' sides over window
+            self._link_lengths = sum(float(np.abs(self._node_model_positions[self._link_to_ids, axis].astype(float)
+                                                  - self._node_model_positions[self._link_from_ids, axis]).sum())
+                                     for axis in (0, 1))
+        crossings = self._link_lengths / window / len(counts)
+        return float(counts.max()) + crossings > cfg.cluster_max_density * cfg.cluster_density_window ** 2
+
+    def _max_half_extent(self, text_sizes: np.array, has_text: np.array, multiboxes: np.array) -> tp.Tuple[float, float]:
+        """
+        The largest Node.model_half_extent() of any of the boxes at the zoom levels that draw them.
+        """
+        if len(text_sizes) == 0:
+            return (0, 0)
+        largest = [0.0, 0.0]
+        for zoom_out_level in range(self._box_zoom_levels):
+            half_extents = box_half_extents(text_sizes, has_text, multiboxes, zoom_out_level)
+            largest = [max(largest[axis], float(half_extents[:,axis].max()) * 2 ** zoom_out_level) for axis in (0, 1)]
+        return tuple(largest)
 
     def _get_colours(self, colour_str: str) -> tp.Tuple[tp.Tuple[int, int, int], \
                                                             tp.Tuple[int, int, int]]:
@@ -104,15 +390,101 @@ class ModelToViewTranslator:
         colours = cfg.colour_set[colour_str]
         return colours.text_col, colours.box_col
 
-    def _draw_labels_links_then_nodes(self, surface):
-        for label in self._labels:
-            label.draw_on(surface)
-
-        for link in self._links:
-            link.draw_on(surface)
-
-        for node in self._nodes.values():
-            node.draw_on(surface)
+    def _draw_labels_links_then_nodes(self, surface, crossing_links: bool=False):
+        """
+        Draws whatever falls within surface at the current transform. Links are normally only drawn
+        if either end is on the surface; with crossing_links, every link crossing it is, which is what
+        lets tiles drawn separately line up.
+        """
+        viewport = partial(self._transform.model_viewport, surface.get_size())
+        self.stats.count("surfaces")
+        if self._clustered(self.zoom_out_level):
+            with self.stats.phase("clusters"):
+                self.stats.count("clusters_drawn", self._cluster_layer.draw_on(surface, crossing_links))
+            return
+
+        if crossing_links:
+            link_margin = (cfg.link_arrowhead_length * self._transform.divisor,) * 2
+            link_indices = self._links_crossing(*viewport(margin=link_margin))
+        else:
+            link_indices = self._links_of(self._node_grid.query(*viewport()))
+        link_ends = (self._link_from_ids[link_indices], self._link_to_ids[link_indices])
+
+        if self.zoom_out_level >= self._box_zoom_levels:
+            point_margin = (cfg.lod_point_size * self._transform.divisor,) * 2
+            node_indices = self._node_grid.query(*viewport(margin=point_margin))
+            node_indices = node_indices[self._node_has_box[node_indices]]
+            self._update_view_positions(node_indices=np.concatenate(link_ends + (node_indices,)))
+            self._draw_links_then_points(surface, link_indices, node_indices, cull=not crossing_links)
+            return
+
+        label_indices = self._label_grid.query(*viewport(margin=self._label_margin))
+        node_indices = self._node_grid.query(*viewport(margin=self._node_margin))
+        self._update_view_positions(np.concatenate(link_ends + (node_indices,)), label_indices)
+
+        with self.stats.phase("labels"):
+            num_drawn = sum(self._labels[i].draw_on(surface) for i in label_indices)
+        self._count_drawn("labels", num_drawn, len(self._labels))
+
+        with self.stats.phase("links"):
+            num_drawn = self._link_layer.draw_on(surface, link_indices, cull=not crossing_links)
+        self._count_drawn("links", num_drawn, len(self._link_layer))
+
+        with self.stats.phase("nodes"):
+            num_drawn = sum(self._node_list[i].draw_on(surface) for i in node_indices)
+        self._count_drawn("nodes", num_drawn, len(self._node_list))
+
+    def _count_drawn(self, kind: str, num_drawn: int, num_total: int):
+        """
+        Whatever wasn't drawn counts as culled, once for every surface drawn on, tiles included.
+        """
+        self.stats.count(kind + "_drawn", num_drawn)
+        self.stats.count(kind + "_culled", num_total - num_drawn)
+
+    def _links_of(self, node_indices: np.array) -> np.array:
+        """
+        The sorted links with either end in node_indices.
+        """
+        firsts = self._node_link_starts[node_indices]
+        counts = self._node_link_starts[node_indices + 1] - firsts
+        runs = np.repeat(firsts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+        return np.unique(self._node_links[runs]).astype(int)
+
+    def _links_crossing(self, min_x: float, min_y: float, max_x: float, max_y: float) -> np.array:
+        """
+        Links whose bounding box overlaps the given one.
+        """
+        return self._link_box_grid.query(min_x, min_y, max_x, max_y)
+
+    def draw_tiles(self, tiles: tp.List[tp.Tuple[pygame.Surface, int, tp.Tuple[int, int]]]):
+        """
+        Draws each (surface, zoom_out_level, origin) as the part of the graph whose view coordinates
+        at that zoom level, scrolled to offset (0, 0), start at origin. The transform is put back afterwards.
+        """
+        offset = self._transform.offset
+        zoom_out_level = self._transform.zoom_out_level
+        for surface, tile_zoom_out_level, origin in tiles:
+            self._transform.zoom_out_level = tile_zoom_out_level
+            # A whole number of view pixels, so the tile lines up exactly with its neighbours
+            self._transform.offset = (-origin[0] * self._transform.divisor, -origin[1] * self._transform.divisor)
+            self._draw_labels_links_then_nodes(surface, crossing_links=True)
+
+        self._transform.offset = offset
+        self._transform.zoom_out_level = zoom_out_level
+
+    def _draw_links_then_points(self, surface, link_indices: np.array, node_indices: np.array, cull: bool):
+        """
+        Far out: no labels, links as one pixel lines and nodes with boxes as points, each drawn in one batch.
+        """
+        with self.stats.phase("links"):
+            num_drawn = self._link_layer.draw_thin_on(surface, link_indices, cull)
+        self._count_drawn("links", num_drawn, len(self._link_layer))
+
+        with self.stats.phase("nodes"):
+            raster.draw_points(surface, self._node_view_positions[node_indices], \
+                               self._node_box_rgbs[self._node_colour_codes[node_indices]], \
+                               cfg.lod_point_size)
+        self._count_drawn("nodes", len(node_indices), len(self._node_list))
 
     def scroll_down(self) -> bool:
         return self._accept_scroll_after_check( \
@@ -130,71 +502,78 @@ class ModelToViewTranslator:
         return self._accept_scroll_after_check( \
             (self.total_offset[0] - self.offset_step[0], self.total_offset[1]))
 
+    def scroll_by(self, view_delta: tp.Tuple[int, int]) -> bool:
+        """
+        Moves the scene by view_delta screen pixels, e.g. to follow the mouse while it is dragged.
+        """
+        divisor = self._transform.divisor
+        return self._accept_scroll_after_check((self.total_offset[0] + view_delta[0] * divisor,
+                                                self.total_offset[1] + view_delta[1] * divisor))
+
     def _accept_scroll_after_check(self, new_offset: tp.Tuple[int, int]) -> bool:
         if self._something_to_draw_after_offset(new_offset):
-            self.total_offset = new_offset
-            for node in self._nodes.values():
-                node.accept_new_offset()
-            for label in self._labels:
-                label.consider_new_offset(new_offset)
-                label.accept_new_offset()
+            self._transform.offset = new_offset
             return True
         else:
             print("Scroll rejected: there would be no node to draw")
             return False
 
     def _something_to_draw_after_offset(self, new_offset: tp.Tuple[int, int]) -> bool:
-        answer = False
-        for node in self._nodes.values():
-            if node.consider_new_offset(new_offset):
-                answer = True
-        return answer
+        if self._graph_bounds is None:
+            return False
+        return self._graph_bounds.intersects(*self._transform.model_viewport(self._screen_size, new_offset))
 
     def zoom_in(self) -> bool:
         if self.zoom_out_level <= 0:
             return False
 
-        self.zoom_out_level -= 1
-        for node in self._nodes.values():
-            node.zoom_in()
-        for link in self._links:
-            link.zoom_in()
-        for label in self._labels:
-            label.zoom_in()
+        self._transform.zoom_out_level -= 1
         return True
 
     def zoom_out(self) -> bool:
         if self.zoom_out_level >= self.max_zoom_level:
             return False
 
-        self.zoom_out_level += 1
-        for node in self._nodes.values():
-            node.zoom_out()
-        for link in self._links:
-            link.zoom_out()
-        for label in self._labels:
-            label.zoom_out()
+        self._transform.zoom_out_level += 1
         return True
 
     def _view_to_model_coords(self, view_coord: tp.Tuple[int, int]) -> tp.Tuple[int, int]:
-        x = view_coord[0] * 2 ** self.zoom_out_level - self.total_offset[0]
-        y = view_coord[1] * 2 ** self.zoom_out_level - self.total_offset[1]
-        return (x,y)
+        return self._transform.to_model(view_coord)
 
-    def draw_coordinates(self, click_pos: tp.Tuple[int, int], surface):
+    def draw_coordinates(self, click_pos: tp.Tuple[int, int], surface) -> tp.List[pygame.Rect]:
+        """
+        Returns the regions drawn over.
+        """
         view_coord_surf = self._big_font.render("view: {}".format(click_pos), \
                                                 True, (0,0,0), (255,255,255))
-        surface.blit(view_coord_surf, click_pos)
+        view_coord_rect = surface.blit(view_coord_surf, click_pos)
 
         model_pos = self._view_to_model_coords(click_pos)
         model_coord_surf = self._big_font.render("model: {}".format(model_pos), \
                                                  True, (0,0,0), (255, 255,255))
         draw_model_coord_at = (click_pos[0], click_pos[1] + view_coord_surf.get_rect().height)
-        surface.blit(model_coord_surf, draw_model_coord_at)
+        model_coord_rect = surface.blit(model_coord_surf, draw_model_coord_at)
+        return [view_coord_rect, model_coord_rect]
 
-    def add_timestamp(self, surface, now_str: str):
+    def add_timestamp(self, surface, now_str: str) -> tp.List[pygame.Rect]:
+        """
+        Returns the regions drawn over.
+        """
         now_surf = self._big_font.render(now_str, True, (0,0,0), (255,255,255))
         x = surface.get_width() - now_surf.get_rect().width
         y = surface.get_height() - now_surf.get_rect().height
 
-        surface.blit(now_surf, (x, y))
\ No newline at end of file
+        return [surface.blit(now_surf, (x, y))]
+
+    def add_text_lines(self, surface, lines: tp.List[str], pos: tp.Tuple[int, int]=(0, 0)) -> tp.List[pygame.Rect]:
+        """
+        lines one under the other from pos, e.g. stats. Returns the regions drawn over.
+        """
+        font = self._text_cache.font(cfg.small_font_size)
+        rects = []
+        y = pos[1]
+        for line in lines:
+            line_surf = font.render(line, True, (0,0,0), (255,255,255))
+            rects.append(surface.blit(line_surf, (pos[0], y)))
+            y += line_surf.get_height()
+        return rects
\ No newline at end of file
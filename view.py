@@ -0,0 +1,50 @@
+"""
+The one scroll/zoom transform shared by everything drawn on the canvas
+"""
+
+import typing as tp
+import numpy as np
+
+class ViewTransform:
+    """
+    view = (model + offset) // 2 ** zoom_out_level
+
+    Render objects don't keep any scroll/zoom state of their own; they read their view position
+    out of the arrays that the owner of this transform keeps up to date via to_view().
+    """
+    def __init__(self, offset: tp.Tuple[int, int]=(0,0), zoom_out_level: int=0):
+        self.offset = offset
+        self.zoom_out_level = zoom_out_level
+
+    @property
+    def divisor(self) -> int:
+        return 2 ** self.zoom_out_level
+
+    def scaled(self, length: int) -> int:
+        """
+        A length given in pixels at full zoom, in pixels at the current zoom level.
+        """
+        return length // self.divisor
+
+    def to_view(self, model_positions: np.array, out: tp.Optional[np.array]=None) -> np.array:
+        """
+        Transforms an (N,2) array of model positions in one go, in place if out is given.
+        """
+        return np.floor_divide(model_positions + self.offset, self.divisor, out=out)
+
+    def to_model(self, view_coord: tp.Tuple[int, int]) -> tp.Tuple[int, int]:
+        return (view_coord[0] * self.divisor - self.offset[0],
+                view_coord[1] * self.divisor - self.offset[1])
+
+    def model_viewport(self, screen_size: tp.Tuple[int, int], offset: tp.Optional[tp.Tuple[int, int]]=None, \
+                       margin: tp.Tuple[float, float]=(0, 0)) -> tp.Tuple[float, float, float, float]:
+        """
+        The model coordinates visible on screen as (min_x, min_y, max_x, max_y), widened by margin
+        on every side. offset defaults to the current one.
+        """
+        if offset is None:
+            offset = self.offset
+        return (-offset[0] - margin[0],
+                -offset[1] - margin[1],
+                (screen_size[0] + 1) * self.divisor - offset[0] + margin[0],
+                (screen_size[1] + 1) * self.divisor - offset[1] + margin[1])